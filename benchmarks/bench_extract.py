@@ -0,0 +1,383 @@
+"""Offline benchmark of RetrieveDT and ExtractDT on synthetic DT GRIB files.
+
+Synthetic global GRIB1 files are generated with eccodes, at the grids of
+the [extract_dt] section of a config file and with the parameters of the
+param_list_IFSGDT_*.json files, together with a synthetic station list.
+Then every stage runs in its own process, so its peak RSS can be measured:
+
+- retrieve: MarsScheduler with a stub mars binary that copies the synthetic files
+- accumulate: RetrieveDT.add_cumulative_litota1
+- extract: the ExtractDT extraction loop (ExtractDT.extract_files and the FCTABLE flush)
+
+The tasks are built without a deode config, only with the attributes these
+methods use. Needs deode, eccodes and grib2sqlite, but no MARS.
+
+Usage:
+    python benchmarks/bench_extract.py --steps 6 --grid-sfc 0.25/0.25 --stations 2000
+"""
+
+import argparse
+import importlib
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    import tomli as tomllib
+
+PLUGIN = Path(__file__).resolve().parents[1]
+
+# Height in m of the screen level and 10 m fields, the other surface fields are at the surface
+HEIGHTS = {"2t": 2, "2d": 2, "10u": 10, "10v": 10}
+
+STUB_MARS = '''#!{python}
+"""Stub mars: copy the synthetic files named by STEP and TARGET of a request."""
+import re, shutil, sys
+req = open(sys.argv[1]).read()
+steps = re.search(r"STEP = ([^,\\n]+)", req).group(1).strip().split("/")
+target = re.search(r"TARGET = \\"?([^,\\n\\"]+)", req).group(1).strip()
+for step in steps:
+    name = target.replace("[STEP]", step)
+    shutil.copy("{fixtures}/" + name, name)
+'''
+
+
+def plugin(module):
+    """Import a module of the plugin, from the repository this script is in."""
+    if str(PLUGIN.parent) not in sys.path:
+        sys.path.insert(0, str(PLUGIN.parent))
+    return importlib.import_module(f"{PLUGIN.name}.{module}")
+
+
+def stub_task(cls, **attrs):
+    """A task object with only the given attributes, without running Task.__init__."""
+    task = cls.__new__(cls)
+    task.__dict__.update(attrs)
+    return task
+
+
+def shortnames(param_file):
+    """shortName (and levels) of every grib_id in a parameter list."""
+    with open(param_file) as fin:
+        param_list = json.load(fin)
+    fields = {}
+    for param in param_list:
+        ids = param["grib_id"] if isinstance(param["grib_id"], list) else [param["grib_id"]]
+        for grib_id in ids:
+            grib_id = {**param.get("common", {}), **grib_id}
+            levels = grib_id.get("level", [])
+            fields.setdefault(grib_id["shortName"], set()).update(
+                levels if isinstance(levels, list) else [levels]
+            )
+    return param_list, {name: sorted(levels) for name, levels in fields.items()}
+
+
+def encodable(name):
+    """Check that GRIB1 has a shortName."""
+    from eccodes import CodesInternalError, codes_grib_new_from_samples, codes_release, codes_set
+
+    gid = codes_grib_new_from_samples("GRIB1")
+    try:
+        codes_set(gid, "shortName", name)
+        return True
+    except CodesInternalError:
+        return False
+    finally:
+        codes_release(gid)
+
+
+def write_grib(path, step, fields, grid, rng):
+    """Write one synthetic global GRIB1 file."""
+    from eccodes import (
+        codes_grib_new_from_samples,
+        codes_release,
+        codes_set,
+        codes_set_values,
+        codes_write,
+    )
+
+    dlon, dlat = (float(x) for x in grid.split("/"))
+    ni = int(round(360.0 / dlon))
+    nj = int(round(180.0 / dlat)) + 1
+    with open(path, "wb") as fout:
+        for name, levels in fields.items():
+            for level in levels or [None]:
+                gid = codes_grib_new_from_samples("GRIB1")
+                # The level first, the sample is on 500 hPa
+                if level is not None:
+                    codes_set(gid, "typeOfLevel", "isobaricInhPa")
+                    codes_set(gid, "level", level)
+                elif name in HEIGHTS:
+                    codes_set(gid, "typeOfLevel", "heightAboveGround")
+                    codes_set(gid, "level", HEIGHTS[name])
+                else:
+                    codes_set(gid, "typeOfLevel", "surface")
+                    codes_set(gid, "level", 0)
+                codes_set(gid, "shortName", name)
+                codes_set(gid, "Ni", ni)
+                codes_set(gid, "Nj", nj)
+                codes_set(gid, "latitudeOfFirstGridPointInDegrees", 90.0)
+                codes_set(gid, "latitudeOfLastGridPointInDegrees", -90.0)
+                codes_set(gid, "longitudeOfFirstGridPointInDegrees", 0.0)
+                codes_set(gid, "longitudeOfLastGridPointInDegrees", 360.0 - dlon)
+                codes_set(gid, "iDirectionIncrementInDegrees", dlon)
+                codes_set(gid, "jDirectionIncrementInDegrees", dlat)
+                codes_set(gid, "dataDate", 20260115)
+                codes_set(gid, "stepRange", step)
+                codes_set(gid, "bitsPerValue", 16)
+                codes_set_values(gid, rng.random(ni * nj) * 10.0 + 270.0)
+                codes_write(gid, fout)
+                codes_release(gid)
+
+
+def write_stations(path, nstations, rng):
+    """Write a synthetic station list."""
+    lats = rng.uniform(-60.0, 75.0, nstations)
+    lons = rng.uniform(-180.0, 180.0, nstations)
+    with open(path, "w") as fout:
+        fout.write("SID,lat,lon,elev,name\n")
+        for sid, (lat, lon) in enumerate(zip(lats, lons), start=1):
+            fout.write(f"{sid},{lat:.4f},{lon:.4f},{rng.uniform(0, 2000):.1f},ST{sid}\n")
+
+
+def generate(args, workdir):
+    """Generate the synthetic fixtures.
+
+    Returns:
+        dict: settings passed to the stages
+    """
+    with open(args.config, "rb") as fin:
+        extract_dt = tomllib.load(fin)["extract_dt"]
+    rng = np.random.default_rng(args.seed)
+    fixtures = os.path.join(workdir, "fixtures")
+    os.makedirs(fixtures, exist_ok=True)
+    settings = {
+        "workdir": workdir,
+        "fixtures": fixtures,
+        "steps": [str(step) for step in range(args.steps + 1)],
+        "tags": {},
+    }
+    for tag in args.tags:
+        grid = getattr(args, f"grid_{tag}") or extract_dt[f"grid_{tag}"]
+        param_file = PLUGIN / f"param_list_IFSGDT_{tag}.json"
+        param_list, fields = shortnames(param_file)
+        if tag == "sfc":
+            fields["litota1"] = []
+        stations = os.path.join(workdir, f"stations_{tag}.csv")
+        write_stations(stations, args.stations, rng)
+        skipped = [name for name in fields if not encodable(name)]
+        if skipped:
+            print(f"{tag}: not encodable in GRIB1, skipped: {', '.join(skipped)}")
+        fields = {name: levels for name, levels in fields.items() if name not in skipped}
+        for step in settings["steps"]:
+            write_grib(os.path.join(fixtures, f"{tag}_{step}.grib1"), int(step), fields, grid, rng)
+        settings["tags"][tag] = {
+            "grid": grid,
+            "param_list": param_list,
+            "params": list(fields),
+            "stations": stations,
+        }
+    return settings
+
+
+def stage_retrieve(settings, args):
+    """Retrieve all steps with MarsScheduler and the stub mars binary."""
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    RetrieveDT = plugin("tasks.retrievedt").RetrieveDT
+    mars = os.path.join(settings["workdir"], "mars")
+    with open(mars, "w") as fout:
+        fout.write(STUB_MARS.format(python=sys.executable, fixtures=settings["fixtures"]))
+    os.chmod(mars, 0o755)
+    wrk = os.path.join(settings["workdir"], "retrieve")
+    os.makedirs(wrk, exist_ok=True)
+    os.chdir(wrk)
+    nbytes = 0
+    for tag, tag_settings in settings["tags"].items():
+        request = {
+            "step": "/".join(settings["steps"]),
+            "param": "/".join(tag_settings["params"]),
+            "target": f'"{tag}_[STEP].grib1"',
+        }
+        scheduler = MarsScheduler(
+            [mars],
+            lambda req, filename: RetrieveDT.write_mars_req(req, filename, "retrieve"),
+            nworkers=args.workers,
+            poll=0.05,
+        )
+        chunks = scheduler.split(request, tag, settings["steps"], step_chunk=1)
+        if scheduler.run(chunks, tag):
+            raise RuntimeError("Stub MARS failed")
+        nbytes += sum(os.path.getsize(f"{tag}_{step}.grib1") for step in settings["steps"])
+    return {"bytes": nbytes}
+
+
+def stage_accumulate(settings, args):
+    """Run RetrieveDT.add_cumulative_litota1 on a copy of the sfc files."""
+    RetrieveDT = plugin("tasks.retrievedt").RetrieveDT
+    path = os.path.join(settings["workdir"], "accumulate")
+    os.makedirs(path, exist_ok=True)
+    files = [f"sfc_{step}.grib1" for step in settings["steps"]]
+    for fname in files:
+        shutil.copy(os.path.join(settings["fixtures"], fname), path)
+    task = stub_task(
+        RetrieveDT,
+        accum_dtype=np.dtype(args.accumulation_dtype).type,
+        accumulations=plugin("tasks.accumulation").DEFAULT_ACCUMULATIONS,
+    )
+    start = time.time()
+    task.add_cumulative_litota1(path, files)
+    wall = time.time() - start
+    return {
+        "bytes": sum(os.path.getsize(os.path.join(path, fname)) for fname in files),
+        "wall_inner": wall,
+    }
+
+
+def stage_extract(settings, args):
+    """Run the ExtractDT extraction loop on the synthetic files."""
+    import pandas
+
+    ExtractDT = plugin("tasks.extractdt").ExtractDT
+    derived = plugin("tasks.derived")
+    FctableBatch = plugin("tasks.fctable").FctableBatch
+    Metrics = plugin("tasks.metrics").Metrics
+    WeightsCache = plugin("tasks.weights_cache").WeightsCache
+    file_checksum = plugin("tasks.weights_cache").file_checksum
+
+    sqlite_path = os.path.join(settings["workdir"], "sqlite")
+    metrics_file = os.path.join(settings["workdir"], "metrics.jsonl")
+    task = stub_task(
+        ExtractDT,
+        staging_path=None,
+        nworkers=args.workers,
+        memory_budget=None,
+        engine=args.engine,
+        basetime=datetime(2026, 1, 15, tzinfo=timezone.utc),
+        select_messages=True,
+        weights_cache=WeightsCache(),
+        sqlite_template="FCTABLE_{PP}_{YYYY}{MM}_{HH}.sqlite",
+        model_name="BENCH",
+        loglevel="WARNING",
+        metrics=Metrics(metrics_file, "bench"),
+    )
+    batch = FctableBatch()
+    nbytes = 0
+    # FCTABLE files of every tag
+    relpaths = {}
+    for tag, tag_settings in settings["tags"].items():
+        known = {relpath for relpath, _table in batch.tables}
+        infiles = [os.path.join(settings["fixtures"], f"{tag}_{step}.grib1") for step in settings["steps"]]
+        nbytes += sum(os.path.getsize(infile) for infile in infiles)
+        stations = pandas.read_csv(tag_settings["stations"], skipinitialspace=True)
+        base_list, derived_params = derived.plan(tag_settings["param_list"])
+        task.extract_files(
+            infiles, base_list, stations, file_checksum(tag_settings["stations"]), batch
+        )
+        derived.derive(batch, derived_params, task.sqlite_template, task.basetime, task.model_name)
+        relpaths[tag] = {relpath for relpath, _table in batch.tables} - known
+    rows = batch.flush(sqlite_path)
+    # The surface fields are not on pressure levels
+    for relpath in sorted(relpaths.get("sfc", ())):
+        con = sqlite3.connect(os.path.join(sqlite_path, relpath))
+        try:
+            columns = [row[1] for row in con.execute('PRAGMA table_info("FC")')]
+        finally:
+            con.close()
+        if "p" in columns:
+            raise RuntimeError(f"Surface FCTABLE {relpath} has a p column")
+    per_step = {}
+    with open(metrics_file) as fin:
+        for line in fin:
+            record = json.loads(line)
+            if record["stage"] == "extract":
+                per_step[f"{record['tag']}_{record['step']}"] = record["wall"]
+    return {"bytes": nbytes, "rows": rows, "per_step": per_step}
+
+
+STAGES = {
+    "retrieve": stage_retrieve,
+    "accumulate": stage_accumulate,
+    "extract": stage_extract,
+}
+
+
+def run_stage(name, settings, args, queue):
+    """Run one stage in a child process and report its timing and peak RSS."""
+    try:
+        start = time.time()
+        result = STAGES[name](settings, args)
+        result["wall"] = time.time() - start
+        # ru_maxrss is in kB on Linux
+        result["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        result["peak_rss_children_mb"] = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+        queue.put(result)
+    except Exception as err:  # noqa: BLE001  reported by the parent
+        queue.put({"error": repr(err)})
+
+
+def main():
+    """Generate the fixtures, run the stages and report."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--config", default=str(PLUGIN / "extract_dt_plugin.toml"))
+    parser.add_argument("--tags", nargs="+", default=["sfc", "ua"])
+    parser.add_argument("--steps", type=int, default=6, help="last forecast step")
+    parser.add_argument("--grid-sfc", help="override grid_sfc of the config, e.g. 0.25/0.25")
+    parser.add_argument("--grid-ua", help="override grid_ua of the config")
+    parser.add_argument("--stations", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=1, help="MARS clients and extraction workers")
+    parser.add_argument("--accumulation-dtype", default="float64")
+    parser.add_argument("--engine", default="grib2sqlite", choices=["grib2sqlite", "gather"])
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--workdir", help="keep the files in this directory")
+    parser.add_argument("--output", help="write the results as JSON")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="bench_extract_")
+    os.makedirs(workdir, exist_ok=True)
+    try:
+        start = time.time()
+        settings = generate(args, workdir)
+        results = {"generate": {"wall": time.time() - start}}
+        nsteps = len(settings["steps"]) * len(settings["tags"])
+        context = multiprocessing.get_context("spawn")
+        for name in args.stages:
+            if name == "accumulate" and "sfc" not in settings["tags"]:
+                continue
+            queue = context.Queue()
+            proc = context.Process(target=run_stage, args=(name, settings, args, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+            if "error" in result:
+                raise RuntimeError(f"Stage {name} failed: {result['error']}")
+            files = len(settings["steps"]) if name == "accumulate" else nsteps
+            result["steps_per_s"] = files / result["wall"]
+            result["mb_per_s"] = result["bytes"] / 1e6 / result["wall"]
+            results[name] = result
+            print(
+                f"{name:>10}: {result['wall']:8.2f} s  {result['steps_per_s']:7.2f} steps/s  "
+                f"{result['mb_per_s']:8.1f} MB/s  peak RSS {result['peak_rss_mb']:8.1f} MB"
+            )
+        if args.output:
+            with open(args.output, "w") as fout:
+                json.dump({"args": vars(args), "results": results}, fout, indent=1)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
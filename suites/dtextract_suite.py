@@ -1,8 +1,9 @@
 """DT extraction suites."""
 
+from datetime import timedelta
 from pathlib import Path
 
-from ecflow import RepeatDate, Trigger
+from ecflow import InLimit, RepeatDate, Trigger
 
 from deode.datetime_utils import as_datetime, as_timedelta
 from deode.logs import logger
@@ -15,6 +16,9 @@ from deode.suites.base import (
     SuiteDefinition,
 )
 
+from ..tasks.pipeline import READY_EVENT
+from ..tasks.profiles import load_profiles
+
 
 class DtExtractSuiteDefinition(SuiteDefinition):
     """Definition of DT extraction suite."""
@@ -40,10 +44,17 @@ class DtExtractSuiteDefinition(SuiteDefinition):
         deodemakedirs(self.joboutdir, unixgroup=unix_group)
         # Set the input template path
         input_template = self.platform.substitute("@DEODE_HOME@/templates/ecflow/default.py")
+        # Fail early if an extraction profile cannot share RetrieveDT
+        load_profiles(config, self.platform)
 
         start_date = int(as_datetime(config["general.times.start"]).strftime("%Y%m%d"))
         end_date = int(as_datetime(config["general.times.end"]).strftime("%Y%m%d"))
 
+        if config.get("extract_dt.backfill", False):
+            # Catching up on past dates: no daily loop and no time trigger
+            self.add_backfill(config, input_template)
+            return
+
         loop_date = "YMD" #start_date
         # We want retrieval to begin with a delay, to make sure MARS data is available.
         # Use _JULIAN for looking at differences > 1 day.
@@ -84,17 +95,135 @@ class DtExtractSuiteDefinition(SuiteDefinition):
         # So a "time-based" trigger must be added differently.
         dt_data.ecf_node.add_trigger(time_trigger)
 
-        dt_extract = EcflowSuiteTask(
-            name = "ExtractDT",
-            parent = day_family,
-            config = config,
-            ecf_files = self.ecf_files,
-            input_template = input_template,
-            task_settings = self.task_settings,
-            trigger = dt_data,
+        if config.get("extract_dt.pipeline", False):
+            # Pipelined mode: ExtractDT runs next to RetrieveDT
+            # and extracts every step as soon as it has landed.
+            dt_extract = EcflowSuiteTask(
+                name = "ExtractDT",
+                parent = day_family,
+                config = config,
+                ecf_files = self.ecf_files,
+                input_template = input_template,
+                task_settings = self.task_settings,
+            )
+            # RetrieveDT sets the event once the ready files of the run are reset,
+            # and ecFlow clears it when RetrieveDT is requeued
+            dt_data.ecf_node.add_event(READY_EVENT)
+            dt_extract.ecf_node.add_trigger(f"RetrieveDT:{READY_EVENT} or RetrieveDT == complete")
+        else:
+            dt_extract = EcflowSuiteTask(
+                name = "ExtractDT",
+                parent = day_family,
+                config = config,
+                ecf_files = self.ecf_files,
+                input_template = input_template,
+                task_settings = self.task_settings,
+                trigger = dt_data,
+            )
+
+        self.add_metrics(config, (dt_data, dt_extract), retrievals=(dt_data,))
+
+        if self.has_cleanup(config):
+            EcflowSuiteTask(
+                name = "CleanupDT",
+                parent = day_family,
+                config = config,
+                ecf_files = self.ecf_files,
+                input_template = input_template,
+                task_settings = self.task_settings,
+                trigger = dt_extract,
+            )
+
+    def add_backfill(self, config, input_template):
+        """Add one family per group of dates, with a single retrieval for the whole group.
+
+        RetrieveDT of a group fetches all its dates with one MARS request
+        per step chunk. Every date then has its own ExtractDT. At most
+        extract_dt.backfill_families groups run at the same time.
+
+        Args:
+            config (deode.ParsedConfig): Configuration file
+            input_template (str): ecFlow task template
+        """
+        first = as_datetime(config["general.times.start"])
+        last = as_datetime(config["general.times.end"])
+        group_days = max(1, int(config.get("extract_dt.backfill_group_days", 7)))
+        nfamilies = int(config.get("extract_dt.backfill_families", 2))
+        days = [first + timedelta(days=i) for i in range((last - first).days + 1)]
+        logger.info("Backfill of {} dates in groups of {}", len(days), group_days)
+
+        self.suite.ecf_node.add_limit("backfill", nfamilies)
+        tasks = []
+        retrievals = []
+        for igroup in range(0, len(days), group_days):
+            group = days[igroup:igroup + group_days]
+            group_family = EcflowSuiteFamily(
+                f"DT_backfill_{group[0]:%Y%m%d}", self.suite, self.ecf_files,
+            )
+            group_family.ecf_node += {"BASETIME": f"{group[0]:%Y-%m-%d}T00:00:00Z"}
+            group_family.ecf_node.add_inlimit(
+                InLimit("backfill", self.suite.ecf_node.get_abs_node_path(), 1, True)
+            )
+            dt_data = EcflowSuiteTask(
+                name = "RetrieveDT",
+                parent = group_family,
+                config = config,
+                ecf_files = self.ecf_files,
+                input_template = input_template,
+                task_settings = self.task_settings,
+            )
+            tasks.append(dt_data)
+            retrievals.append(dt_data)
+            for day in group:
+                day_family = EcflowSuiteFamily(f"day_{day:%Y%m%d}", group_family, self.ecf_files)
+                day_family.ecf_node += {"BASETIME": f"{day:%Y-%m-%d}T00:00:00Z"}
+                dt_extract = EcflowSuiteTask(
+                    name = "ExtractDT",
+                    parent = day_family,
+                    config = config,
+                    ecf_files = self.ecf_files,
+                    input_template = input_template,
+                    task_settings = self.task_settings,
+                )
+                dt_extract.ecf_node.add_trigger("../RetrieveDT == complete")
+                tasks.append(dt_extract)
+            if self.has_cleanup(config):
+                cleanup = EcflowSuiteTask(
+                    name = "CleanupDT",
+                    parent = group_family,
+                    config = config,
+                    ecf_files = self.ecf_files,
+                    input_template = input_template,
+                    task_settings = self.task_settings,
+                )
+                cleanup.ecf_node.add_trigger(
+                    " and ".join(f"day_{day:%Y%m%d}/ExtractDT == complete" for day in group)
+                )
+        self.add_metrics(config, tasks, retrievals)
+
+    @staticmethod
+    def has_cleanup(config):
+        """Whether the GRIB files have a quota or maximum age, enforced by CleanupDT."""
+        return bool(
+            config.get("extract_dt.cache_quota", None) or config.get("extract_dt.cache_max_age", None)
         )
 
-        # TODO: cleanup task for removing older DT grib files?
+    @staticmethod
+    def add_metrics(config, tasks, retrievals=()):
+        """Add the metrics label and steps meter, exported by the tasks with ecflow_client.
+
+        The retrieval tasks also get a label and a meter (percent of the
+        MARS chunks done) with the state of the running request.
+        """
+        if not config.get("extractsqlite.metrics_ecflow", False):
+            return
+        nsteps = int(as_timedelta(config["general.times.forecast_range"]).total_seconds()//3600) + 1
+        for task in tasks:
+            task.ecf_node.add_label("metrics", "")
+            task.ecf_node.add_meter("steps", 0, nsteps)
+        for task in retrievals:
+            task.ecf_node.add_label("retrieval", "")
+            task.ecf_node.add_meter("retrieval", 0, 100)
 
 
 class DailyLoopFamily(EcflowSuiteFamily):
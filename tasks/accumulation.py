@@ -0,0 +1,243 @@
+"""Accumulation and de-accumulation of precipitation and flux fields over time windows.
+
+The fields are declared in extract_dt.accumulations. Each entry has:
+
+- shortName (grib output) or harp_param (points output): the input field
+- mode: "rate" for amounts per step that are summed (e.g. litota1), or
+  "accumulated" for fields that are already accumulated since the start (e.g. tp)
+- total: for "rate", shortName of the running sum since the start (e.g. litoti)
+- windows: window lengths in hours, e.g. [1, 3, 6, 12, 24]
+- output: "grib" to append the windows as GRIB messages in RetrieveDT, or
+  "points" to compute them in ExtractDT from the extracted point values
+- name: for "points", harp parameter of each window, e.g. "AccPcp{window}h"
+
+All windows are computed in one pass over the steps. Only the running sums of
+the last max(windows) steps are kept.
+"""
+
+import os
+
+import numpy as np
+
+from deode.logs import logger
+from .gributils import decode_values, read_message, scan_messages
+from .points import fctable_name
+
+# Without extract_dt.accumulations: the cumulative lightning density
+DEFAULT_ACCUMULATIONS = [
+    {"shortName": "litota1", "mode": "rate", "total": "litoti", "windows": [], "output": "grib"},
+]
+
+
+def accumulation_settings(config):
+    """The accumulations of extract_dt.accumulations, with defaults.
+
+    Args:
+        config (deode.ParsedConfig): Configuration
+
+    Returns:
+        list: one dict per accumulation
+
+    Raises:
+        RuntimeError: If an entry has an unknown mode or output.
+    """
+    entries = config.get("extract_dt.accumulations", None)
+    if entries is None:
+        entries = DEFAULT_ACCUMULATIONS
+    settings = []
+    for entry in entries:
+        entry = dict(entry)
+        entry.setdefault("mode", "rate")
+        entry.setdefault("output", "grib")
+        entry["windows"] = sorted(int(window) for window in entry.get("windows", []))
+        if entry["mode"] not in ("rate", "accumulated"):
+            raise RuntimeError(f"Unknown accumulation mode: {entry['mode']}")
+        if entry["output"] not in ("grib", "points"):
+            raise RuntimeError(f"Unknown accumulation output: {entry['output']}")
+        if entry["output"] == "points":
+            entry.setdefault("name", f"{entry['harp_param']}{{window}}h")
+        settings.append(entry)
+    return settings
+
+
+class Accumulator:
+    """Running sums and window totals of GRIB fields, updated one step at a time."""
+
+    def __init__(self, settings, dtype=np.float64):
+        """Construct the accumulator for the "grib" entries of the settings.
+
+        Args:
+            settings (list): from accumulation_settings
+            dtype: numpy.float32 or numpy.float64, precision of the running sums
+        """
+        self.entries = [entry for entry in settings if entry["output"] == "grib"]
+        self.dtype = dtype
+        # entry -> running sums since the start, one per area
+        self.totals = {}
+        # entry -> {step: running sums}, for the windows
+        self.history = {}
+
+    def update(self, fpath, step):
+        """Add the fields of one step, and append the running sums and windows to the file.
+
+        Steps must be given in order. Messages that are already in the file
+        (after a retry) are not written again, but the sums are still updated.
+
+        Args:
+            fpath (str): GRIB file of the step
+            step (int): forecast step of the file
+        """
+        from eccodes import codes_clone, codes_get, codes_release, codes_set, codes_set_values, codes_write
+
+        if not self.entries:
+            return
+        fname = os.path.basename(fpath)
+        messages = scan_messages(fpath)
+        new_gids = []
+        for ientry, entry in enumerate(self.entries):
+            name = entry["shortName"]
+            output = entry.get("total", name) if entry["mode"] == "rate" else name
+            # The input is the first message of each area, the computed
+            # fields are appended after it
+            inputs = {}
+            present = set()
+            for msg in messages:
+                if msg["shortName"] not in (name, output):
+                    continue
+                area = tuple(msg["grid"])
+                if msg["shortName"] == name:
+                    inputs.setdefault(area, msg["offset"])
+                if msg["shortName"] == output:
+                    gid = read_message(fpath, msg["offset"], headers_only=True)
+                    present.add((area, codes_get(gid, "stepRange")))
+                    codes_release(gid)
+            if not inputs:
+                logger.info("No {} in {}", name, fname)
+                continue
+            offsets = list(inputs.values())
+            areas = list(inputs)
+            totals = self.totals.get(ientry)
+            if totals is None or len(totals) != len(offsets):
+                if totals is not None:
+                    logger.warning("Number of {} fields changed in {}, restarting sum", name, fname)
+                totals = [None] * len(offsets)
+            history = self.history.setdefault(ientry, {})
+
+            for itile, offset in enumerate(offsets):
+                gid = read_message(fpath, offset)
+                values = decode_values(gid, self.dtype)
+                if entry["mode"] == "accumulated":
+                    totals[itile] = values.astype(self.dtype, copy=False)
+                elif totals[itile] is None:
+                    # Preallocated running sum, updated in place
+                    totals[itile] = values.astype(self.dtype, copy=True)
+                    logger.info("Initialized {} sum from {}", name, fname)
+                else:
+                    np.add(totals[itile], values, out=totals[itile])
+                del values
+
+                outputs = []
+                if entry["mode"] == "rate" and "total" in entry:
+                    outputs.append((None, totals[itile]))
+                for window in entry["windows"]:
+                    start = step - window
+                    if start < 0:
+                        continue
+                    if start in history:
+                        previous = history[start][itile]
+                    elif start == 0:
+                        previous = 0.0
+                    else:
+                        logger.warning("No {} at step {} for the {}h window", name, start, window)
+                        continue
+                    outputs.append((start, totals[itile] - previous))
+
+                for start, field in outputs:
+                    new_gid = codes_clone(gid)
+                    codes_set(new_gid, "shortName", output)
+                    # The stepType first, so the stepRange keeps its start
+                    codes_set(new_gid, "stepType", "accum")
+                    # The running sum is accumulated since the start
+                    codes_set(new_gid, "stepRange", f"{start or 0}-{step}")
+                    if (areas[itile], codes_get(new_gid, "stepRange")) in present:
+                        codes_release(new_gid)
+                        continue
+                    codes_set_values(new_gid, field)
+                    new_gids.append(new_gid)
+                codes_release(gid)
+
+            self.totals[ientry] = totals
+            if entry["windows"]:
+                # The "accumulated" sums are replaced, not updated in place
+                history[step] = [total.copy() if entry["mode"] == "rate" else total for total in totals]
+                for old in [old for old in history if old < step - entry["windows"][-1]]:
+                    del history[old]
+
+        if new_gids:
+            logger.info("Appending {} accumulated fields to {}", len(new_gids), fname)
+            with open(fpath, "ab") as fout:
+                for new_gid in new_gids:
+                    codes_write(new_gid, fout)
+                    codes_release(new_gid)
+
+
+def accumulate_points(batch, settings, sqlite_template, basetime, model_name):
+    """Add the window totals of the "points" accumulations to a batch.
+
+    The interpolation is linear, so the window totals of the interpolated
+    values equal the interpolated window totals of the fields. The windows
+    are computed from the rows of all steps, per station (and level). The
+    lead times are in hours, one per step; a window that spans a missing
+    lead time is left out.
+
+    Args:
+        batch (FctableBatch): extracted rows, of all steps
+        settings (list): from accumulation_settings
+        sqlite_template (str): sqlite_template (relative FCTABLE file name)
+        basetime (datetime): forecast start
+        model_name (str): name of the value column
+    """
+    import pandas
+
+    for entry in settings:
+        if entry["output"] != "points":
+            continue
+        source = batch.tables.get((fctable_name(sqlite_template, entry["harp_param"], basetime), "FC"))
+        if source is None:
+            logger.warning("No rows of {} to accumulate", entry["harp_param"])
+            continue
+        frame = pandas.concat(source["frames"], ignore_index=True)
+        keys = [col for col in ("fcst_dttm", "SID", "p") if col in frame.columns]
+        frame = frame.drop_duplicates([*keys, "lead_time"], keep="last")
+        values = frame.pivot(index=keys, columns="lead_time", values=model_name)
+        # One column per hour, NaN where a lead time is missing. The windows
+        # only need lead time 0 in "accumulated" mode, where it is 0.
+        lead_times = np.arange(0, values.columns.max() + 1).astype(values.columns.dtype)
+        missing = [lead for lead in lead_times[1:] if lead not in values.columns]
+        values = values.reindex(columns=lead_times)
+        if entry["mode"] == "accumulated":
+            values[lead_times[0]] = values[lead_times[0]].fillna(0.0)
+        if missing:
+            logger.warning(
+                "No {} at lead times {}, the windows over them are left out",
+                entry["harp_param"], "/".join(str(lead) for lead in missing),
+            )
+        for window in entry["windows"]:
+            if entry["mode"] == "rate":
+                # Sum of the steps in the window, missing if any of them is
+                totals = sum(values.shift(lag, axis=1) for lag in range(window))
+            else:
+                totals = values - values.shift(window, axis=1)
+            totals = totals.loc[:, lead_times >= window].stack().dropna()
+            totals = totals.rename(model_name).reset_index()
+            rows = frame.drop(columns=[model_name]).merge(totals, on=[*keys, "lead_time"])
+            harp_param = entry["name"].format(window=window)
+            rows["parameter"] = harp_param
+            batch.add(
+                fctable_name(sqlite_template, harp_param, basetime),
+                "FC",
+                rows[frame.columns],
+                source["schema"],
+                source["indices"],
+            )
+            logger.info("{}: {} rows", harp_param, len(rows))
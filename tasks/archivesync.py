@@ -0,0 +1,184 @@
+"""Keep a local directory in sync with tar.gz archives in ECFS."""
+
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from deode.logs import logger
+
+
+def parse_listing(output, suffix=".tar.gz"):
+    """Parse the output of "els -l" (or plain "els").
+
+    Returns:
+        dict: {name: {"size": int, "mtime": str}} for the files ending in suffix.
+            Size and mtime are None if the listing does not have them.
+    """
+    files = {}
+    for line in output.splitlines():
+        fields = line.split()
+        if not fields or not fields[-1].endswith(suffix):
+            continue
+        name = os.path.basename(fields[-1])
+        if len(fields) >= 9:
+            files[name] = {"size": int(fields[4]), "mtime": " ".join(fields[5:8])}
+        else:
+            files[name] = {"size": None, "mtime": None}
+    return files
+
+
+class ArchiveSync:
+    """Download and unpack the archives of a remote directory that changed since the last run.
+
+    Archives are copied by a pool of concurrent copy commands. Each copy
+    writes into a named pipe that is unpacked while it arrives, so the
+    tarball itself never lands on disk. A manifest with the name, size and
+    mtime of every unpacked archive is kept in the local directory, and
+    archives that are listed with the same size and mtime are skipped.
+    """
+
+    MANIFEST = ".archive_manifest.json"
+
+    def __init__(self, remote_dir, local_dir, list_command=None, copy_command=None, nworkers=4):
+        """Construct the sync.
+
+        Args:
+            remote_dir (str): Remote directory, e.g. "ec:/hlam/.../2026/01/"
+            local_dir (str): Directory to unpack into
+            list_command (list, optional): Listing command, the directory is appended.
+                Defaults to ["els", "-l"].
+            copy_command (list, optional): Copy command, source and target are appended.
+                Defaults to ["ecp"].
+            nworkers (int, optional): Number of concurrent downloads. Defaults to 4.
+        """
+        self.remote_dir = remote_dir
+        self.local_dir = local_dir
+        self.list_command = list_command or ["els", "-l"]
+        self.copy_command = copy_command or ["ecp"]
+        self.nworkers = max(1, nworkers)
+
+    @property
+    def manifest_file(self):
+        """Name of the manifest file."""
+        return os.path.join(self.local_dir, self.MANIFEST)
+
+    def load_manifest(self):
+        """Archives unpacked by earlier runs."""
+        if not os.path.isfile(self.manifest_file):
+            return {}
+        with open(self.manifest_file) as fin:
+            return json.load(fin)
+
+    def save_manifest(self, manifest):
+        """Write the manifest atomically."""
+        with open(f"{self.manifest_file}.tmp", "w") as fout:
+            json.dump(manifest, fout, indent=1, sort_keys=True)
+        os.replace(f"{self.manifest_file}.tmp", self.manifest_file)
+
+    def list_remote(self):
+        """List the archives in the remote directory.
+
+        Returns:
+            dict: as from parse_listing, empty if the listing fails
+        """
+        try:
+            result = subprocess.run(
+                [*self.list_command, self.remote_dir], check=True, capture_output=True, text=True
+            )
+        except subprocess.CalledProcessError as err:
+            logger.warning("Failed to list files in {}: {}", self.remote_dir, err.stderr.strip())
+            return {}
+        return parse_listing(result.stdout)
+
+    def fetch(self, name):
+        """Copy one archive into a named pipe and unpack it while it arrives.
+
+        Raises:
+            RuntimeError: If the copy command fails.
+        """
+        remote = os.path.join(self.remote_dir, name)
+        tmpdir = tempfile.mkdtemp(prefix="archivesync_")
+        fifo = os.path.join(tmpdir, name)
+        os.mkfifo(fifo)
+        unpacked = threading.Event()
+        try:
+            proc = subprocess.Popen(
+                [*self.copy_command, remote, fifo],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                text=True,
+            )
+
+            def unblock():
+                # If the copy ends without opening the pipe (e.g. it failed),
+                # open and close it once so the reader sees the end of the stream.
+                proc.wait()
+                while not unpacked.is_set():
+                    try:
+                        os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+
+            watcher = threading.Thread(target=unblock, daemon=True)
+            watcher.start()
+            try:
+                with tarfile.open(fifo, mode="r|gz") as tar:
+                    if hasattr(tarfile, "data_filter"):
+                        tar.extractall(path=self.local_dir, filter="data")
+                    else:
+                        tar.extractall(path=self.local_dir)
+            except (tarfile.TarError, EOFError) as err:
+                if proc.wait() == 0:
+                    raise RuntimeError(f"Could not unpack {remote}: {err}") from err
+            finally:
+                unpacked.set()
+                output = proc.communicate()[0]
+                watcher.join()
+            if proc.returncode != 0:
+                raise RuntimeError(f"Copy of {remote} failed: {output.strip()}")
+        finally:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+    def run(self):
+        """Fetch all new or changed archives.
+
+        Returns:
+            list: names of the archives that failed
+        """
+        os.makedirs(self.local_dir, exist_ok=True)
+        remote = self.list_remote()
+        if not remote:
+            logger.info("No .tar.gz files to download from {}", self.remote_dir)
+            return []
+        manifest = self.load_manifest()
+        todo = [
+            name
+            for name, entry in sorted(remote.items())
+            # A plain listing has no size and mtime, then only new names are fetched
+            if name not in manifest or (entry["size"] is not None and manifest[name] != entry)
+        ]
+        logger.info(
+            "{} of {} archives in {} are new or changed", len(todo), len(remote), self.remote_dir
+        )
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.nworkers) as pool:
+            futures = {pool.submit(self.fetch, name): name for name in todo}
+            for future in as_completed(futures):
+                name = futures[future]
+                try:
+                    future.result()
+                except RuntimeError as err:
+                    logger.warning("{}", err)
+                    failed.append(name)
+                    continue
+                logger.info("Unpacked {}", name)
+                manifest[name] = remote[name]
+                self.save_manifest(manifest)
+        return failed
@@ -0,0 +1,124 @@
+"""Retrieval areas around the verification stations."""
+
+import csv
+import math
+
+import numpy as np
+
+
+def read_station_coords(station_file):
+    """Read latitudes and longitudes from a station list (csv with lat, lon columns).
+
+    Returns:
+        tuple: (lats, lons) as numpy arrays
+    """
+    lats = []
+    lons = []
+    with open(station_file, newline="") as fin:
+        for row in csv.DictReader(fin, skipinitialspace=True):
+            lats.append(float(row["lat"]))
+            lons.append(float(row["lon"]))
+    return np.array(lats), np.array(lons)
+
+
+def grid_increments(grid):
+    """Parse a MARS grid ("0.05/0.05") into (dlat, dlon)."""
+    dlon, dlat = (float(x) for x in grid.split("/"))
+    return dlat, dlon
+
+
+def snap_box(north, west, south, east, grid=None):
+    """Widen a box to the grid points of a regular grid and clip the latitudes."""
+    north = min(north, 90.0)
+    south = max(south, -90.0)
+    if grid:
+        dlat, dlon = grid_increments(grid)
+        north = min(math.ceil(north / dlat) * dlat, 90.0)
+        south = max(math.floor(south / dlat) * dlat, -90.0)
+        west = math.floor(west / dlon) * dlon
+        east = math.ceil(east / dlon) * dlon
+    return [round(north, 6), round(west, 6), round(south, 6), round(east, 6)]
+
+
+def format_area(box):
+    """MARS area string N/W/S/E."""
+    return "/".join(f"{x:g}" for x in box)
+
+
+def bounding_box(lats, lons, padding=1.0, grid=None):
+    """Padded bounding box [N, W, S, E] of all stations."""
+    return snap_box(
+        lats.max() + padding,
+        lons.min() - padding,
+        lats.min() - padding,
+        lons.max() + padding,
+        grid,
+    )
+
+
+def tile_boxes(lats, lons, tile_size=30.0, padding=1.0, grid=None):
+    """Padded boxes [N, W, S, E] around the stations, on a coarse tiling.
+
+    Stations are binned in tile_size x tile_size degree cells. Neighbouring
+    cells in the same row are merged, and every box is shrunk to the stations
+    it contains before padding.
+    """
+    rows = np.floor((lats + 90.0) / tile_size).astype(int)
+    cols = np.floor((lons + 180.0) / tile_size).astype(int)
+    boxes = []
+    for row in np.unique(rows):
+        in_row = rows == row
+        row_cols = np.unique(cols[in_row])
+        # runs of neighbouring columns
+        runs = np.split(row_cols, np.where(np.diff(row_cols) > 1)[0] + 1)
+        for run in runs:
+            sel = in_row & (cols >= run[0]) & (cols <= run[-1])
+            boxes.append(bounding_box(lats[sel], lons[sel], padding, grid))
+    return boxes
+
+
+def station_areas(station_file, mode, padding=1.0, tile_size=30.0, max_tiles=8, grid=None):
+    """Retrieval areas for a station list.
+
+    Args:
+        station_file (str): station list (csv)
+        mode (str): "auto" for one bounding box, "tiles" for several boxes
+        padding (float, optional): padding around the stations in degrees
+        tile_size (float, optional): tile size in degrees for mode "tiles"
+        max_tiles (int, optional): use one bounding box if there are more tiles
+        grid (str, optional): MARS grid, boxes are snapped to it
+
+    Returns:
+        list: MARS area strings
+    """
+    lats, lons = read_station_coords(station_file)
+    if mode == "tiles":
+        boxes = tile_boxes(lats, lons, tile_size, padding, grid)
+        if len(boxes) <= max_tiles:
+            return [format_area(box) for box in boxes]
+    return [format_area(bounding_box(lats, lons, padding, grid))]
+
+
+def assign_stations(lats, lons, boxes):
+    """Assign every station to (at most) one of several grid boxes.
+
+    A station goes to the box in which it is farthest from the edges, so
+    overlapping (padded) boxes do not extract a station twice.
+
+    Args:
+        lats, lons (numpy.ndarray): station coordinates
+        boxes (list): [N, W, S, E] per box, W > E if the box crosses longitude 0/360
+
+    Returns:
+        numpy.ndarray: index of the box per station, -1 if outside all boxes
+    """
+    margins = np.full((len(boxes), len(lats)), -np.inf)
+    for ibox, (north, west, south, east) in enumerate(boxes):
+        width = (east - west) % 360.0
+        dlon = (lons - west) % 360.0
+        inside = (lats <= north) & (lats >= south) & (dlon <= width)
+        margin = np.minimum.reduce([north - lats, lats - south, dlon, width - dlon])
+        margins[ibox, inside] = margin[inside]
+    best = np.argmax(margins, axis=0)
+    best[np.all(np.isinf(margins), axis=0)] = -1
+    return best
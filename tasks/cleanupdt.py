@@ -0,0 +1,55 @@
+"""CleanupDT."""
+
+import os
+from datetime import timedelta
+
+from deode.datetime_utils import as_datetime, as_timedelta
+from deode.logs import logger
+from deode.tasks.base import Task
+from .gribcache import GribCache, cache_root
+
+
+class CleanupDT(Task):
+    """Keep the retrieved DT GRIB files within their disk quota and maximum age."""
+
+    def __init__(self, config):
+        """Construct CleanupDT task object.
+
+        Runs after ExtractDT. The directories of the current basetime (and,
+        in backfill mode, of the other dates of its group) are never removed,
+        nor are those that other families still retrieve or extract. A
+        directory that is in progress but was not used for longer than
+        ExtractDT waits for its retrieval (extract_dt.pipeline_timeout) is
+        abandoned, and evicted like the others.
+
+        Args:
+            config (deode.ParsedConfig): Configuration
+        """
+        Task.__init__(self, config, __class__.__name__)
+        self.basetime = as_datetime(self.config["general.times.basetime"])
+        dt_grib_path = self.config["extract_dt.dt_grib_path"]
+        root = self.config.get("extract_dt.cache_root", None) or cache_root(dt_grib_path)
+        quota = self.config.get("extract_dt.cache_quota", None)
+        max_age = self.config.get("extract_dt.cache_max_age", None)
+        self.cache = GribCache(
+            self.platform.substitute(root),
+            quota=float(quota) * 1e9 if quota else None,
+            max_age=as_timedelta(max_age) if max_age else None,
+            stale_after=float(self.config.get("extract_dt.pipeline_timeout", 86400)),
+        )
+
+        ndays = 1
+        if self.config.get("extract_dt.backfill", False):
+            ndays = max(1, int(self.config.get("extract_dt.backfill_group_days", 7)))
+        self.keep = [
+            self.platform.substitute(dt_grib_path, basetime=self.basetime + timedelta(days=i))
+            for i in range(ndays)
+        ]
+
+    def execute(self):
+        """Evict the least recently used GRIB directories."""
+        if not os.path.isdir(self.cache.root):
+            logger.info("No GRIB cache at {}", self.cache.root)
+            return
+        removed = self.cache.evict(keep=self.keep)
+        logger.info("Removed {} directories from the GRIB cache", len(removed))
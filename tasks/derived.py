@@ -0,0 +1,122 @@
+"""Parameters derived from several GRIB fields, e.g. wind speed and direction.
+
+A parameter list is split up front into the base fields that have to be
+decoded and interpolated, each only once even if several parameters use it
+(10u/10v for S10m and D10m), and the derived parameters. These are computed
+afterwards from the extracted rows of all steps, levels and stations at once.
+"""
+
+import json
+
+from deode.logs import logger
+from .points import FUNCTIONS, fctable_name
+
+# Units of a derived parameter, None for the units of its first input
+FUNCTION_UNITS = {
+    "vector_norm": None,
+    "vector_angle": "degrees",
+}
+
+
+def field_key(grib_id, method):
+    """Key of a base field: its full grib_id (with the common keys) and interpolation method."""
+    return json.dumps([grib_id, method], sort_keys=True)
+
+
+def plan(param_list):
+    """Split a parameter list into base fields and derived parameters.
+
+    Args:
+        param_list (list): Parameter list (harp_param, grib_id, common, method, function)
+
+    Returns:
+        tuple: (parameter list with one entry per base field, list of
+                (harp_param, function, [base harp_param]) of the derived parameters).
+        A base field that is only needed by derived parameters gets a
+        hidden harp_param starting with "_".
+    """
+    base = {}
+    # Plain parameters keep their name
+    for param in param_list:
+        if "function" in param:
+            continue
+        ids = param["grib_id"] if isinstance(param["grib_id"], list) else [param["grib_id"]]
+        grib_id = {**param.get("common", {}), **ids[0]}
+        base.setdefault(field_key(grib_id, param.get("method")), {**param, "grib_id": grib_id})
+    derived = []
+    for param in param_list:
+        if "function" not in param:
+            continue
+        inputs = []
+        for grib_id in param["grib_id"]:
+            grib_id = {**param.get("common", {}), **grib_id}
+            key = field_key(grib_id, param.get("method"))
+            if key not in base:
+                names = {entry["harp_param"] for entry in base.values()}
+                name = f"_{grib_id.get('shortName', 'field')}"
+                while name in names:
+                    name += "_"
+                base[key] = {"harp_param": name, "method": param.get("method"), "grib_id": grib_id}
+            inputs.append(base[key]["harp_param"])
+        derived.append((param["harp_param"], param["function"], inputs))
+    base_list = list(base.values())
+    logger.info(
+        "{} parameters: {} base fields, {} derived", len(param_list), len(base_list), len(derived)
+    )
+    return base_list, derived
+
+
+def derive(batch, derived, sqlite_template, basetime, model_name, skip=()):
+    """Add the derived parameters to a batch, and drop the hidden base fields.
+
+    Args:
+        batch (FctableBatch): extracted rows of the base fields
+        derived (list): derived parameters, from plan
+        sqlite_template (str): sqlite_template (relative FCTABLE file name)
+        basetime (datetime): forecast start
+        model_name (str): name of the value column
+        skip (iterable, optional): derived parameters that are already extracted,
+            so their inputs were not requested
+    """
+    import pandas
+
+    for harp_param, function, inputs in derived:
+        if harp_param in skip:
+            continue
+        entries = [
+            batch.tables.get((fctable_name(sqlite_template, name, basetime), "FC")) for name in inputs
+        ]
+        if any(entry is None for entry in entries):
+            logger.warning("No input for {}: {}", harp_param, ", ".join(inputs))
+            continue
+        frames = [pandas.concat(entry["frames"], ignore_index=True) for entry in entries]
+        keys = [col for col in ("fcst_dttm", "lead_time", "SID", "p") if col in frames[0].columns]
+        joined = frames[0]
+        for icomp, frame in enumerate(frames[1:], start=1):
+            joined = joined.merge(
+                frame[[*keys, model_name]], on=keys, suffixes=("", f"_{icomp}")
+            )
+        values = [joined[model_name].to_numpy()] + [
+            joined[f"{model_name}_{icomp}"].to_numpy() for icomp in range(1, len(frames))
+        ]
+        result = joined[frames[0].columns].copy()
+        result[model_name] = FUNCTIONS[function](*values)
+        result["parameter"] = harp_param
+        units = FUNCTION_UNITS.get(function)
+        if units is not None and "units" in result.columns:
+            result["units"] = units
+        batch.add(
+            fctable_name(sqlite_template, harp_param, basetime),
+            "FC",
+            result,
+            entries[0]["schema"],
+            entries[0]["indices"],
+        )
+    hidden = {
+        fctable_name(sqlite_template, name, basetime)
+        for _param, _function, inputs in derived
+        for name in inputs
+        if name.startswith("_")
+    }
+    for key in [key for key in batch.tables if key[0] in hidden]:
+        del batch.tables[key]
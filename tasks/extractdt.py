@@ -1,30 +1,112 @@
 """ExtractDT."""
 
-import json
+import hashlib
 import os
-
-import pandas
-from grib2sqlite import logger as sqlite_logger
-from grib2sqlite import parse_grib_file
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cached_property
 
 from deode.datetime_utils import as_datetime, as_timedelta
 from deode.logs import LogDefaults, logger
 from deode.tasks.base import Task
-import subprocess
+from .fctable import FctableBatch
+from .accumulation import accumulate_points, accumulation_settings
+from .archivesync import ArchiveSync
+from .areas import assign_stations
+from .derived import derive, plan
+from .gather import gather_file, regular_ll
+from .ledger import ExtractionLedger, file_fingerprint, unit_key
+from .lists import load_list
+from .gributils import (
+    grid_box,
+    group_by_grid,
+    load_index,
+    select_messages,
+    write_subset,
+)
+from .metrics import task_metrics
+from .pipeline import FAILED, mark_extracted, read_ready
+from .points import coverage_frames, fctable_name, fctable_schema, read_coverages
+from .profiles import load_profiles, profile_update
+from .weights_cache import WeightsCache, grid_hash
 from datetime import datetime
-import tarfile
+
+
+def extract_file(infile, param_list, station_list, sqlite_template, model_name, weights, loglevel):
+    """Extract point data from one GRIB file to SQLite.
+
+    Module level, so it can also run in a worker process.
+
+    Args:
+        infile (str): GRIB file
+        param_list (list): Parameter list
+        station_list (pandas.DataFrame): Station list
+        sqlite_template (str): Full path template of the output SQLite files
+        model_name (str): Model name
+        weights: Interpolation weights, or None to compute them
+        loglevel (str): Log level for grib2sqlite
+
+    Returns:
+        tuple: (the interpolation weights computed by parse_grib_file, or None if
+        they were given, wall time in seconds)
+    """
+    from grib2sqlite import logger as sqlite_logger
+    from grib2sqlite import parse_grib_file
+
+    start = time.time()
+    sqlite_logger.setLevel(loglevel)
+    new_weights = parse_grib_file(
+        infile=infile,
+        param_list=param_list,
+        station_list=station_list,
+        sqlite_template=sqlite_template,
+        model_name=model_name,
+        weights=weights,
+    )
+    # Known weights are not sent back from a worker process
+    return (new_weights if weights is None else None), time.time() - start
+
+
+def worker_memory(messages, engine):
+    """Memory a worker needs to extract a GRIB file.
+
+    grib2sqlite decodes whole fields in double precision, together with
+    their coordinates, so a worker needs a few times 8 bytes per grid
+    point. The gather engine only holds one packed message.
+
+    Args:
+        messages (list): indexed messages of the file, as from load_index
+        engine (str): "grib2sqlite" or "gather"
+
+    Returns:
+        int: bytes, 0 for a file without messages
+    """
+    if not messages:
+        return 0
+    if engine == "gather":
+        return 2 * max(msg["length"] for msg in messages)
+    # Ni * Nj, or about 2 bytes per point for other grids
+    npoints = max(
+        msg["grid"][4] * msg["grid"][5] if msg.get("grid") and None not in msg["grid"][4:6]
+        else msg["length"] // 2
+        for msg in messages
+    )
+    return 4 * 8 * npoints
 
 
 class ExtractDT(Task):
     """Extract sqlite point files."""
 
-    def __init__(self, config):
+    def __init__(self, config, profile=None):
         """Construct ExtractDT object.
         Will normally write to the same SQLite file as model forecast.
         But "model_name" is set to "DT".
 
         Args:
             config (deode.ParsedConfig): Configuration
+            profile (str, optional): name of the extraction profile, if config is one
 
         Raises:
             FileNotFoundError: Required file not fount
@@ -57,6 +139,17 @@ class ExtractDT(Task):
         self.sqlite_template = self.platform.substitute(
             self.config["extractsqlite.sqlite_template"]
         )
+        # "sqlite" (FCTABLE files) and/or "parquet" (partitioned dataset)
+        self.output_formats = list(self.config.get("extractsqlite.output_formats", ["sqlite"]))
+        unknown = [fmt for fmt in self.output_formats if fmt not in ("sqlite", "parquet")]
+        if unknown or not self.output_formats:
+            raise RuntimeError(f"Unknown or no output formats: {self.output_formats}")
+        parquet_path = self.config.get("extractsqlite.parquet_path", None)
+        self.parquet_path = (
+            self.platform.substitute(parquet_path)
+            if parquet_path
+            else os.path.join(self.sqlite_path, "parquet")
+        )
 
         # Get & read param/station list (for deterministic case) from config toml file
         # Stop if any of them not found
@@ -64,128 +157,527 @@ class ExtractDT(Task):
         for entry in det_list:
             if "station_list_default.csv" in entry["location_file"]:
                 self.stationfile_sfc = self.platform.substitute(entry["location_file"])
-                paramfile_sfc = self.platform.substitute(entry["param_file"])
+                self.paramfile_sfc = self.platform.substitute(entry["param_file"])
             elif "temp_list_default.csv" in entry["location_file"]:
                 self.stationfile_ua = self.platform.substitute(entry["location_file"])
-                paramfile_ua = self.platform.substitute(entry["param_file"])
+                self.paramfile_ua = self.platform.substitute(entry["param_file"])
         if not os.path.isfile(self.stationfile_ua):
             raise FileNotFoundError(f" missing {self.stationfile_ua}")
         logger.info("Station list ua: {}", self.stationfile_ua)
         if not os.path.isfile(self.stationfile_sfc):
             raise FileNotFoundError(f" missing {self.stationfile_sfc}")
         logger.info("Station list sfc: {}", self.stationfile_sfc)
-        if not os.path.isfile(paramfile_ua):
-            raise FileNotFoundError(f" missing {paramfile_ua}")
-        logger.info("Parameter list ua: {}", paramfile_ua)
-        if not os.path.isfile(paramfile_sfc):
-            raise FileNotFoundError(f" missing {paramfile_sfc}")
-        logger.info("Parameter list sfc: {}", paramfile_sfc)
-
-        with open(paramfile_sfc) as pf_sfc:
-            self.parameter_list_sfc = json.load(pf_sfc)
-            pf_sfc.close()
-        with open(paramfile_ua) as pf_ua:
-            self.parameter_list_ua = json.load(pf_ua)
-            pf_ua.close()
+        if not os.path.isfile(self.paramfile_ua):
+            raise FileNotFoundError(f" missing {self.paramfile_ua}")
+        logger.info("Parameter list ua: {}", self.paramfile_ua)
+        if not os.path.isfile(self.paramfile_sfc):
+            raise FileNotFoundError(f" missing {self.paramfile_sfc}")
+        logger.info("Parameter list sfc: {}", self.paramfile_sfc)
         self.output_settings = self.config["general.output_settings"]
         self.model_name = self.config["extractsqlite.sqlite_model_name"]
 
+        # Interpolation weights only depend on grid and station list,
+        # so they are computed once and re-used for all files.
+        weights_cache_path = self.config.get("extractsqlite.weights_cache_path", None)
+        if weights_cache_path:
+            weights_cache_path = self.platform.substitute(weights_cache_path)
+            logger.info("Weights cache: {}", weights_cache_path)
+        self.weights_cache = WeightsCache(weights_cache_path, unix_group=self.unix_group)
+        # Parsed parameter and station lists, for this and later tasks
+        list_cache_path = self.config.get("extractsqlite.list_cache_path", None)
+        self.list_cache_path = (
+            self.platform.substitute(list_cache_path) if list_cache_path else weights_cache_path
+        )
+
+        # Number of worker processes for decoding and interpolation
+        self.nworkers = int(self.config.get("extractsqlite.nworkers", 1))
+        staging_path = self.config.get("extractsqlite.staging_path", None)
+        self.staging_path = self.platform.substitute(staging_path) if staging_path else None
+        self.loglevel = self.config.get("general.loglevel", LogDefaults.LEVEL).upper()
+        self.journal_mode = self.config.get("extractsqlite.journal_mode", "WAL")
+        # Only decode the messages that are in the parameter lists
+        self.select_messages = self.config.get("extractsqlite.select_messages", True)
+        # "gather" only decodes the grid points around the stations
+        self.engine = self.config.get("extractsqlite.engine", "grib2sqlite")
+        # Window totals computed from the extracted point values
+        self.point_accumulations = [
+            entry for entry in accumulation_settings(self.config) if entry["output"] == "points"
+        ]
+        # Skip parameters that are already extracted from the same files
+        ledger = self.config.get("extractsqlite.ledger", "extraction_ledger.sqlite")
+        self.ledger_path = os.path.join(self.sqlite_path, ledger) if ledger else None
+        memory_budget = self.config.get("extractsqlite.memory_budget", None)
+        self.memory_budget = float(memory_budget) * 1e9 if memory_budget else None
+
+        self.profile = profile
+        name = __class__.__name__ if profile is None else f"{__class__.__name__}[{profile}]"
+        self.metrics = task_metrics(self, name)
+
+        # Pipelined mode: extract each step as soon as RetrieveDT has landed it
+        self.pipeline = self.config.get("extract_dt.pipeline", False)
+        self.pipeline_poll = float(self.config.get("extract_dt.pipeline_poll", 60))
+        self.pipeline_timeout = float(self.config.get("extract_dt.pipeline_timeout", 86400))
+        # RetrieveDT fetched time series at the stations instead of GRIB files
+        self.points = self.config["extract_dt.method"] == "polytope" and self.config.get(
+            "extract_dt.polytope_points", False
+        )
+
+    @cached_property
+    def parameter_list_sfc(self):
+        """Parameter list of the sfc files, read when it is first needed."""
+        return load_list(self.paramfile_sfc, "params", self.list_cache_path, self.unix_group)[0]
+
+    @cached_property
+    def parameter_list_ua(self):
+        """Parameter list of the ua files, read when it is first needed."""
+        return load_list(self.paramfile_ua, "params", self.list_cache_path, self.unix_group)[0]
+
     def execute(self):
-        """Execute ExtractSQLite on all files."""
+        """Execute ExtractSQLite on all files, for the main configuration and every profile.
 
+        The profiles in extract_dt.profiles read the same GRIB files, which
+        RetrieveDT fetched for all of them at once.
+        """
+        profiles = load_profiles(self.config, self.platform)
+        self.extract()
+        for name, profile in profiles.items():
+            logger.info("EXTRACTION PROFILE: {}", name)
+            ExtractDT(self.config.copy(update=profile_update(profile)), profile=name).extract()
+        # CleanupDT may now remove the GRIB files
+        if os.path.isdir(self.dt_path):
+            mark_extracted(self.dt_path)
+
+    def extract(self):
+        """Extract the point data of this configuration."""
         # Determine log file path
         log_file_name = self.config["extractsqlite"].get("log_file")
         log_file_path = os.path.join(self.sqlite_path, log_file_name) if log_file_name else None
         paramtypes=self.config["extract_dt.paramtypes"]
+        batch = FctableBatch(self.journal_mode)
+        ledger = None
+        if self.ledger_path and not self.points:
+            ledger = ExtractionLedger(self.ledger_path, self.model_name, self.basetime)
 
         for tag in paramtypes:
-            flist = [f"{tag}_{i}.grib1" for i in self.steplist]
             # Choose parameter list based on tag
             if tag == "sfc":
                 logger.info("reading sfc param list}")
                 param_list = self.parameter_list_sfc
-                station_list = pandas.read_csv(self.stationfile_sfc, skipinitialspace=True)
+                station_list, station_sum = load_list(
+                    self.stationfile_sfc, "stations", self.list_cache_path, self.unix_group
+                )
             elif tag == "ua":
                 logger.info("reading sfc param list}")
                 param_list = self.parameter_list_ua
-                station_list = pandas.read_csv(self.stationfile_ua, skipinitialspace=True)
+                station_list, station_sum = load_list(
+                    self.stationfile_ua, "stations", self.list_cache_path, self.unix_group
+                )
             else:
                 logger.warning("Unknown tag: {}, skipping...", tag)
                 continue
-            for ff in flist:
-                infile = os.path.join(self.dt_path, ff)
-                # Log to standard logger
-                logger.info("SQLITE EXTRACTION: {}", infile)
-                # Append log message to the specified log file if defined
-                # But first, ensure the directory structure exists
+            if self.points:
+                with self.metrics.stage("points", tag, stations=len(station_list)):
+                    self.extract_points(tag, param_list, station_list, batch)
+                continue
+            # Every input field is decoded and interpolated once, derived
+            # parameters are computed from the extracted rows of all steps
+            base_list, derived = plan(param_list)
+            infiles = self.input_files(tag, log_file_path)
+            params_for = None
+            requested = {harp_param for harp_param, _function, _inputs in derived}
+            if ledger is not None:
+                requested = set()
+                params_for = self.ledger_selection(
+                    ledger, tag, base_list, derived, station_sum, requested
+                )
+            self.extract_files(
+                infiles, base_list, station_list, station_sum, batch, params_for=params_for
+            )
+            # Derived parameters that the ledger has for all steps are not computed again
+            skip = {harp_param for harp_param, _function, _inputs in derived} - requested
+            with self.metrics.stage("derive", tag, params=len(derived) - len(skip)):
+                derive(batch, derived, self.sqlite_template, self.basetime, self.model_name, skip=skip)
+
+        if self.point_accumulations:
+            with self.metrics.stage("accumulate", params=len(self.point_accumulations)):
+                accumulate_points(
+                    batch, self.point_accumulations, self.sqlite_template, self.basetime,
+                    self.model_name,
+                )
+
+        # All steps are written at once, with one transaction per FCTABLE file
+        nfiles = len({relpath for relpath, _table in batch.tables})
+        if "parquet" in self.output_formats:
+            with self.metrics.stage("parquet", files=nfiles) as counters:
+                counters["rows"] = batch.write_parquet(self.parquet_path, self.model_name)
+        if "sqlite" in self.output_formats:
+            with self.metrics.stage("write", files=nfiles) as counters:
+                counters["rows"] = batch.flush(self.sqlite_path)
+        else:
+            batch.clear()
+        if ledger is not None:
+            ledger.commit()
+
+        if self.model_name == "IFS":  # Extra block to download hlam's sqlite data for IFSENS
+            with self.metrics.stage("ifsens"):
+                self.sync_ifsens()
+        self.metrics.summary()
+
+    def ledger_selection(self, ledger, tag, base_list, derived, station_sum, requested):
+        """Parameters of each file that are not yet in the extraction ledger.
+
+        Derived parameters that have to be computed bring their inputs along.
+        The inputs of the "points" accumulations are always extracted, since
+        their windows need all steps.
+
+        Args:
+            ledger (ExtractionLedger): extraction ledger
+            tag (str): file type, "sfc" or "ua"
+            base_list (list): base fields, from plan
+            derived (list): derived parameters, from plan
+            station_sum (str): checksum of the station list
+            requested (set): collects the parameters that are extracted from any file
+
+        Returns:
+            callable: params_for(infile), the base fields to extract from a file
+        """
+        salt = {"stations": station_sum, "template": self.sqlite_template, "formats": self.output_formats}
+        definitions = {param["harp_param"]: param for param in base_list}
+        # unit key -> (harp parameter, base fields it needs)
+        units = {}
+        for param in base_list:
+            if not param["harp_param"].startswith("_"):
+                units[unit_key({**param, **salt})] = (param["harp_param"], [param["harp_param"]])
+        for harp_param, function, inputs in derived:
+            key = unit_key(
+                {"harp_param": harp_param, "function": function,
+                 "inputs": [definitions[name] for name in inputs], **salt}
+            )
+            units[key] = (harp_param, inputs)
+        always = set()
+        for entry in self.point_accumulations:
+            for _key, (harp_param, inputs) in units.items():
+                if harp_param == entry["harp_param"]:
+                    always.update(inputs)
+                    requested.add(harp_param)
+
+        def params_for(infile):
+            step = os.path.basename(infile).rsplit(".", 1)[0].rsplit("_", 1)[1]
+            fingerprint = file_fingerprint(infile)
+            done = ledger.done(tag, step, fingerprint)
+            todo = {key: unit for key, unit in units.items() if key not in done}
+            needed = set(always)
+            for _harp_param, inputs in todo.values():
+                needed.update(inputs)
+            logger.info("{}_{}: {} of {} parameters to extract", tag, step, len(todo), len(units))
+            ledger.add(tag, step, fingerprint, {key: unit[0] for key, unit in todo.items()})
+            requested.update(unit[0] for unit in todo.values())
+            # The "points" accumulations need every step, even one that is done
+            return [param for param in base_list if param["harp_param"] in needed]
+
+        return params_for
+
+    def sync_ifsens(self):
+        """Download and unpack the IFSENS FCTABLEs of this month from hlam.
+
+        Only archives that are new or changed since the last run are fetched,
+        with extractsqlite.ifsens_workers concurrent copies. The listing and
+        copy commands can be replaced (ifsens_list_command, ifsens_copy_command),
+        e.g. by local stand-ins for els and ecp.
+        """
+        # Extract YYYY and MM from basetime
+        yyyy = self.basetime.strftime("%Y")
+        mm = self.basetime.strftime("%m")
+        logger.info("Start retrieving of IFSENS FCTABLES from hlam: Year {}, Month {}", yyyy, mm)
+        # Build the extraction path by replacing IFS → IFSENS
+        sqlite_extract_path = self.sqlite_path.replace(self.model_name, "IFSENS")
+        logger.info("Output path: {}", sqlite_extract_path)
+
+        # Path in the EC filesystem
+        remote_dir = self.config.get(
+            "extractsqlite.ifsens_remote_dir", "ec:/hlam/harp_bologna/FCTABLE/IFSENS/{yyyy}/{mm}/"
+        ).format(yyyy=yyyy, mm=mm)
+        sync = ArchiveSync(
+            remote_dir,
+            sqlite_extract_path,
+            list_command=self.config.get("extractsqlite.ifsens_list_command", "els -l").split(),
+            copy_command=self.config.get("extractsqlite.ifsens_copy_command", "ecp").split(),
+            nworkers=int(self.config.get("extractsqlite.ifsens_workers", 4)),
+        )
+        failed = sync.run()
+        if failed:
+            raise RuntimeError(f"Failed to fetch IFSENS archives: {', '.join(failed)}")
+
+    def input_files(self, tag, log_file_path=None):
+        """Yield the GRIB files of a tag that are available for extraction.
+
+        In pipelined mode (extract_dt.pipeline) this waits for RetrieveDT to
+        mark each step as ready, so extraction runs while retrieval continues.
+
+        Args:
+            tag (str): file type, "sfc" or "ua"
+            log_file_path (str, optional): extraction log file
+
+        Raises:
+            RuntimeError: If the retrieval does not finish within extract_dt.pipeline_timeout.
+        """
+        if self.pipeline:
+            steps = self.wait_for_steps(tag)
+        else:
+            steps = iter(self.steplist)
+        for step in steps:
+            infile = os.path.join(self.dt_path, f"{tag}_{step}.grib1")
+            # Log to standard logger
+            logger.info("SQLITE EXTRACTION: {}", infile)
+            # Append log message to the specified log file if defined
+            # But first, ensure the directory structure exists
+            if log_file_path:
                 os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+                with open(log_file_path, "a") as log_file:
+                    log_file.write(f"SQLITE EXTRACTION: {infile}\n")
+
+            if not os.path.isfile(infile):
+                logger.warning("File not found, skipping: {}", infile)
                 if log_file_path:
                     with open(log_file_path, "a") as log_file:
-                        log_file.write(f"SQLITE EXTRACTION: {infile}\n")
-                
-                if not os.path.isfile(infile):
-                    logger.warning("File not found, skipping: {}", infile)
-                    if log_file_path:
-                        with open(log_file_path, "a") as log_file:
-                            log_file.write(f"File not found, skipping: {infile}\n")
-                    continue  # Skip to the next file
-                
-                loglevel = self.config.get("general.loglevel", LogDefaults.LEVEL).upper()
-                sqlite_logger.setLevel(loglevel)
-                parse_grib_file(
-                    infile=infile,
-                    param_list=param_list,
-                    station_list=station_list,
-                    sqlite_template=self.sqlite_path + "/" + self.sqlite_template,
-                    model_name=self.model_name,
-                    weights=None,
-                )
+                        log_file.write(f"File not found, skipping: {infile}\n")
+                continue  # Skip to the next file
+            yield infile
 
-        if self.model_name == "IFS":  # Extra block to download hlam's sqlite data for IFSENS
-            # Extract YYYY and MM from basetime
-            yyyy = self.basetime.strftime("%Y")
-            mm = self.basetime.strftime("%m")
-            logger.info("Start retrieving of IFSENS FCTABLES from hlam: Year {}, Month {}", yyyy, mm)
-            # Build the extraction path by replacing IFS → IFSENS
-            sqlite_extract_path = self.sqlite_path.replace(self.model_name, "IFSENS")
-            logger.info("Output path: {}", sqlite_extract_path)
-            os.makedirs(sqlite_extract_path, exist_ok=True)
-
-            # Path in the EC filesystem
-            remote_dir = f"ec:/hlam/harp_bologna/FCTABLE/IFSENS/{yyyy}/{mm}/"
-
-            # 1) Get list of .tar.gz files via 'els'
-            tar_files = []
-            try:
-                result = subprocess.run(
-                    ["els", remote_dir],
-                    check=True,
-                    capture_output=True,
-                    text=True
-                )
-                tar_files = [f for f in result.stdout.splitlines() if f.endswith(".tar.gz")]
-            except subprocess.CalledProcessError as e:
-                logger.warning("Failed to list files in %s: %s", remote_dir, e.stderr.strip())
-
-            # 2) Download & uncompress each file (only if tar_files found)
-            if tar_files:
-                for tar_file in tar_files:
-                    remote_file_path = os.path.join(remote_dir, tar_file)
-                    local_file_path = os.path.join(sqlite_extract_path, tar_file)
-
-                    # Download using 'ecp'
-                    subprocess.run(
-                        ["ecp", remote_file_path, local_file_path],
-                        check=True
-                    )
-
-                    # Extract contents
-                    with tarfile.open(local_file_path, "r:gz") as tar:
-                        tar.extractall(path=sqlite_extract_path)
-
-                    # Remove .tar.gz file
-                    os.remove(local_file_path)
+    def extract_points(self, tag, param_list, station_list, batch):
+        """Add the point time series from a polytope feature request to the batch.
+
+        The values are those of the grid point nearest to each station, as
+        returned by polytope, so no interpolation is done here.
+
+        Args:
+            tag (str): file type, "sfc" or "ua"
+            param_list (list): Parameter list
+            station_list (pandas.DataFrame): Station list
+            batch (FctableBatch): collects the extracted rows
+        """
+        if self.pipeline:
+            # Wait until RetrieveDT has finished the tag
+            for _step in self.wait_for_steps(tag):
+                pass
+        infile = os.path.join(self.dt_path, f"{tag}_points.covjson")
+        if not os.path.isfile(infile):
+            logger.warning("File not found, skipping: {}", infile)
+            return
+        logger.info("POINT EXTRACTION: {}", infile)
+        coverages, units = read_coverages(infile, self.basetime)
+        schema, indices = fctable_schema(self.model_name, upper_air=tag == "ua")
+        for harp_param, frame in coverage_frames(
+            coverages, units, station_list, param_list, self.model_name, self.basetime
+        ):
+            relpath = fctable_name(self.sqlite_template, harp_param, self.basetime)
+            batch.add(relpath, "FC", frame, schema, indices)
+
+    def wait_for_steps(self, tag):
+        """Yield the steps of a tag as soon as RetrieveDT marks them as ready.
+
+        Raises:
+            RuntimeError: If the retrieval times out or has failed for good.
+        """
+        pending = list(self.steplist)
+        deadline = time.time() + self.pipeline_timeout
+        while pending:
+            ready, status = read_ready(self.dt_path, tag)
+            for step in [step for step in pending if step in ready]:
+                pending.remove(step)
+                yield step
+            if status == FAILED and pending:
+                raise RuntimeError(f"Retrieval of {tag} failed, missing steps {'/'.join(pending)}")
+            if status or not pending:
+                break
+            if time.time() > deadline:
+                raise RuntimeError(f"Timeout waiting for {tag} steps {'/'.join(pending)}")
+            time.sleep(self.pipeline_poll)
+        # Retrieval has finished: whatever is left is reported as missing
+        yield from pending
+
+    def split_input(self, infile, param_list, station_list, station_sum, stage_dir):
+        """Split a GRIB file in the parts that are extracted separately.
+
+        The sidecar index written by RetrieveDT gives the offset and length of
+        every message, so the messages needed by the parameter list are copied
+        to the staging directory without decoding anything. The other messages
+        are then never decoded by the extraction.
+
+        A file retrieved in tiles holds messages on several grids. Every grid
+        becomes a separate part, with the stations that fall inside it.
+
+        Args:
+            infile (str): GRIB file
+            param_list (list): Parameter list
+            station_list (pandas.DataFrame): Station list
+            station_sum (str): Checksum of the station list file
+            stage_dir (str): Staging directory for this file
+
+        Returns:
+            list: (GRIB file, station list, station checksum, staging directory,
+                number of messages or None if unknown) per part
+        """
+        if not self.select_messages:
+            return [(infile, station_list, station_sum, stage_dir, None)]
+        messages = load_index(infile)
+        selected = select_messages(messages, param_list)
+        groups = group_by_grid(selected)
+        if len(groups) <= 1 and len(selected) == len(messages):
+            return [(infile, station_list, station_sum, stage_dir, len(messages))]
+        logger.info("Using {} of {} messages of {}", len(selected), len(messages), infile)
+        if len(groups) > 1:
+            boxes = [grid_box(group[0]) for group in groups]
+            owner = assign_stations(
+                station_list["lat"].to_numpy(), station_list["lon"].to_numpy(), boxes
+            )
+            if (owner < 0).any():
+                logger.warning("{} stations are outside all retrieved areas", (owner < 0).sum())
+        parts = []
+        for igroup, group in enumerate(groups):
+            part_dir = os.path.join(stage_dir, str(igroup))
+            os.makedirs(part_dir, exist_ok=True)
+            subset = os.path.join(part_dir, os.path.basename(infile))
+            write_subset(infile, group, subset)
+            if len(groups) == 1:
+                parts.append((subset, station_list, station_sum, part_dir, len(group)))
+                continue
+            stations = station_list[owner == igroup]
+            if stations.empty:
+                continue
+            checksum = hashlib.sha1(
+                f"{station_sum}:{','.join(map(str, stations.index))}".encode()
+            ).hexdigest()
+            parts.append((subset, stations, checksum, part_dir, len(group)))
+        return parts
+
+    def extract_files(self, infiles, param_list, station_list, station_sum, batch, params_for=None):
+        """Extract GRIB files into an in-memory batch of FCTABLE rows.
+
+        Every file is extracted to private SQLite files in a (node-local)
+        staging directory, which are read into the batch right away. With
+        extractsqlite.nworkers > 1 the files are extracted in a process pool.
+        Only the task process itself writes to the FCTABLE files. Every part
+        gets an "extract" metrics record.
+
+        Args:
+            infiles (iterable): GRIB files to extract
+            param_list (list): Parameter list
+            station_list (pandas.DataFrame): Station list
+            station_sum (str): Checksum of the station list file
+            batch (FctableBatch): collects the extracted rows
+            params_for (callable, optional): params_for(infile) gives the part of
+                param_list to extract from a file (e.g. from the extraction
+                ledger); files without parameters are skipped
+        """
+        staging = tempfile.mkdtemp(prefix="extractdt_", dir=self.staging_path)
+        pool = None
+        primed = set()
+        warned = False
+
+        def collect(part_dir, result, counters):
+            output, wall = result
+            if part_dir is None:
+                # Rows gathered in memory: (FCTABLE file, table, frame, schema, indices)
+                counters["rows"] = 0
+                for relpath, table, frame, schema, indices in output:
+                    batch.add(relpath, table, frame, schema, indices)
+                    counters["rows"] += len(frame)
             else:
-                logger.info("No .tar.gz files to download from %s. Skipping extraction.", remote_dir)
+                counters["rows"] = batch.add_staged(part_dir)
+            self.metrics.write("extract", wall=wall, **counters)
+
+        try:
+            futures = {}
+            sized = False
+            for idx, infile in enumerate(infiles):
+                file_params = param_list if params_for is None else params_for(infile)
+                if not file_params:
+                    logger.info("Already extracted, skipping: {}", infile)
+                    continue
+                tag, step = os.path.basename(infile).rsplit(".", 1)[0].rsplit("_", 1)
+                parts = self.split_input(
+                    infile, file_params, station_list, station_sum, os.path.join(staging, str(idx))
+                )
+                if not sized and self.nworkers > 1:
+                    # The workers extract the parts, which may be much smaller than the file
+                    sized = True
+                    nworkers = self.bounded_workers([part[0] for part in parts])
+                    if nworkers > 1:
+                        logger.info("Parallel extraction with {} workers", nworkers)
+                        pool = ProcessPoolExecutor(max_workers=nworkers)
+                for source, stations, stations_sum, part_dir, nmessages in parts:
+                    os.makedirs(part_dir, exist_ok=True)
+                    counters = {
+                        "tag": tag,
+                        "step": step,
+                        "bytes_read": os.path.getsize(source),
+                        "messages": nmessages,
+                        "stations": len(stations),
+                    }
+                    if self.engine == "gather" and regular_ll(source):
+                        args = (
+                            source, file_params, stations, self.sqlite_template,
+                            self.model_name, self.basetime,
+                        )
+                        if pool is None:
+                            collect(None, gather_file(*args), counters)
+                        else:
+                            futures[pool.submit(gather_file, *args)] = (None, counters)
+                        continue
+                    grid = grid_hash(source)
+                    weights = self.weights_cache.load(grid, stations_sum)
+                    template = os.path.join(part_dir, self.sqlite_template)
+                    args = (source, file_params, stations, template, self.model_name)
+                    key = (grid, stations_sum)
+                    if pool is None or (weights is None and key not in primed):
+                        # Serial mode, or the weights for a new grid that are
+                        # computed once before fanning out
+                        new_weights, wall = extract_file(*args, weights, self.loglevel)
+                        if weights is None:
+                            if new_weights is None and not warned:
+                                logger.warning(
+                                    "grib2sqlite returned no interpolation weights for {}, "
+                                    "they are computed again for every file", source,
+                                )
+                                warned = True
+                            self.weights_cache.store(grid, stations_sum, new_weights)
+                            primed.add(key)
+                        collect(part_dir, (new_weights, wall), counters)
+                        continue
+                    future = pool.submit(extract_file, *args, weights, self.loglevel)
+                    futures[future] = (part_dir, counters)
+                self.metrics.meter("steps", idx + 1)
+                # Collect what has finished while waiting for more input
+                for future in [f for f in futures if f.done()]:
+                    part_dir, counters = futures.pop(future)
+                    collect(part_dir, future.result(), counters)
+            for future in as_completed(futures):
+                part_dir, counters = futures[future]
+                collect(part_dir, future.result(), counters)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+            shutil.rmtree(staging, ignore_errors=True)
+
+    def bounded_workers(self, sources):
+        """Number of worker processes that fit in extractsqlite.memory_budget.
 
+        Args:
+            sources (list): the GRIB files of the parts of a typical input file,
+                as from split_input
 
+        Returns:
+            int: at most extractsqlite.nworkers, and at least 1
+        """
+        if not self.memory_budget:
+            return self.nworkers
+        per_worker = max((worker_memory(load_index(source), self.engine) for source in sources), default=0)
+        if not per_worker:
+            return self.nworkers
+        nworkers = max(1, min(self.nworkers, int(self.memory_budget // per_worker)))
+        logger.info(
+            "Memory budget {:.1f} GB, about {:.2f} GB per worker: {} workers",
+            self.memory_budget / 1e9, per_worker / 1e9, nworkers,
+        )
+        return nworkers
@@ -0,0 +1,194 @@
+"""Helpers for writing FCTABLE SQLite files, and the same rows as Parquet."""
+
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+from deode.logs import logger
+
+
+class FctableBatch:
+    """Point data of many forecast steps, kept in memory until it is flushed.
+
+    Every FCTABLE file is then written with one transaction, instead of one
+    small transaction per step and parameter.
+    """
+
+    def __init__(self, journal_mode="WAL"):
+        """Construct an empty batch.
+
+        Args:
+            journal_mode (str, optional): SQLite journal mode of the FCTABLE files.
+        """
+        self.journal_mode = journal_mode
+        # (relative path, table) -> {"schema": sql, "indices": [sql], "frames": [DataFrame]}
+        self.tables = {}
+
+    def add(self, relpath, table, frame, schema=None, indices=()):
+        """Add rows for one table of one FCTABLE file.
+
+        Args:
+            relpath (str): FCTABLE file name, relative to the output directory
+            table (str): table name
+            frame (pandas.DataFrame): rows to add
+            schema (str, optional): CREATE TABLE statement, used for new files
+            indices (list, optional): CREATE INDEX statements, used for new files
+        """
+        entry = self.tables.setdefault(
+            (relpath, table), {"schema": schema, "indices": list(indices), "frames": []}
+        )
+        entry["frames"].append(frame)
+
+    def add_staged(self, staging_dir):
+        """Read all SQLite files below staging_dir into the batch and remove them.
+
+        Files are matched on their path relative to the staging directory, so
+        it must have been written with the same sqlite_template.
+
+        Returns:
+            int: number of rows read
+        """
+        import pandas
+
+        nrows = 0
+        for root, _dirs, files in os.walk(staging_dir):
+            for fname in sorted(files):
+                if not fname.endswith(".sqlite"):
+                    continue
+                src = os.path.join(root, fname)
+                relpath = os.path.relpath(src, staging_dir)
+                con = sqlite3.connect(src)
+                try:
+                    tables = con.execute(
+                        "SELECT name, sql FROM sqlite_master WHERE type = 'table'"
+                    ).fetchall()
+                    for name, sql in tables:
+                        indices = [
+                            row[0]
+                            for row in con.execute(
+                                "SELECT sql FROM sqlite_master "
+                                "WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL",
+                                (name,),
+                            )
+                        ]
+                        frame = pandas.read_sql_query(f'SELECT * FROM "{name}"', con)
+                        self.add(relpath, name, frame, sql, indices)
+                        nrows += len(frame)
+                finally:
+                    con.close()
+                os.remove(src)
+        return nrows
+
+    def frames(self):
+        """Yield (relative path, table, DataFrame) with all rows per table."""
+        import pandas
+
+        for (relpath, table), entry in self.tables.items():
+            yield relpath, table, pandas.concat(entry["frames"], ignore_index=True)
+
+    def flush(self, target_dir):
+        """Write the batch, with one transaction per FCTABLE file, and empty it.
+
+        Tables (and their indices) that do not yet exist are created with the
+        staged schema. Existing rows with the same unique key are replaced.
+
+        Args:
+            target_dir (str): Directory with the FCTABLE files
+
+        Returns:
+            int: number of rows written
+        """
+        by_file = {}
+        total = 0
+        for relpath, table, frame in self.frames():
+            by_file.setdefault(relpath, []).append((table, frame))
+        for relpath, tables in by_file.items():
+            dst = os.path.join(target_dir, relpath)
+            nrows = sum(len(frame) for _table, frame in tables)
+            total += nrows
+            logger.info("Writing {} rows to {}", nrows, dst)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            con = sqlite3.connect(dst, timeout=600)
+            try:
+                if self.journal_mode:
+                    con.execute(f"PRAGMA journal_mode={self.journal_mode}")
+                with con:
+                    # Explicitly, so the new tables and indices are part of it
+                    con.execute("BEGIN IMMEDIATE")
+                    for table, frame in tables:
+                        self.write_table(con, relpath, table, frame)
+                if self.journal_mode and self.journal_mode.upper() == "WAL":
+                    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            finally:
+                con.close()
+        self.clear()
+        return total
+
+    def clear(self):
+        """Drop all rows of the batch."""
+        self.tables = {}
+
+    def write_parquet(self, target_dir, model_name):
+        """Write the batch as Parquet files, partitioned by model, parameter, year and month.
+
+        Every forecast run of a parameter is one file,
+        {target_dir}/model={model}/param={parameter}/year={YYYY}/month={MM}/{table}_{YYYYMMDDHH}.parquet,
+        so the files can be read as one (hive partitioned) dataset without any
+        locking. Rows of an existing file with the same key (lead time,
+        station, level) are replaced, as in the SQLite files. The batch is
+        not emptied.
+
+        Args:
+            target_dir (str): root directory of the Parquet dataset
+            model_name (str): model name (name of the value column)
+
+        Returns:
+            int: number of rows written
+        """
+        import pandas
+
+        total = 0
+        for _relpath, table, frame in self.frames():
+            for (parameter, fcst_dttm), rows in frame.groupby(["parameter", "fcst_dttm"], sort=False):
+                basetime = datetime.fromtimestamp(fcst_dttm, tz=timezone.utc)
+                dst = os.path.join(
+                    target_dir,
+                    f"model={model_name}",
+                    f"param={parameter}",
+                    f"year={basetime:%Y}",
+                    f"month={basetime:%m}",
+                    f"{table}_{basetime:%Y%m%d%H}.parquet",
+                )
+                os.makedirs(os.path.dirname(dst), exist_ok=True)
+                if os.path.exists(dst):
+                    rows = pandas.concat([pandas.read_parquet(dst), rows], ignore_index=True)
+                keys = [col for col in ("fcst_dttm", "lead_time", "SID", "p") if col in rows.columns]
+                rows = rows.drop_duplicates(keys, keep="last").sort_values(keys)
+                tmpfile = f"{dst}.{os.getpid()}.tmp"
+                rows.to_parquet(tmpfile, index=False)
+                os.replace(tmpfile, dst)
+                total += len(rows)
+        logger.info("Wrote {} rows to Parquet in {}", total, target_dir)
+        return total
+
+    def write_table(self, con, relpath, table, frame):
+        """Insert (or replace) the rows of one table within the open transaction."""
+        entry = self.tables[(relpath, table)]
+        main_cols = [row[1] for row in con.execute(f'PRAGMA table_info("{table}")')]
+        if not main_cols:
+            if entry["schema"] is None:
+                raise RuntimeError(f"No schema for new table {table} in {relpath}")
+            con.execute(entry["schema"])
+            for index_sql in entry["indices"]:
+                con.execute(index_sql)
+        else:
+            for col in frame.columns:
+                if col not in main_cols:
+                    con.execute(f'ALTER TABLE "{table}" ADD COLUMN "{col}"')
+        collist = ", ".join(f'"{col}"' for col in frame.columns)
+        placeholders = ", ".join("?" for _col in frame.columns)
+        # Plain python objects, with None for missing values
+        rows = frame.astype(object).where(frame.notna(), None).values.tolist()
+        con.executemany(
+            f'INSERT OR REPLACE INTO "{table}" ({collist}) VALUES ({placeholders})', rows
+        )
@@ -0,0 +1,222 @@
+"""Low-memory point extraction that only decodes the grid points around the stations.
+
+With simple (and CCSDS) packing, eccodes can decode single values of a
+message, so a field of 26 million points never has to be decoded as a
+whole. Only one (packed) message is in memory at a time. This works for
+regular lat/lon grids; other grids are left to grib2sqlite.
+"""
+
+import time
+
+import numpy as np
+
+from .gributils import WINDOW_KEYS, is_window
+from .points import fctable_name, fctable_schema, point_frame
+
+# Grid keys of a regular lat/lon grid
+GRID_KEYS = (
+    "latitudeOfFirstGridPointInDegrees",
+    "longitudeOfFirstGridPointInDegrees",
+    "iDirectionIncrementInDegrees",
+    "jDirectionIncrementInDegrees",
+    "Ni",
+    "Nj",
+    "jScansPositively",
+)
+
+
+def stencil(grid, lats, lons, method="bilin"):
+    """Grid point indexes and weights of every station on a regular lat/lon grid.
+
+    Args:
+        grid (tuple): values of GRID_KEYS
+        lats (numpy.ndarray): station latitudes
+        lons (numpy.ndarray): station longitudes
+        method (str, optional): "bilin" (4 points) or "nearest" (1 point)
+
+    Returns:
+        tuple: (indexes, weights), arrays of shape (stations, points). Stations
+        outside the grid have index -1.
+    """
+    lat1, lon1, di, dj, ni, nj, jpos = grid
+    ni, nj = int(ni), int(nj)
+    is_global = abs(ni * di - 360.0) < 0.5 * di
+    x = np.mod(np.asarray(lons, dtype=float) - lon1, 360.0) / di
+    y = (np.asarray(lats, dtype=float) - lat1) / dj if jpos else (lat1 - np.asarray(lats, dtype=float)) / dj
+    # Points on the last row or column count as inside
+    eps = 1e-6
+    y = np.where(np.abs(y - (nj - 1)) < eps, nj - 1, y)
+    if not is_global:
+        x = np.where(np.abs(x - (ni - 1)) < eps, ni - 1, x)
+    inside = (y >= 0) & (y <= nj - 1) & (is_global | (x <= ni - 1))
+
+    if method == "nearest":
+        i = np.rint(x).astype(int)
+        i = np.mod(i, ni) if is_global else np.minimum(i, ni - 1)
+        j = np.clip(np.rint(y).astype(int), 0, nj - 1)
+        indexes = (j * ni + i)[:, None]
+        weights = np.ones(indexes.shape)
+    else:
+        i0 = np.floor(x).astype(int)
+        j0 = np.clip(np.floor(y).astype(int), 0, max(nj - 2, 0))
+        fx = x - i0
+        fy = np.clip(y - j0, 0.0, 1.0)
+        i1 = np.mod(i0 + 1, ni) if is_global else np.minimum(i0 + 1, ni - 1)
+        i0 = np.mod(i0, ni) if is_global else np.minimum(i0, ni - 1)
+        j1 = np.minimum(j0 + 1, nj - 1)
+        indexes = np.stack([j0 * ni + i0, j0 * ni + i1, j1 * ni + i0, j1 * ni + i1], axis=1)
+        weights = np.stack(
+            [(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy, fx * fy], axis=1
+        )
+    indexes[~inside] = -1
+    return indexes, weights
+
+
+def interpolate(elements, indexes, weights):
+    """Station values from the gathered grid point values.
+
+    Args:
+        elements (dict): grid point index -> value
+        indexes (numpy.ndarray): from stencil
+        weights (numpy.ndarray): from stencil
+
+    Returns:
+        numpy.ndarray: one value per station, NaN outside the grid
+    """
+    values = np.full(indexes.shape, np.nan)
+    valid = indexes >= 0
+    values[valid] = [elements[index] for index in indexes[valid]]
+    return np.sum(values * weights, axis=1)
+
+
+def regular_ll(infile):
+    """Whether the first message of a GRIB file is on a regular lat/lon grid."""
+    from eccodes import codes_get, codes_grib_new_from_file, codes_release
+
+    with open(infile, "rb") as fin:
+        gid = codes_grib_new_from_file(fin, headers_only=True)
+    if gid is None:
+        return False
+    try:
+        return codes_get(gid, "gridType") == "regular_ll"
+    finally:
+        codes_release(gid)
+
+
+def first_grib_id(param):
+    """The grib_id of a parameter with a single input field."""
+    return param["grib_id"][0] if isinstance(param["grib_id"], list) else param["grib_id"]
+
+
+def gather_elements(gid, indexes):
+    """Decode only the grid points of a stencil.
+
+    Returns:
+        dict: grid point index -> value (NaN for missing values)
+    """
+    from eccodes import codes_get, codes_get_double_elements
+
+    wanted = np.unique(indexes[indexes >= 0]).tolist()
+    elements = dict(zip(wanted, codes_get_double_elements(gid, "values", wanted)))
+    if codes_get(gid, "bitmapPresent"):
+        missing = codes_get(gid, "missingValue")
+        elements = {index: np.nan if value == missing else value for index, value in elements.items()}
+    return elements
+
+
+def grib_id_matches(gid, grib_id):
+    """Check all keys of a grib_id against a message. Keys the message does not have are ignored.
+
+    Accumulation windows only match a grib_id that asks for a stepRange or startStep.
+    """
+    from eccodes import codes_get, codes_is_defined
+
+    for key, wanted in grib_id.items():
+        if not codes_is_defined(gid, key):
+            continue
+        wanted = wanted if isinstance(wanted, list) else [wanted]
+        actual = {str(codes_get(gid, key, str)), str(codes_get(gid, key))}
+        if not actual & {str(value) for value in wanted}:
+            return False
+    if not any(key in grib_id for key in WINDOW_KEYS) and is_window(
+        codes_get(gid, "startStep"), codes_get(gid, "endStep")
+    ):
+        return False
+    return True
+
+
+def gather_file(infile, param_list, station_list, sqlite_template, model_name, basetime):
+    """Extract point data from one GRIB file, decoding only the grid points that are needed.
+
+    Module level, so it can also run in a worker process.
+
+    Args:
+        infile (str): GRIB file
+        param_list (list): Parameter list of single fields; derived parameters
+            are computed afterwards (see derived.plan)
+        station_list (pandas.DataFrame): Station list
+        sqlite_template (str): sqlite_template (relative FCTABLE file name)
+        model_name (str): Model name
+        basetime (datetime): forecast start
+
+    Returns:
+        tuple: (list of (FCTABLE file, table, DataFrame, schema, indices),
+                wall time in seconds)
+
+    Raises:
+        RuntimeError: If a message is not on a regular lat/lon grid.
+    """
+    from eccodes import codes_get, codes_grib_new_from_file, codes_release
+
+    start = time.time()
+    lats = station_list["lat"].to_numpy()
+    lons = station_list["lon"].to_numpy()
+    # harp parameter -> level -> (lead time, values, units)
+    fields = {}
+    stencils = {}
+    with open(infile, "rb") as fin:
+        while True:
+            gid = codes_grib_new_from_file(fin)
+            if gid is None:
+                break
+            try:
+                matches = [
+                    param for param in param_list
+                    if grib_id_matches(gid, {**param.get("common", {}), **first_grib_id(param)})
+                ]
+                if not matches:
+                    continue
+                if codes_get(gid, "gridType") != "regular_ll":
+                    raise RuntimeError(f"{infile}: gather needs a regular lat/lon grid")
+                grid = tuple(codes_get(gid, key) for key in GRID_KEYS)
+                level = codes_get(gid, "level") if codes_get(gid, "typeOfLevel") == "isobaricInhPa" else None
+                lead_time = float(codes_get(gid, "endStep"))
+                units = codes_get(gid, "units")
+                # Every interpolation method is done once per message
+                gathered = {}
+                for param in matches:
+                    method = "nearest" if param.get("method") == "nearest" else "bilin"
+                    if method not in gathered:
+                        if (grid, method) not in stencils:
+                            stencils[(grid, method)] = stencil(grid, lats, lons, method)
+                        indexes, weights = stencils[(grid, method)]
+                        gathered[method] = interpolate(gather_elements(gid, indexes), indexes, weights)
+                    fields.setdefault(param["harp_param"], {})[level] = (
+                        lead_time, gathered[method], units,
+                    )
+            finally:
+                codes_release(gid)
+
+    tables = []
+    for param in param_list:
+        levels = fields.get(param["harp_param"], {})
+        for level in sorted(levels, key=lambda lev: -1 if lev is None else lev):
+            lead_time, values, units = levels[level]
+            frame = point_frame(
+                model_name, basetime, lead_time, station_list, param["harp_param"],
+                values, units, level,
+            )
+            schema, indices = fctable_schema(model_name, upper_air=level is not None)
+            relpath = fctable_name(sqlite_template, param["harp_param"], basetime)
+            tables.append((relpath, "FC", frame, schema, indices))
+    return tables, time.time() - start
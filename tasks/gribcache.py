@@ -0,0 +1,130 @@
+"""Disk quota and retention of the retrieved DT GRIB files.
+
+The files of one basetime are in one directory (dt_grib_path). Directories
+are evicted as a whole, least recently used first, when they are older than
+the maximum age or when the cache is larger than its quota. Directories
+that are still being retrieved or extracted are kept, unless they have not
+been used for so long that their tasks must have given up.
+"""
+
+import os
+import time
+
+from deode.logs import logger
+from .pipeline import in_progress
+
+# Macros of dt_grib_path that depend on the basetime
+BASETIME_MACROS = ("@YYYY@", "@YY@", "@MM@", "@DD@", "@HH@")
+
+
+def cache_root(dt_grib_path):
+    """Part of dt_grib_path above the first directory that depends on the basetime.
+
+    Args:
+        dt_grib_path (str): path template, e.g. ".../GDT_iekm/@YYYY@/@MM@/@DD@"
+
+    Returns:
+        str: e.g. ".../GDT_iekm" (macros other than the basetime ones are kept)
+    """
+    parts = dt_grib_path.rstrip("/").split("/")
+    for ipart, part in enumerate(parts):
+        if any(macro in part for macro in BASETIME_MACROS):
+            return "/".join(parts[:ipart]) or "/"
+    return "/".join(parts[:-1]) or "/"
+
+
+class GribCache:
+    """Directories of GRIB files under a root, with a size quota and a maximum age."""
+
+    def __init__(self, root, quota=None, max_age=None, stale_after=None):
+        """Construct the cache.
+
+        Args:
+            root (str): directory holding the basetime directories
+            quota (float, optional): maximum total size in bytes
+            max_age (datetime.timedelta, optional): directories that were not used
+                for this long are removed
+            stale_after (float, optional): seconds after which a directory that
+                is still in progress, but not used, counts as abandoned and can
+                be removed. By default such directories are always kept.
+        """
+        self.root = os.path.abspath(root)
+        self.quota = quota
+        self.max_age = max_age.total_seconds() if max_age is not None else None
+        self.stale_after = stale_after
+
+    def entries(self):
+        """Directories with files, as (path, size, last_used), least recently used first.
+
+        last_used is the latest access or modification time of the files, so
+        directories that ExtractDT still reads count as recently used (as far as
+        the file system records access times).
+        """
+        entries = []
+        for dirpath, _dirnames, filenames in os.walk(self.root):
+            size = 0
+            last_used = 0.0
+            for filename in filenames:
+                try:
+                    stat = os.stat(os.path.join(dirpath, filename))
+                except FileNotFoundError:
+                    continue
+                size += stat.st_size
+                last_used = max(last_used, stat.st_atime, stat.st_mtime)
+            if filenames:
+                entries.append((os.path.abspath(dirpath), size, last_used))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def evict(self, keep=()):
+        """Remove directories until the cache is within its quota and maximum age.
+
+        Directories that are still being retrieved, or are not yet extracted,
+        are not removed either, unless they were not used for stale_after
+        seconds.
+
+        Args:
+            keep (iterable, optional): directories that are never removed,
+                e.g. those of the basetimes that are being processed
+
+        Returns:
+            list: the removed directories
+        """
+        keep = {os.path.abspath(path) for path in keep}
+        entries = self.entries()
+        total = sum(size for _path, size, _last_used in entries)
+        logger.info("GRIB cache {}: {:.1f} GB in {} directories", self.root, total / 1e9, len(entries))
+        now = time.time()
+        removed = []
+        for path, size, last_used in entries:
+            if path in keep:
+                continue
+            if in_progress(path):
+                if self.stale_after is None or now - last_used <= self.stale_after:
+                    logger.info("Keeping {}, it is not yet extracted", path)
+                    continue
+                logger.warning(
+                    "{} is not extracted, but was not used for {:.0f} h: treating it as abandoned",
+                    path,
+                    (now - last_used) / 3600,
+                )
+            too_old = self.max_age is not None and now - last_used > self.max_age
+            too_big = self.quota is not None and total > self.quota
+            if not (too_old or too_big):
+                continue
+            logger.info("Evicting {} ({:.1f} GB, {})", path, size / 1e9, "age" if too_old else "quota")
+            self.remove(path)
+            total -= size
+            removed.append(path)
+        if self.quota is not None and total > self.quota:
+            logger.warning("GRIB cache is still over its quota: {:.1f} GB", total / 1e9)
+        return removed
+
+    def remove(self, path):
+        """Remove the files of a directory, and the directories that are left empty."""
+        for filename in os.listdir(path):
+            fullname = os.path.join(path, filename)
+            if os.path.isfile(fullname) or os.path.islink(fullname):
+                os.remove(fullname)
+        while path != self.root and path.startswith(self.root) and not os.listdir(path):
+            os.rmdir(path)
+            path = os.path.dirname(path)
@@ -0,0 +1,426 @@
+"""GRIB helper functions."""
+
+import json
+import os
+import select
+import time
+
+import numpy as np
+
+from deode.logs import logger
+
+# Header keys stored for every message when scanning a file
+INDEX_KEYS = ["shortName", "typeOfLevel", "level", "stepType", "startStep", "endStep"]
+# Keys of a grib_id that select accumulation windows (see is_window)
+WINDOW_KEYS = ("stepRange", "startStep")
+# Grid keys stored for every message, to tell apart messages on different areas
+GRID_INDEX_KEYS = [
+    "latitudeOfFirstGridPointInDegrees",
+    "longitudeOfFirstGridPointInDegrees",
+    "latitudeOfLastGridPointInDegrees",
+    "longitudeOfLastGridPointInDegrees",
+    "Ni",
+    "Nj",
+]
+
+
+def scan_messages(infile):
+    """List the messages of a GRIB file without decoding their data.
+
+    Args:
+        infile (str): GRIB file name
+
+    Returns:
+        list: one dict per message with offset, length, INDEX_KEYS and grid
+    """
+    from eccodes import codes_get, codes_grib_new_from_file, codes_is_defined, codes_release
+
+    messages = []
+    with open(infile, "rb") as fin:
+        while True:
+            gid = codes_grib_new_from_file(fin, headers_only=True)
+            if gid is None:
+                break
+            entry = {
+                "offset": int(codes_get(gid, "offset")),
+                "length": int(codes_get(gid, "totalLength")),
+            }
+            for key in INDEX_KEYS:
+                entry[key] = codes_get(gid, key)
+            entry["grid"] = [
+                codes_get(gid, key) if codes_is_defined(gid, key) else None
+                for key in GRID_INDEX_KEYS
+            ]
+            codes_release(gid)
+            messages.append(entry)
+    return messages
+
+
+def read_message(infile, offset, headers_only=False):
+    """Load the GRIB message starting at a given byte offset.
+
+    Args:
+        infile (str): GRIB file name
+        offset (int): Byte offset of the message
+        headers_only (bool, optional): Load only the headers, not the data
+
+    Returns:
+        int: eccodes handle
+    """
+    from eccodes import codes_grib_new_from_file
+
+    with open(infile, "rb") as fin:
+        fin.seek(offset)
+        return codes_grib_new_from_file(fin, headers_only=headers_only)
+
+
+def decode_values(gid, dtype=np.float64):
+    """Decode the values of a message, directly as float32 if eccodes supports it.
+
+    Args:
+        gid (int): eccodes handle
+        dtype: numpy.float32 or numpy.float64
+
+    Returns:
+        numpy.ndarray
+    """
+    from eccodes import codes_get_values
+
+    if dtype is np.float32:
+        try:
+            return codes_get_values(gid, np.float32)
+        except TypeError:
+            # Older eccodes versions only decode to double
+            return codes_get_values(gid).astype(np.float32)
+    return codes_get_values(gid)
+
+
+def check_grib_file(infile, min_messages=1):
+    """Check that a GRIB file is complete.
+
+    The file must be non-empty, its last message must end exactly at the end
+    of the file (no truncated message) and it must hold at least min_messages.
+
+    Args:
+        infile (str): GRIB file name
+        min_messages (int, optional): Minimum number of messages. Defaults to 1.
+
+    Returns:
+        bool: True if the file looks complete
+    """
+    if not os.path.isfile(infile):
+        return False
+    size = os.path.getsize(infile)
+    if size == 0:
+        return False
+    try:
+        messages = scan_messages(infile)
+    except Exception as err:  # noqa: BLE001  eccodes raises various errors on corrupt files
+        logger.warning("Could not scan {}: {}", infile, err)
+        return False
+    if len(messages) < min_messages:
+        logger.info("{}: {} messages, expected {}", infile, len(messages), min_messages)
+        return False
+    last = messages[-1]
+    return last["offset"] + last["length"] == size
+
+
+def repack_grib_file(infile, packing=None, bits_per_value=None):
+    """Rewrite a GRIB file with a more compact packing, in place.
+
+    CCSDS (packing "grid_ccsds") is lossless for the same bitsPerValue, but
+    only exists in GRIB2, so GRIB1 messages keep their packing. Lowering
+    bitsPerValue is lossy and works for both editions. Messages that would
+    not get smaller are copied unchanged.
+
+    Args:
+        infile (str): GRIB file name
+        packing (str, optional): eccodes packingType, e.g. "grid_ccsds"
+        bits_per_value (int, optional): maximum number of bits per value
+
+    Returns:
+        tuple: file size before and after
+    """
+    from eccodes import (
+        CodesInternalError,
+        codes_get,
+        codes_get_message,
+        codes_get_message_size,
+        codes_get_values,
+        codes_grib_new_from_file,
+        codes_release,
+        codes_set,
+        codes_set_values,
+        codes_write,
+    )
+
+    size = os.path.getsize(infile)
+    tmpfile = f"{infile}.repack"
+    with open(infile, "rb") as fin, open(tmpfile, "wb") as fout:
+        while True:
+            gid = codes_grib_new_from_file(fin)
+            if gid is None:
+                break
+            original = codes_get_message(gid)
+            try:
+                bits = int(codes_get(gid, "bitsPerValue"))
+                if packing and codes_get(gid, "edition") == 2 and codes_get(gid, "packingType") != packing:
+                    codes_set(gid, "packingType", packing)
+                if bits_per_value and bits > bits_per_value:
+                    values = codes_get_values(gid)
+                    codes_set(gid, "bitsPerValue", bits_per_value)
+                    codes_set_values(gid, values)
+                    del values
+            except CodesInternalError as err:
+                logger.warning("Could not repack a message of {}: {}", infile, err)
+            if codes_get_message_size(gid) < len(original):
+                codes_write(gid, fout)
+            else:
+                fout.write(original)
+            codes_release(gid)
+    os.replace(tmpfile, infile)
+    return size, os.path.getsize(infile)
+
+
+def index_file(infile):
+    """Name of the sidecar index of a GRIB file."""
+    return f"{infile}.idx"
+
+
+def write_index(infile):
+    """Scan a GRIB file and write its sidecar index.
+
+    Returns:
+        list: the indexed messages, as from scan_messages
+    """
+    messages = scan_messages(infile)
+    index = {"size": os.path.getsize(infile), "messages": messages}
+    with open(f"{index_file(infile)}.tmp", "w") as fout:
+        json.dump(index, fout)
+    os.replace(f"{index_file(infile)}.tmp", index_file(infile))
+    return messages
+
+
+def load_index(infile):
+    """Messages of a GRIB file, from its sidecar index if it is up to date.
+
+    Returns:
+        list: the indexed messages, as from scan_messages
+    """
+    idx = index_file(infile)
+    if os.path.isfile(idx):
+        with open(idx) as fin:
+            index = json.load(fin)
+        messages = index["messages"]
+        if index.get("size") == os.path.getsize(infile) and all(
+            key in msg for msg in messages[:1] for key in INDEX_KEYS
+        ):
+            return messages
+        logger.info("Index {} is out of date", idx)
+    return scan_messages(infile)
+
+
+def is_window(start_step, end_step):
+    """Whether a step range is an accumulation window that starts after the forecast start.
+
+    The Accumulator appends these windows with the shortName of their input
+    (or running sum), so a grib_id without a stepRange or startStep must not
+    match them. The running sums since the start do not count as windows.
+    """
+    return 0 < int(start_step) < int(end_step)
+
+
+def message_matches(message, grib_id):
+    """Check an indexed message against a grib_id from a parameter list.
+
+    Only the keys that are in the index are compared, so a match means the
+    message may be needed, not that it is. Accumulation windows only match
+    a grib_id that asks for a stepRange or startStep.
+    """
+    for key in INDEX_KEYS:
+        if key not in grib_id or message.get(key) is None:
+            continue
+        wanted = grib_id[key] if isinstance(grib_id[key], list) else [grib_id[key]]
+        if str(message[key]) not in [str(value) for value in wanted]:
+            return False
+    if not any(key in grib_id for key in WINDOW_KEYS) and is_window(
+        message.get("startStep", 0), message.get("endStep", 0)
+    ):
+        return False
+    return True
+
+
+def select_messages(messages, param_list):
+    """Messages that match any grib_id of a parameter list.
+
+    Args:
+        messages (list): indexed messages
+        param_list (list): parameter list (harp_param, grib_id, common, ...)
+
+    Returns:
+        list: the matching messages, in file order
+    """
+    grib_ids = []
+    for param in param_list:
+        ids = param["grib_id"] if isinstance(param["grib_id"], list) else [param["grib_id"]]
+        for grib_id in ids:
+            grib_ids.append({**param.get("common", {}), **grib_id})
+    return [msg for msg in messages if any(message_matches(msg, gid) for gid in grib_ids)]
+
+
+def write_subset(infile, messages, outfile):
+    """Copy some messages of a GRIB file to a new file, without decoding them."""
+    with open(infile, "rb") as fin, open(outfile, "wb") as fout:
+        for msg in messages:
+            fin.seek(msg["offset"])
+            remaining = msg["length"]
+            while remaining > 0:
+                block = fin.read(min(remaining, 1 << 24))
+                if not block:
+                    break
+                fout.write(block)
+                remaining -= len(block)
+
+
+def group_by_grid(messages):
+    """Split indexed messages by grid (e.g. the tiles of a tiled retrieval).
+
+    Returns:
+        list: lists of messages, in order of first appearance
+    """
+    groups = {}
+    for msg in messages:
+        groups.setdefault(tuple(msg.get("grid") or []), []).append(msg)
+    return list(groups.values())
+
+
+def grid_box(message):
+    """Area [N, W, S, E] covered by the grid of an indexed message (None if unknown)."""
+    grid = message.get("grid")
+    if not grid or None in grid[:4]:
+        return None
+    lat1, lon1, lat2, lon2 = grid[:4]
+    return [max(lat1, lat2), lon1, min(lat1, lat2), lon2]
+
+
+def split_grib_stream(stream, tag, expected=None, on_step=None):
+    """Split a stream of GRIB messages into {tag}_{step}.grib1 files.
+
+    Messages are read one at a time and copied unchanged, so the stream
+    (e.g. a download that holds all steps) never has to be on disk as a
+    whole. The files are written in the working directory.
+
+    Args:
+        stream: file-like object with a read method
+        tag (str): file type, "sfc" or "ua"
+        expected (callable, optional): expected(step) gives the number of
+            messages of a step, or None if it is not known in advance. The
+            stream is ordered by step, so a step without a known number is
+            complete when the first message of another step arrives.
+        on_step (callable, optional): called with the step (str) as soon as
+            a file has its expected number of messages
+
+    Returns:
+        dict: number of messages per step (str)
+
+    Raises:
+        RuntimeError: If a step has more messages than expected.
+    """
+    from eccodes import StreamReader
+
+    outputs = {}
+    counts = {}
+    try:
+        for msg in StreamReader(stream):
+            step = str(msg.get("endStep"))
+            if step in counts and step not in outputs:
+                raise RuntimeError(f"More messages than expected for {tag}_{step}.grib1")
+            if step not in outputs:
+                if expected is not None:
+                    for other in [other for other in outputs if expected(other) is None]:
+                        outputs.pop(other).close()
+                        if on_step is not None:
+                            on_step(other)
+                outputs[step] = open(f"{tag}_{step}.grib1", "wb")
+            msg.write_to(outputs[step])
+            counts[step] = counts.get(step, 0) + 1
+            if expected is not None and counts[step] == expected(step):
+                outputs.pop(step).close()
+                if on_step is not None:
+                    on_step(step)
+    finally:
+        for fout in outputs.values():
+            fout.close()
+    return counts
+
+
+class WatchedStream:
+    """Read end of a named pipe that gives up when the data stop arriving.
+
+    The pipe is opened without blocking, so a writer that never starts
+    (e.g. a request waiting in a queue) is noticed as well. A read waits
+    for data in steps of poll seconds. If no data arrived queue_timeout
+    seconds after the start, or no data for stall_timeout seconds, the
+    stream ends early and the reason is kept in timed_out.
+    """
+
+    def __init__(self, path, stall_timeout=0, queue_timeout=0, poll=5):
+        """Open the pipe.
+
+        Args:
+            path (str): named pipe
+            stall_timeout (float, optional): end the stream after this many
+                seconds without data. 0 (default) waits forever.
+            queue_timeout (float, optional): end the stream if no data at all
+                arrived this many seconds after it was opened. 0 (default)
+                waits forever.
+            poll (float, optional): seconds between timeout checks
+        """
+        self.fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+        self.stall_timeout = stall_timeout
+        self.queue_timeout = queue_timeout
+        self.poll = poll
+        self.started = self.changed = time.time()
+        self.received = 0
+        self.timed_out = None
+
+    def read(self, size):
+        """Read size bytes, fewer at the end of the stream or after a timeout."""
+        data = bytearray()
+        while len(data) < size and self.timed_out is None:
+            ready, _, _ = select.select([self.fd], [], [], self.poll)
+            if not ready:
+                self.timed_out = self.check_health()
+                continue
+            try:
+                chunk = os.read(self.fd, size - len(data))
+            except BlockingIOError:
+                continue
+            if not chunk:
+                break
+            data += chunk
+            self.received += len(chunk)
+            self.changed = time.time()
+        return bytes(data)
+
+    def check_health(self):
+        """Check the stream for stalls and queue problems.
+
+        Returns:
+            str: why the stream should be given up, or None if it is healthy
+        """
+        now = time.time()
+        if self.queue_timeout and self.received == 0 and now - self.started > self.queue_timeout:
+            return f"received no data in {now - self.started:.0f} s"
+        if self.stall_timeout and now - self.changed > self.stall_timeout:
+            return f"stalled for {now - self.changed:.0f} s"
+        return None
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,124 @@
+"""Ledger of the extracted steps, so reruns only extract what is new or has changed.
+
+Every extracted parameter of every step is recorded in a small SQLite file in
+sqlite_path once its rows have been written. An entry is keyed by model,
+basetime, tag, step and a hash of the parameter definition (grib_id, method
+or function, station list checksum, output settings), and holds the
+fingerprint of the GRIB file it was extracted from. A parameter is extracted
+again if the file has changed, e.g. after a new retrieval, or if its
+definition has changed; a new parameter in a list is the only one extracted.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import time
+
+from deode.logs import logger
+from .gributils import index_file
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS ledger ("
+    "model TEXT, basetime TEXT, tag TEXT, step TEXT, unit TEXT, fingerprint TEXT, "
+    "harp_param TEXT, extracted REAL, "
+    "PRIMARY KEY (model, basetime, tag, step, unit))"
+)
+
+
+def file_fingerprint(infile):
+    """Fingerprint of a GRIB file: size, modification time and the sha1 of its sidecar index.
+
+    The file itself is not read, the index (written by RetrieveDT) lists the
+    header keys of every message.
+    """
+    stat = os.stat(infile)
+    sha = hashlib.sha1(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    if os.path.isfile(index_file(infile)):
+        with open(index_file(infile), "rb") as fin:
+            sha.update(fin.read())
+    return sha.hexdigest()
+
+
+def unit_key(definition):
+    """Hash of a parameter definition (a json serializable dict)."""
+    return hashlib.sha1(json.dumps(definition, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ExtractionLedger:
+    """Extracted parameters of the steps of one forecast."""
+
+    def __init__(self, path, model_name, basetime):
+        """Open (or create) the ledger.
+
+        Args:
+            path (str): ledger file
+            model_name (str): model name
+            basetime (datetime): forecast start
+        """
+        self.path = path
+        self.model_name = model_name
+        self.basetime = basetime.strftime("%Y%m%d%H")
+        # Entries of this run, recorded when the rows have been written
+        self.pending = []
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connect() as con:
+            con.execute(SCHEMA)
+
+    def connect(self):
+        """Connection to the ledger file."""
+        return sqlite3.connect(self.path, timeout=600)
+
+    def done(self, tag, step, fingerprint):
+        """Units already extracted from this version of a file.
+
+        Returns:
+            set: unit keys
+        """
+        con = self.connect()
+        try:
+            rows = con.execute(
+                "SELECT unit FROM ledger WHERE model = ? AND basetime = ? AND tag = ? "
+                "AND step = ? AND fingerprint = ?",
+                (self.model_name, self.basetime, tag, str(step), fingerprint),
+            ).fetchall()
+        finally:
+            con.close()
+        return {row[0] for row in rows}
+
+    def add(self, tag, step, fingerprint, units):
+        """Remember units extracted in this run.
+
+        Args:
+            tag (str): file type, "sfc" or "ua"
+            step (str): forecast step
+            fingerprint (str): from file_fingerprint
+            units (dict): unit key -> harp parameter
+        """
+        for unit, harp_param in units.items():
+            self.pending.append(
+                (self.model_name, self.basetime, tag, str(step), unit, fingerprint, harp_param)
+            )
+
+    def commit(self):
+        """Record the units of this run, after their rows have been written.
+
+        Returns:
+            int: number of recorded units
+        """
+        if not self.pending:
+            return 0
+        now = time.time()
+        con = self.connect()
+        try:
+            with con:
+                con.executemany(
+                    "INSERT OR REPLACE INTO ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    [(*entry, now) for entry in self.pending],
+                )
+        finally:
+            con.close()
+        count = len(self.pending)
+        logger.info("Recorded {} extracted parameters in {}", count, self.path)
+        self.pending = []
+        return count
@@ -0,0 +1,103 @@
+"""Cached loading of the parameter and station lists.
+
+Every list is parsed and validated once. The parsed list is kept in memory
+for the rest of the process and, with a cache directory, pickled together
+with the checksum of the file. The pickle is keyed by path, size, mtime and
+the checksum of the content, so a list that was replaced by one of the same
+size and mtime (e.g. copied with its timestamps) is not mistaken for the
+old one. Later tasks only hash the (small) file, without parsing it again.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+
+from deode.logs import logger
+from deode.os_utils import deodemakedirs
+from .points import FUNCTIONS
+from .weights_cache import file_checksum
+
+# (path, size, mtime, checksum) -> (parsed list, checksum)
+_LOADED = {}
+
+
+def parse_param_list(path):
+    """Read and check a parameter list (json).
+
+    Raises:
+        RuntimeError: If an entry has no harp_param or grib_id, or an unknown function.
+    """
+    with open(path) as fin:
+        param_list = json.load(fin)
+    for param in param_list:
+        if "harp_param" not in param or not param.get("grib_id"):
+            raise RuntimeError(f"{path}: parameter without harp_param or grib_id: {param}")
+        if "function" in param and param["function"] not in FUNCTIONS:
+            raise RuntimeError(f"{path}: unknown function {param['function']} for {param['harp_param']}")
+    return param_list
+
+
+def parse_station_list(path):
+    """Read and check a station list (csv with at least SID, lat and lon).
+
+    Raises:
+        RuntimeError: If a column is missing.
+    """
+    import pandas
+
+    stations = pandas.read_csv(path, skipinitialspace=True)
+    missing = [col for col in ("SID", "lat", "lon") if col not in stations.columns]
+    if missing:
+        raise RuntimeError(f"{path}: missing columns {', '.join(missing)}")
+    return stations
+
+
+PARSERS = {
+    "params": parse_param_list,
+    "stations": parse_station_list,
+}
+
+
+def load_list(path, kind, cache_dir=None, unix_group=None):
+    """Parsed parameter ("params") or station ("stations") list, and the checksum of its file.
+
+    Args:
+        path (str): list file
+        kind (str): "params" or "stations"
+        cache_dir (str, optional): directory for the pickled lists
+        unix_group (str, optional): group of a newly created cache directory
+
+    Returns:
+        tuple: (parsed list, sha1 checksum of the file)
+    """
+    stat = os.stat(path)
+    checksum = file_checksum(path)
+    key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns, checksum)
+    if key in _LOADED:
+        return _LOADED[key]
+    cache_file = None
+    if cache_dir:
+        name = hashlib.sha1(repr(key).encode()).hexdigest()
+        cache_file = os.path.join(cache_dir, f"{kind}_{name}.pkl")
+        if os.path.isfile(cache_file):
+            try:
+                with open(cache_file, "rb") as fin:
+                    entry = pickle.load(fin)
+                if entry["key"] == key:
+                    _LOADED[key] = entry["data"], entry["checksum"]
+                    return _LOADED[key]
+            except (OSError, EOFError, KeyError, pickle.UnpicklingError) as err:
+                logger.warning("Ignoring list cache {}: {}", cache_file, err)
+
+    data = PARSERS[kind](path)
+    _LOADED[key] = data, checksum
+    if cache_file:
+        if not os.path.exists(cache_dir):
+            deodemakedirs(cache_dir, unixgroup=unix_group)
+        tmpfile = f"{cache_file}.{os.getpid()}"
+        with open(tmpfile, "wb") as fout:
+            pickle.dump({"key": key, "data": data, "checksum": checksum}, fout)
+        os.replace(tmpfile, cache_file)
+        logger.info("Cached {} list {}", kind, path)
+    return data, checksum
@@ -0,0 +1,303 @@
+"""Split a MARS request into chunks and run them in parallel.
+
+The clients are supervised while they run: a chunk whose log and output
+files stop growing (stall), or that has not received any data long after
+it was started (stuck in the MARS queue), is cancelled and resubmitted
+without waiting for the rest of the request.
+"""
+
+import os
+import shutil
+import subprocess
+import time
+
+from deode.logs import logger
+
+
+class MarsChunk:
+    """One part of a split MARS request."""
+
+    def __init__(self, name, request, steps):
+        """Construct the chunk.
+
+        Args:
+            name (str): Chunk name, also used as its working directory
+            request (dict): MARS request for this chunk
+            steps (list): Steps (str) retrieved by this chunk
+        """
+        self.name = name
+        self.request = request
+        self.steps = steps
+        self.attempts = 0
+        self.process = None
+        self.done = False
+        # Supervision of the running client
+        self.started = None
+        self.changed = None
+        self.sizes = None
+        self.retrieved = 0
+
+    @property
+    def logfile(self):
+        """Output of the MARS client for this chunk."""
+        return f"{self.name}.log"
+
+    def output_sizes(self):
+        """Sizes of the client log and of the data retrieved by the running try.
+
+        Returns:
+            tuple: (log bytes, data bytes)
+        """
+        log_size = os.path.getsize(self.logfile) if os.path.exists(self.logfile) else 0
+        data_size = 0
+        if os.path.isdir(self.name):
+            for entry in os.scandir(self.name):
+                if entry.is_file() and entry.name != "mars.req":
+                    data_size += entry.stat().st_size
+        return log_size, data_size
+
+
+def last_line(logfile):
+    """Last non-empty line of a log file, to report why a client is waiting."""
+    if not os.path.exists(logfile):
+        return ""
+    with open(logfile, "rb") as fin:
+        fin.seek(max(0, os.path.getsize(logfile) - 4096))
+        lines = [line.strip() for line in fin.read().decode(errors="replace").splitlines()]
+    lines = [line for line in lines if line]
+    return lines[-1] if lines else ""
+
+
+def split_list(items, size):
+    """Split a list in sublists of (at most) size elements, or not at all if size <= 0."""
+    if size <= 0:
+        return [items]
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+class MarsScheduler:
+    """Run chunks of a MARS request with a bounded number of concurrent clients.
+
+    Every chunk runs in its own directory, so failed chunks can be retried on
+    their own. As soon as all chunks covering a step have finished, the
+    partial files of that step are joined into {tag}_{step}.grib1 in the
+    working directory. A request for several dates (backfill) gives
+    {tag}_{date}_{step}.grib1 files instead.
+    """
+
+    def __init__(
+        self, command, write_request, nworkers=1, max_retries=0, poll=5,
+        stall_timeout=0, queue_timeout=0, on_progress=None,
+    ):
+        """Construct the scheduler.
+
+        Args:
+            command (list): MARS command (with launcher), the request file is appended
+            write_request (callable): write_request(request, filename) writes a request file
+            nworkers (int, optional): Number of concurrent MARS clients. Defaults to 1.
+            max_retries (int, optional): Retries for a failed chunk. Defaults to 0.
+            poll (float, optional): Seconds between checks of the running clients.
+            stall_timeout (float, optional): Cancel a chunk whose log and data have not
+                grown for this many seconds. Defaults to 0 (never).
+            queue_timeout (float, optional): Cancel a chunk that has not received any
+                data this many seconds after it was started. Defaults to 0 (never).
+            on_progress (callable, optional): called after every check with a dict of
+                chunks (total, done, running, failed), bytes and stalled (seconds since
+                the last data of the running chunks)
+        """
+        self.command = command
+        self.write_request = write_request
+        self.nworkers = max(1, nworkers)
+        self.max_retries = max_retries
+        self.poll = poll
+        self.stall_timeout = stall_timeout
+        self.queue_timeout = queue_timeout
+        self.on_progress = on_progress
+
+    @staticmethod
+    def split(request, tag, steps, step_chunk=0, param_chunk=0, areas=None, dates=None):
+        """Split a request in chunks of steps, parameters and/or areas.
+
+        Args:
+            request (dict): Full request, with "step" and "param" keys
+            tag (str): File type, "sfc" or "ua"
+            steps (list): Requested steps
+            step_chunk (int, optional): Steps per chunk, 0 for no splitting.
+            param_chunk (int, optional): Parameters per chunk, 0 for no splitting.
+            areas (list, optional): One chunk per MARS area (tiles).
+            dates (list, optional): Dates (YYYYMMDD) retrieved by every chunk, in this order.
+
+        Returns:
+            list: MarsChunk objects
+        """
+        params = request["param"].split("/")
+        chunks = []
+        for istep, step_list in enumerate(split_list(steps, step_chunk)):
+            for iparam, param_list in enumerate(split_list(params, param_chunk)):
+                for iarea, area in enumerate(areas or [None]):
+                    chunk_request = dict(request)
+                    chunk_request["step"] = "/".join(step_list)
+                    chunk_request["param"] = "/".join(param_list)
+                    chunk_request["target"] = f"\"{tag}_[STEP].grib1\""
+                    if dates:
+                        chunk_request["date"] = "/".join(dates)
+                        chunk_request["target"] = f"\"{tag}_[DATE]_[STEP].grib1\""
+                    name = f"{tag}_chunk_{istep}_{iparam}"
+                    if area is not None:
+                        chunk_request["area"] = area
+                        name += f"_{iarea}"
+                    chunks.append(MarsChunk(name, chunk_request, step_list))
+        return chunks
+
+    def start(self, chunk):
+        """Launch the MARS client for a chunk in a clean directory."""
+        shutil.rmtree(chunk.name, ignore_errors=True)
+        os.makedirs(chunk.name)
+        reqfile = os.path.join(chunk.name, "mars.req")
+        self.write_request(chunk.request, reqfile)
+        chunk.attempts += 1
+        chunk.started = chunk.changed = time.time()
+        chunk.sizes = None
+        logger.info(
+            "Starting MARS chunk {} (try {}), steps {}", chunk.name, chunk.attempts, chunk.request["step"]
+        )
+        with open(chunk.logfile, "a") as log:
+            chunk.process = subprocess.Popen(
+                [*self.command, "mars.req"], cwd=chunk.name, stdout=log, stderr=subprocess.STDOUT
+            )
+
+    def run(self, chunks, tag, on_step=None, dates=None):
+        """Run all chunks and join the per-step files.
+
+        Args:
+            chunks (list): MarsChunk objects
+            tag (str): File type, "sfc" or "ua"
+            on_step (callable, optional): called with the step (str) when a file is complete
+            dates (list, optional): Dates of a multi-date request, as given to split
+
+        Returns:
+            list: chunks that failed after all retries
+        """
+        queue = list(chunks)
+        running = []
+        failed = []
+        joined = set()
+        while queue or running:
+            while queue and len(running) < self.nworkers:
+                chunk = queue.pop(0)
+                self.start(chunk)
+                running.append(chunk)
+            time.sleep(self.poll)
+            for chunk in list(running):
+                status = chunk.process.poll()
+                if status is None:
+                    problem = self.check_health(chunk)
+                    if problem is None:
+                        continue
+                    logger.warning("MARS chunk {} {}, cancelling. Last output: {}",
+                                   chunk.name, problem, last_line(chunk.logfile))
+                    self.cancel(chunk)
+                    status = problem
+                running.remove(chunk)
+                if status == 0:
+                    logger.info("MARS chunk {} finished", chunk.name)
+                    chunk.done = True
+                    chunk.retrieved = chunk.output_sizes()[1]
+                elif chunk.attempts <= self.max_retries:
+                    logger.warning("MARS chunk {} failed ({}), retrying", chunk.name, status)
+                    queue.append(chunk)
+                else:
+                    logger.error("MARS chunk {} failed ({}), see {}", chunk.name, status, chunk.logfile)
+                    failed.append(chunk)
+            if self.on_progress is not None:
+                self.on_progress(self.progress(chunks, running, failed))
+            for step in self.completed_steps(chunks, joined):
+                joined.add(step)
+                if self.join_step(chunks, tag, step, dates) and on_step is not None:
+                    on_step(step)
+        for chunk in chunks:
+            if chunk.done:
+                shutil.rmtree(chunk.name, ignore_errors=True)
+        return failed
+
+    def check_health(self, chunk):
+        """Check a running chunk for stalls and queue problems.
+
+        Returns:
+            str: why the chunk should be cancelled, or None if it is healthy
+        """
+        now = time.time()
+        sizes = chunk.output_sizes()
+        if sizes != chunk.sizes:
+            chunk.sizes = sizes
+            chunk.changed = now
+        if self.queue_timeout and sizes[1] == 0 and now - chunk.started > self.queue_timeout:
+            return f"received no data in {now - chunk.started:.0f} s"
+        if self.stall_timeout and now - chunk.changed > self.stall_timeout:
+            return f"stalled for {now - chunk.changed:.0f} s"
+        return None
+
+    @staticmethod
+    def cancel(chunk, grace=10):
+        """Stop the client of a chunk, forcibly if it does not stop within grace seconds."""
+        chunk.process.terminate()
+        try:
+            chunk.process.wait(grace)
+        except subprocess.TimeoutExpired:
+            chunk.process.kill()
+            chunk.process.wait()
+
+    @staticmethod
+    def progress(chunks, running, failed):
+        """State of the request, for on_progress."""
+        now = time.time()
+        return {
+            "chunks": len(chunks),
+            "done": sum(chunk.done for chunk in chunks),
+            "running": len(running),
+            "failed": len(failed),
+            "bytes": sum(chunk.retrieved for chunk in chunks)
+            + sum(chunk.sizes[1] for chunk in running if chunk.sizes),
+            "stalled": max((now - chunk.changed for chunk in running), default=0.0),
+        }
+
+    @staticmethod
+    def completed_steps(chunks, joined):
+        """Steps for which all chunks have finished, and which are not joined yet."""
+        steps = []
+        for chunk in chunks:
+            for step in chunk.steps:
+                if step in joined or step in steps:
+                    continue
+                if all(c.done for c in chunks if step in c.steps):
+                    steps.append(step)
+        return steps
+
+    @staticmethod
+    def join_step(chunks, tag, step, dates=None):
+        """Join the partial files of one step into {tag}_{step}.grib1.
+
+        For a multi-date request, {tag}_{date}_{step}.grib1 is joined for every date.
+
+        Returns:
+            bool: False if no data was retrieved for this step
+        """
+        fnames = [f"{tag}_{date}_{step}.grib1" for date in dates] if dates else [f"{tag}_{step}.grib1"]
+        joined = False
+        for fname in fnames:
+            parts = [os.path.join(c.name, fname) for c in chunks if step in c.steps]
+            parts = [part for part in parts if os.path.exists(part)]
+            if not parts:
+                logger.warning("No data retrieved for {}", fname)
+                continue
+            joined = True
+            if len(parts) == 1:
+                os.replace(parts[0], fname)
+                continue
+            with open(f"{fname}.tmp", "wb") as fout:
+                for part in parts:
+                    with open(part, "rb") as fin:
+                        shutil.copyfileobj(fin, fout, 1 << 24)
+                    os.remove(part)
+            os.replace(f"{fname}.tmp", fname)
+        return joined
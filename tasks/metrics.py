@@ -0,0 +1,135 @@
+"""Per-stage timing and throughput metrics of the DT tasks.
+
+Every stage (retrieval, landing, accumulation, extraction, writing, ...)
+appends one JSON line with its wall time and counters to a metrics file,
+by default metrics.jsonl next to extracted_files.log in sqlite_path.
+"""
+
+import json
+import os
+import subprocess
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from deode.logs import logger
+
+
+class Metrics:
+    """Collect stage records, write them as JSON lines and summarize them."""
+
+    def __init__(self, path=None, task="", basetime=None, ecflow=False):
+        """Construct the collector.
+
+        Args:
+            path (str, optional): JSON-lines file, None to only keep the totals
+            task (str, optional): task name, added to every record
+            basetime (datetime, optional): forecast start, added to every record
+            ecflow (bool, optional): also export a summary label and step meter to ecFlow
+        """
+        self.path = path
+        self.task = task
+        self.basetime = basetime.isoformat() if basetime is not None else None
+        self.ecflow = ecflow and "ECF_NAME" in os.environ
+        # stage -> summed counters
+        self.totals = {}
+
+    def write(self, stage, tag=None, step=None, wall=0.0, **counters):
+        """Store one record.
+
+        Args:
+            stage (str): stage name
+            tag (str, optional): file type, "sfc" or "ua"
+            step (str, optional): forecast step
+            wall (float, optional): wall time in seconds
+            counters: e.g. bytes_read, bytes_written, messages, stations, rows
+        """
+        record = {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "task": self.task,
+            "basetime": self.basetime,
+            "stage": stage,
+            "tag": tag,
+            "step": step,
+            "wall": round(wall, 3),
+            **counters,
+        }
+        total = self.totals.setdefault(stage, {"count": 0, "wall": 0.0})
+        total["count"] += 1
+        total["wall"] += wall
+        for key, value in counters.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                total[key] = total.get(key, 0) + value
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as fout:
+                fout.write(json.dumps(record) + "\n")
+
+    @contextmanager
+    def stage(self, stage, tag=None, step=None, **counters):
+        """Time a block of code and store its record.
+
+        The yielded dict holds the counters, which the block can update.
+        A failing block is recorded with status "failed".
+        """
+        start = time.time()
+        status = "ok"
+        try:
+            yield counters
+        except BaseException:
+            status = "failed"
+            raise
+        finally:
+            self.write(stage, tag, step, time.time() - start, status=status, **counters)
+
+    def summary(self):
+        """Log the totals per stage, with throughput, and export them as an ecFlow label."""
+        lines = []
+        for stage, total in self.totals.items():
+            line = f"{stage}: {total['count']}x {total['wall']:.1f}s"
+            for key, value in total.items():
+                if key in ("count", "wall"):
+                    continue
+                line += f" {key}={value}"
+                if key.startswith("bytes") and total["wall"] > 0:
+                    line += f" ({value / total['wall'] / 1e6:.1f} MB/s)"
+            lines.append(line)
+            logger.info("METRICS {}", line)
+        self.label("metrics", "; ".join(lines))
+
+    def label(self, name, value):
+        """Set an ecFlow label of the running task."""
+        self.ecflow_client(f"--label={name}", value)
+
+    def meter(self, name, value):
+        """Set an ecFlow meter of the running task."""
+        self.ecflow_client(f"--meter={name}", str(value))
+
+    def ecflow_client(self, *args):
+        """Call ecflow_client, if ecFlow export is enabled. Failures are only logged."""
+        if not self.ecflow:
+            return
+        try:
+            subprocess.run(["ecflow_client", *args], check=True, capture_output=True, text=True)
+        except (OSError, subprocess.CalledProcessError) as err:
+            logger.warning("ecflow_client {} failed: {}", args[0], err)
+
+
+def task_metrics(task, name):
+    """Metrics collector of a task, writing to extractsqlite.metrics_file in sqlite_path.
+
+    Args:
+        task (deode.tasks.base.Task): the task, with config, platform and basetime
+        name (str): task name
+
+    Returns:
+        Metrics
+    """
+    metrics_file = task.config.get("extractsqlite.metrics_file", "metrics.jsonl")
+    path = None
+    if metrics_file:
+        sqlite_path = task.platform.substitute(task.config["extractsqlite.sqlite_path"])
+        path = os.path.join(sqlite_path, metrics_file)
+    return Metrics(
+        path, name, task.basetime, ecflow=task.config.get("extractsqlite.metrics_ecflow", False)
+    )
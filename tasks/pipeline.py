@@ -0,0 +1,99 @@
+"""Hand-over of retrieved steps from RetrieveDT to ExtractDT.
+
+RetrieveDT appends every step that has landed (and has been validated) in
+dt_path to a small {tag}.ready file, and a final "complete" line when the
+retrieval of that tag has finished, or a "failed" line when it has given
+up. In pipelined mode ExtractDT polls this file and extracts each step as
+soon as it appears.
+
+ExtractDT is triggered by the READY_EVENT of RetrieveDT, which is set once
+the ready files of the run have been reset. ecFlow clears the event when
+RetrieveDT is requeued, so the ready files of an earlier run are never read.
+When all its profiles are extracted, ExtractDT writes an "extracted" file, so
+CleanupDT knows which directories are still needed.
+"""
+
+import os
+import subprocess
+
+from deode.logs import logger
+
+COMPLETE = "complete"
+FAILED = "failed"
+READY_EVENT = "ready"
+EXTRACTED = "extracted"
+
+
+def ready_file(path, tag):
+    """Name of the ready file for a tag."""
+    return os.path.join(path, f"{tag}.ready")
+
+
+def reset_ready(path, tag):
+    """Start a new ready file."""
+    with open(ready_file(path, tag), "w"):
+        pass
+
+
+def mark_ready(path, tag, step):
+    """Mark one step as ready for extraction."""
+    with open(ready_file(path, tag), "a") as fout:
+        fout.write(f"{step}\n")
+
+
+def mark_complete(path, tag):
+    """Mark the retrieval of a tag as finished."""
+    mark_ready(path, tag, COMPLETE)
+
+
+def mark_failed(path, tag):
+    """Mark the retrieval of a tag as failed for good."""
+    mark_ready(path, tag, FAILED)
+
+
+def set_ready_event():
+    """Set the READY_EVENT of the running ecFlow task. Failures are only logged."""
+    if "ECF_NAME" not in os.environ:
+        return
+    try:
+        subprocess.run(
+            ["ecflow_client", f"--event={READY_EVENT}"], check=True, capture_output=True, text=True
+        )
+    except (OSError, subprocess.CalledProcessError) as err:
+        logger.warning("ecflow_client --event={} failed: {}", READY_EVENT, err)
+
+
+def read_ready(path, tag):
+    """Read the ready file.
+
+    Returns:
+        tuple: (set of ready steps, COMPLETE or FAILED if the retrieval has finished, else None)
+    """
+    fname = ready_file(path, tag)
+    if not os.path.isfile(fname):
+        return set(), None
+    with open(fname) as fin:
+        lines = {line.strip() for line in fin if line.strip()}
+    status = FAILED if FAILED in lines else COMPLETE if COMPLETE in lines else None
+    lines -= {COMPLETE, FAILED}
+    return lines, status
+
+
+def mark_extracted(path):
+    """Mark the files of a directory as extracted."""
+    with open(os.path.join(path, EXTRACTED), "w"):
+        pass
+
+
+def in_progress(path):
+    """Whether a directory is still being retrieved, or not yet extracted.
+
+    Directories without ready files were not written by RetrieveDT, and are
+    never in progress.
+    """
+    tags = [fname[: -len(".ready")] for fname in os.listdir(path) if fname.endswith(".ready")]
+    if not tags:
+        return False
+    if any(read_ready(path, tag)[1] != COMPLETE for tag in tags):
+        return True
+    return not os.path.isfile(os.path.join(path, EXTRACTED))
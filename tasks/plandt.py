@@ -0,0 +1,163 @@
+"""PlanDT."""
+
+import json
+import os
+import subprocess
+
+from deode.datetime_utils import as_datetime
+from deode.logs import logger
+from .accumulation import accumulation_settings
+from .marsscheduler import MarsScheduler
+from .planner import estimate, list_request, plan_dates
+from .retrievedt import RetrieveDT
+
+
+class PlanDT(RetrieveDT):
+    """Dry run of the retrieval of a whole suite.
+
+    Writes every request RetrieveDT would send, per date (or backfill
+    group), tag and chunk, with estimates of the number of fields, bytes and
+    disk space, and optionally checks the availability of the data with
+    MARS LIST requests. Nothing is retrieved.
+    """
+
+    def __init__(self, config):
+        """Construct PlanDT task object.
+
+        Args:
+            config (deode.ParsedConfig): Configuration
+        """
+        RetrieveDT.__init__(self, config)
+        self.start = as_datetime(self.config["general.times.start"])
+        self.end = as_datetime(self.config["general.times.end"])
+        self.plan_path = self.platform.substitute(self.config.get("extract_dt.plan_path", "plan"))
+        # Run the MARS LIST requests
+        self.plan_list = self.config.get("extract_dt.plan_list", False)
+        # Bits per value of the retrieved fields
+        self.plan_bits = int(self.config.get("extract_dt.plan_bits_per_value", 16))
+        # Retrieval rate (MB/s) for the walltime estimate
+        self.plan_rate = self.config.get("extract_dt.plan_rate", None)
+
+    def execute(self):
+        """Write the requests and the plan summary."""
+        group_days = 1
+        if self.backfill:
+            group_days = int(self.config.get("extract_dt.backfill_group_days", 7))
+        groups = plan_dates(self.start, self.end, group_days)
+        os.makedirs(self.plan_path, exist_ok=True)
+        entries = []
+        for group in groups:
+            day = self.for_date(group[0])
+            dates = [date.strftime("%Y%m%d") for date in group] if len(group) > 1 else None
+            group_dir = os.path.join(self.plan_path, group[0].strftime("%Y%m%d"))
+            os.makedirs(group_dir, exist_ok=True)
+            for tag in self.config["extract_dt.paramtypes"]:
+                request = day.create_request(tag)
+                if self.method == "mars":
+                    chunks = MarsScheduler.split(
+                        request,
+                        tag,
+                        self.steplist,
+                        step_chunk=int(self.config.get("extract_dt.chunk_steps", 0)),
+                        param_chunk=int(self.config.get("extract_dt.chunk_params", 0)),
+                        areas=self.areas(tag) if len(self.areas(tag)) > 1 else None,
+                        dates=dates,
+                    )
+                    requests = [(chunk.name, chunk.request) for chunk in chunks]
+                else:
+                    # Polytope gets one request per date
+                    requests = [
+                        (f"{tag}_{date:%Y%m%d}", self.for_date(date).create_request(tag))
+                        for date in group
+                    ]
+                for name, chunk_request in requests:
+                    entry = {
+                        "dates": [date.strftime("%Y%m%d") for date in group],
+                        "tag": tag,
+                        "chunk": name,
+                        "area": chunk_request.get("area"),
+                        **estimate(chunk_request, self.plan_bits),
+                    }
+                    reqfile = os.path.join(group_dir, f"{name}.req")
+                    self.write_mars_req(chunk_request, reqfile, "retrieve")
+                    entry["request"] = reqfile
+                    if self.method == "mars":
+                        listfile = os.path.join(group_dir, f"{name}.list")
+                        self.write_mars_req(list_request(chunk_request), listfile, "list")
+                        entry["list"] = listfile
+                        if self.plan_list:
+                            entry["available"] = self.run_list(listfile)
+                    entries.append(entry)
+
+        summary = self.summary(entries, len(groups))
+        with open(os.path.join(self.plan_path, "plan.json"), "w") as fout:
+            json.dump({"summary": summary, "requests": entries}, fout, indent=1)
+        for key, value in summary.items():
+            logger.info("PLAN {}: {}", key, value)
+        logger.info("Requests written to {}", self.plan_path)
+
+    def run_list(self, listfile):
+        """Run a MARS LIST request, its output is written next to it.
+
+        Returns:
+            bool: whether MARS found the data
+        """
+        outfile = f"{listfile}.out"
+        with open(outfile, "w") as fout:
+            status = subprocess.run(
+                [self.get_binary("mars"), os.path.basename(listfile)],
+                cwd=os.path.dirname(listfile),
+                stdout=fout,
+                stderr=subprocess.STDOUT,
+                check=False,
+            ).returncode
+        if status != 0:
+            logger.warning("MARS LIST failed for {}, see {}", listfile, outfile)
+        return status == 0
+
+    def summary(self, entries, ngroups):
+        """Totals of the plan, and the disk and memory needs.
+
+        Args:
+            entries (list): planned requests
+            ngroups (int): number of dates or backfill groups
+
+        Returns:
+            dict
+        """
+        total = sum(entry["bytes"] for entry in entries)
+        ndates = len({date for entry in entries for date in entry["dates"]})
+        per_date = total / max(1, ndates)
+        npoints = max((entry["points"] for entry in entries), default=0)
+        # One running sum per retrieved area
+        sfc_points = sum(
+            {entry["area"]: entry["points"] for entry in entries if entry["tag"] == "sfc"}.values()
+        )
+        summary = {
+            "dates": ndates,
+            "requests": ngroups * len(self.config["extract_dt.paramtypes"]),
+            "chunks": len(entries),
+            "fields": sum(entry["fields"] for entry in entries),
+            "total_gb": round(total / 1e9, 3),
+            "per_date_gb": round(per_date / 1e9, 3),
+        }
+        stored = per_date
+        if self.cache_bits:
+            # After repacking in dt_grib_path
+            stored = per_date * int(self.cache_bits) / self.plan_bits
+            summary["per_date_cached_gb"] = round(stored / 1e9, 3)
+        # A backfill group lands all its dates before ExtractDT runs
+        summary["disk_per_group_gb"] = round(stored * ndates / max(1, ngroups) / 1e9, 3)
+        summary["disk_all_dates_gb"] = round(stored * ndates / 1e9, 3)
+        if self.plan_rate:
+            summary["retrieval_hours_per_date"] = round(per_date / 1e6 / float(self.plan_rate) / 3600, 2)
+        # Running sums (and window history), and grib2sqlite decoding
+        dtype_bytes = 4 if self.accum_dtype.__name__ == "float32" else 8
+        nsums = sum(
+            1 + (entry["windows"][-1] if entry["windows"] else 0)
+            for entry in accumulation_settings(self.config)
+            if entry["output"] == "grib"
+        )
+        summary["accumulation_memory_gb"] = round(nsums * sfc_points * dtype_bytes / 1e9, 3)
+        summary["extraction_memory_per_worker_gb"] = round(4 * 8 * npoints / 1e9, 3)
+        return summary
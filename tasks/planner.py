@@ -0,0 +1,90 @@
+"""Requests of a suite and estimates of their size, without retrieving anything.
+
+The requests are built exactly as RetrieveDT builds them (create_request and
+MarsScheduler.split), for every date from general.times.start to
+general.times.end, or every backfill group. The size of a chunk is estimated
+from the grid increments and area, the number of parameters, levels, steps
+and dates, and the bits per value of the packed fields.
+"""
+
+from datetime import timedelta
+
+from .areas import grid_increments
+
+# Bytes of the GRIB1 sections besides the packed values
+HEADER_BYTES = 200
+
+
+def plan_dates(start, end, group_days=1):
+    """Dates of a suite, in groups retrieved by one request.
+
+    Args:
+        start (datetime): first date
+        end (datetime): last date
+        group_days (int, optional): dates per group (backfill). Defaults to 1.
+
+    Returns:
+        list: lists of datetimes
+    """
+    dates = []
+    date = start
+    while date <= end:
+        dates.append(date)
+        date += timedelta(days=1)
+    group_days = max(1, group_days)
+    return [dates[i : i + group_days] for i in range(0, len(dates), group_days)]
+
+
+def field_points(grid, area=None):
+    """Number of points of a field on a regular lat/lon grid.
+
+    Args:
+        grid (str): MARS grid, "dlon/dlat"
+        area (str, optional): MARS area N/W/S/E, None for global
+
+    Returns:
+        int
+    """
+    dlat, dlon = grid_increments(grid)
+    if not area:
+        return (round(180.0 / dlat) + 1) * round(360.0 / dlon)
+    north, west, south, east = (float(x) for x in area.split("/"))
+    width = east - west if east > west else east - west + 360.0
+    return (round((north - south) / dlat) + 1) * (round(width / dlon) + 1)
+
+
+def request_fields(request):
+    """Number of fields of a (chunk) request: parameters x levels x steps x dates."""
+    nfields = 1
+    for key in ("param", "levelist", "step", "date"):
+        if request.get(key):
+            nfields *= len([item for item in str(request[key]).split("/") if item])
+    return nfields
+
+
+def estimate(request, bits_per_value=16):
+    """Estimated size of the data of a request.
+
+    Args:
+        request (dict): MARS or polytope request, with grid (and area)
+        bits_per_value (int, optional): bits per packed value. Defaults to 16.
+
+    Returns:
+        dict: fields, points (per field) and bytes
+    """
+    nfields = request_fields(request)
+    npoints = field_points(request["grid"], request.get("area"))
+    return {
+        "fields": nfields,
+        "points": npoints,
+        "bytes": nfields * (npoints * bits_per_value // 8 + HEADER_BYTES),
+    }
+
+
+def list_request(request):
+    """MARS LIST request that checks the availability (and cost) of a retrieve request."""
+    listing = {
+        key: value for key, value in request.items() if key not in ("target", "process", "grid", "area")
+    }
+    listing["output"] = "cost"
+    return listing
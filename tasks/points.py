@@ -0,0 +1,247 @@
+"""Point data in FCTABLE layout, for output that does not go through grib2sqlite."""
+
+import json
+
+import numpy as np
+
+from deode.logs import logger
+
+# Mean earth radius in km
+EARTH_RADIUS = 6371.0
+
+
+def vector_norm(u, v):
+    """Speed from vector components."""
+    return np.hypot(u, v)
+
+
+def vector_angle(u, v):
+    """Meteorological direction (degrees, where the wind comes from) from vector components."""
+    return np.mod(270.0 - np.degrees(np.arctan2(v, u)), 360.0)
+
+
+FUNCTIONS = {
+    "vector_norm": vector_norm,
+    "vector_angle": vector_angle,
+}
+
+
+def fctable_name(template, harp_param, basetime):
+    """FCTABLE file name for a parameter, from the sqlite_template."""
+    return (
+        template.replace("{PP}", harp_param)
+        .replace("{YYYY}", basetime.strftime("%Y"))
+        .replace("{MM}", basetime.strftime("%m"))
+        .replace("{HH}", basetime.strftime("%H"))
+    )
+
+
+def fctable_schema(model_name, upper_air=False):
+    """CREATE statements of the FC table.
+
+    Returns:
+        tuple: (CREATE TABLE statement, list of CREATE INDEX statements)
+    """
+    cols = [
+        "fcst_dttm DOUBLE",
+        "lead_time DOUBLE",
+        "SID INT",
+        "lat DOUBLE",
+        "lon DOUBLE",
+        "parameter TEXT",
+        "units TEXT",
+        f'"{model_name}" DOUBLE',
+    ]
+    keys = ["fcst_dttm", "lead_time", "SID"]
+    if upper_air:
+        cols.append("p DOUBLE")
+        keys.append("p")
+    schema = f"CREATE TABLE FC ({', '.join(cols)})"
+    index = f"CREATE UNIQUE INDEX index_{'_'.join(keys)} ON FC({', '.join(keys)})"
+    return schema, [index]
+
+
+def point_frame(model_name, basetime, lead_time, stations, parameter, values, units="", pressure=None):
+    """Rows of an FC table.
+
+    Args:
+        model_name (str): name of the value column
+        basetime (datetime): forecast start
+        lead_time (float or numpy.ndarray): lead time(s) in hours
+        stations (pandas.DataFrame): SID, lat, lon per row
+        parameter (str): harp parameter name
+        values (numpy.ndarray): one value per row
+        units (str, optional): units of the values
+        pressure (float or numpy.ndarray, optional): pressure level(s) in hPa
+
+    Returns:
+        pandas.DataFrame
+    """
+    import pandas
+
+    frame = pandas.DataFrame(
+        {
+            "fcst_dttm": float(basetime.timestamp()),
+            "lead_time": lead_time,
+            "SID": stations["SID"].to_numpy(),
+            "lat": stations["lat"].to_numpy(),
+            "lon": stations["lon"].to_numpy(),
+            "parameter": parameter,
+            "units": units,
+            model_name: values,
+        }
+    )
+    if pressure is not None:
+        frame["p"] = pressure
+    return frame
+
+
+def _axis(axes, *names):
+    for name in names:
+        if name in axes:
+            return axes[name].get("values", [])
+    return [None]
+
+
+def read_coverages(path, basetime):
+    """Read a CoverageJSON point time series (polytope feature output).
+
+    Args:
+        path (str): CoverageJSON file
+        basetime (datetime): forecast start, to turn valid times into lead times
+
+    Returns:
+        tuple: (pandas.DataFrame with coverage, lat, lon, level, lead_time,
+                shortName and value columns, dict of units per shortName)
+    """
+    import pandas
+
+    with open(path) as fin:
+        covjson = json.load(fin)
+    coverages = covjson.get("coverages", [covjson])
+    units = {
+        name: (param.get("unit", {}).get("symbol") or "")
+        for name, param in covjson.get("parameters", {}).items()
+    }
+    records = []
+    for icov, coverage in enumerate(coverages):
+        axes = coverage["domain"]["axes"]
+        lat = _axis(axes, "latitude", "x")[0]
+        lon = _axis(axes, "longitude", "y")[0]
+        levels = _axis(axes, "levelist", "z")
+        times = _axis(axes, "step", "t")
+        lead_times = []
+        for time in times:
+            if isinstance(time, str):
+                valid = pandas.Timestamp(time)
+                if valid.tzinfo is None:
+                    valid = valid.tz_localize("UTC")
+                lead_times.append((valid - pandas.Timestamp(basetime)).total_seconds() / 3600.0)
+            else:
+                lead_times.append(float(time))
+        for name, rng in coverage["ranges"].items():
+            values = np.asarray(rng["values"], dtype=float)
+            if rng.get("axisNames", ["z", "t"])[0] in ("t", "step"):
+                values = values.reshape(len(lead_times), len(levels)).T
+            else:
+                values = values.reshape(len(levels), len(lead_times))
+            for ilev, level in enumerate(levels):
+                for itime, lead_time in enumerate(lead_times):
+                    records.append((icov, lat, lon, level, lead_time, name, values[ilev, itime]))
+    frame = pandas.DataFrame(
+        records, columns=["coverage", "lat", "lon", "level", "lead_time", "shortName", "value"]
+    )
+    return frame, units
+
+
+def match_coverages(coverages, stations, max_distance=50.0):
+    """Station index for every coverage.
+
+    Polytope returns the coverages in the order of the requested points,
+    either all coverages of one station after the other or one coverage of
+    every station at a time. Each coverage is at the grid point nearest to
+    its station, so the order is only used if every coverage is within
+    max_distance of the station it gives. Otherwise, or if not every
+    station has the same number of coverages, every coverage goes to the
+    nearest station. Matching by order keeps stations apart that share a
+    grid point.
+
+    Args:
+        coverages (pandas.DataFrame): as returned by read_coverages
+        stations (pandas.DataFrame): station list (SID, lat, lon)
+        max_distance (float, optional): km between a coverage and its station
+
+    Returns:
+        numpy.ndarray: station (row) index per coverage number
+    """
+    cov = coverages.groupby("coverage")[["lat", "lon"]].first().sort_index()
+    slat = np.radians(stations["lat"].to_numpy())[None, :]
+    slon = np.radians(stations["lon"].to_numpy())[None, :]
+    clat = np.radians(cov["lat"].to_numpy())[:, None]
+    clon = np.radians(cov["lon"].to_numpy())[:, None]
+    cosdist = np.sin(slat) * np.sin(clat) + np.cos(slat) * np.cos(clat) * np.cos(slon - clon)
+    distance = EARTH_RADIUS * np.arccos(np.clip(cosdist, -1.0, 1.0))
+    ncov, nstations = distance.shape
+    if ncov % nstations == 0:
+        orders = (np.arange(ncov) // (ncov // nstations), np.arange(ncov) % nstations)
+        for owner in orders:
+            if np.all(distance[np.arange(ncov), owner] <= max_distance):
+                return owner
+        logger.warning("Coverages are not in the order of the stations, matching the nearest station")
+    return np.argmin(distance, axis=1)
+
+
+def coverage_frames(coverages, units, stations, param_list, model_name, basetime):
+    """Turn point time series into FC rows for every harp parameter of a parameter list.
+
+    Args:
+        coverages (pandas.DataFrame): as returned by read_coverages
+        units (dict): units per shortName
+        stations (pandas.DataFrame): station list (SID, lat, lon)
+        param_list (list): parameter list
+        model_name (str): model name
+        basetime (datetime): forecast start
+
+    Yields:
+        tuple: (harp parameter, pandas.DataFrame)
+    """
+    import pandas
+
+    owner = match_coverages(coverages, stations)
+    coverages = coverages.assign(station=owner[coverages["coverage"].to_numpy()])
+    for param in param_list:
+        ids = param["grib_id"] if isinstance(param["grib_id"], list) else [param["grib_id"]]
+        ids = [{**param.get("common", {}), **grib_id} for grib_id in ids]
+        components = []
+        for grib_id in ids:
+            sel = coverages[coverages["shortName"] == grib_id.get("shortName")]
+            if "level" in grib_id:
+                levels = grib_id["level"] if isinstance(grib_id["level"], list) else [grib_id["level"]]
+                sel = sel[sel["level"].isin(levels)]
+            components.append(sel.set_index(["station", "lead_time", "level"])["value"])
+        if any(component.empty for component in components):
+            continue
+        if "function" in param:
+            joined = pandas.concat(components, axis=1, join="inner")
+            values = FUNCTIONS[param["function"]](
+                *(joined.iloc[:, icol].to_numpy() for icol in range(joined.shape[1]))
+            )
+            index = joined.index
+            unit = ""
+        else:
+            values = components[0].to_numpy()
+            index = components[0].index
+            unit = units.get(ids[0].get("shortName"), "")
+        rows = index.to_frame(index=False)
+        level = rows["level"].to_numpy()
+        pressure = level if pandas.notna(level).any() else None
+        yield param["harp_param"], point_frame(
+            model_name,
+            basetime,
+            rows["lead_time"].to_numpy(),
+            stations.iloc[rows["station"].to_numpy()],
+            param["harp_param"],
+            values,
+            unit,
+            pressure,
+        )
@@ -0,0 +1,138 @@
+"""Extraction profiles that share the retrieval of the main configuration.
+
+A profile is a plugin toml file (like extract_dt_plugin_pcpvars.toml),
+listed in extract_dt.profiles of the main configuration. Its [extract_dt]
+and [extractsqlite] sections are applied on top of the main configuration
+for its extraction. RetrieveDT fetches the union of the parameters of all
+profiles once, so the profile must ask for the same MARS data source.
+"""
+
+try:
+    import tomllib
+except ImportError:  # python < 3.11
+    import tomli as tomllib
+
+from deode.logs import logger
+
+# extract_dt settings that select the data, so they must be equal in all profiles
+SHARED_KEYS = (
+    "method",
+    "class_mars",
+    "expver_mars",
+    "class_polytope",
+    "expver_polytope",
+    "dataset",
+    "stream",
+    "type",
+    "grid_sfc",
+    "grid_ua",
+    "levtype_sfc",
+    "levtype_ua",
+    "levelist_ua",
+    "area",
+)
+
+# The GRIB files of the main configuration are used by all profiles
+IGNORED_KEYS = ("dt_grib_path", "profiles")
+
+
+def load_profiles(config, platform):
+    """Read the profiles of extract_dt.profiles and check that they can share the retrieval.
+
+    Args:
+        config (deode.ParsedConfig): main configuration
+        platform (deode.host.Platform): platform, to substitute the paths
+
+    Returns:
+        dict: profile name -> {"extract_dt": {...}, "extractsqlite": {...}}
+
+    Raises:
+        RuntimeError: If a profile retrieves different data than the main configuration,
+            or has accumulations with output "grib".
+    """
+    profiles = {}
+    for name, path in dict(config.get("extract_dt.profiles", {})).items():
+        path = platform.substitute(path)
+        with open(path, "rb") as fin:
+            settings = tomllib.load(fin)
+        extract_dt = {
+            key: value
+            for key, value in settings.get("extract_dt", {}).items()
+            if key not in IGNORED_KEYS
+        }
+        for key in SHARED_KEYS:
+            if key in extract_dt and extract_dt[key] != config.get(f"extract_dt.{key}", None):
+                raise RuntimeError(
+                    f"Profile {name} ({path}) has a different {key}: "
+                    f"{extract_dt[key]} instead of {config.get(f'extract_dt.{key}', None)}"
+                )
+        # RetrieveDT only computes the "grib" accumulations of the main configuration
+        if any(entry.get("output", "grib") == "grib" for entry in extract_dt.get("accumulations", [])):
+            raise RuntimeError(
+                f"Profile {name} ({path}) has accumulations with output \"grib\", "
+                "add them to extract_dt.accumulations of the main configuration"
+            )
+        profiles[name] = {
+            "extract_dt": extract_dt,
+            "extractsqlite": settings.get("extractsqlite", {}),
+        }
+        logger.info("Extraction profile {}: {}", name, path)
+    return profiles
+
+
+def merge_lists(*lists):
+    """Union of lists, in order of first appearance."""
+    merged = []
+    for items in lists:
+        merged.extend(item for item in items if item not in merged)
+    return merged
+
+
+def retrieval_update(config, profiles):
+    """Settings that make the main configuration retrieve the data of all profiles.
+
+    Args:
+        config (deode.ParsedConfig): main configuration
+        profiles (dict): profiles from load_profiles
+
+    Returns:
+        dict: update of the extract_dt section, with the merged param_sfc,
+        param_ua and paramtypes
+    """
+    settings = [
+        {key: config.get(f"extract_dt.{key}", "") for key in ("param_sfc", "param_ua", "paramtypes")},
+        *(profile["extract_dt"] for profile in profiles.values()),
+    ]
+    paramtypes = merge_lists(
+        *(entry.get("paramtypes", config["extract_dt.paramtypes"]) for entry in settings)
+    )
+    update = {"paramtypes": []}
+    for tag in paramtypes:
+        # Only the parameters of a profile that extracts this tag
+        params = merge_lists(
+            *(
+                entry.get(f"param_{tag}", config.get(f"extract_dt.param_{tag}", "")).split("/")
+                for entry in settings
+                if tag in entry.get("paramtypes", config["extract_dt.paramtypes"])
+            )
+        )
+        update[f"param_{tag}"] = "/".join(param for param in params if param)
+        # No request for a tag without parameters
+        if update[f"param_{tag}"]:
+            update["paramtypes"].append(tag)
+    return {"extract_dt": update}
+
+
+def profile_update(profile):
+    """Settings that turn the main configuration into the configuration of a profile.
+
+    Args:
+        profile (dict): one profile from load_profiles
+
+    Returns:
+        dict: update of the extract_dt and extractsqlite sections
+    """
+    return {
+        "extract_dt": profile["extract_dt"],
+        "extractsqlite": profile["extractsqlite"],
+    }
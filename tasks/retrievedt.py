@@ -1,7 +1,12 @@
 """RetrieveDt."""
 
+import copy
+import importlib
 import os
 import shutil
+import threading
+import time
+from datetime import timedelta
 from deode.datetime_utils import as_datetime, as_timedelta
 from deode.logs import logger
 from deode.os_utils import deodemakedirs
@@ -9,7 +14,19 @@ from deode.tasks.base import Task
 from deode.tasks.batch import BatchJob
 import numpy as np
 import re
-from eccodes import *
+from .accumulation import Accumulator, accumulation_settings
+from .gributils import (
+    WatchedStream,
+    check_grib_file,
+    repack_grib_file,
+    split_grib_stream,
+    write_index,
+)
+from .areas import read_station_coords, station_areas
+from .marsscheduler import MarsScheduler
+from .metrics import task_metrics
+from .pipeline import mark_complete, mark_failed, mark_ready, reset_ready, set_ready_event
+from .profiles import load_profiles, retrieval_update
 
 class RetrieveDT(Task):
     """RetrieveDT task."""
@@ -26,6 +43,11 @@ class RetrieveDT(Task):
             ValueError: No data for this date.
         """
         Task.__init__(self, config, __class__.__name__)
+        # One retrieval for the main configuration and all extraction profiles
+        profiles = load_profiles(self.config, self.platform)
+        if profiles:
+            self.config = self.config.copy(update=retrieval_update(self.config, profiles))
+            logger.info("Parameters of all profiles: {}", self.config["extract_dt.paramtypes"])
 
         self.method = self.config["extract_dt.method"] # "mars" or "polytope"
         self.unix_group = self.platform.get_platform_value("unix_group")
@@ -38,19 +60,37 @@ class RetrieveDT(Task):
         self.maxstep = int(as_timedelta(config["general.times.forecast_range"]).total_seconds()//3600)
         self.steplist = [ str(i) for i in range(self.minstep,self.maxstep + 1) ]
         self.max_try = int(config["scheduler.ecfvars.ecf_tries"])
-        self.tryno = int(os.environ.get("ECF_TRYNO"))
+        self.tryno = int(os.environ.get("ECF_TRYNO", 1))
         self.continue_on_fail = config.get("extract_dt.continue_on_fail", False)
+        # ExtractDT runs next to this task
+        self.pipeline = config.get("extract_dt.pipeline", False)
+        # float32 halves the memory of the accumulated fields
+        self.accum_dtype = np.dtype(config.get("extract_dt.accumulation_dtype", "float64")).type
+        self.accumulations = accumulation_settings(self.config)
+        # Only retrieve the steps that are not yet complete on disk
+        self.resume = config.get("extract_dt.resume", True)
+        self.tag_areas = {}
+        # Polytope feature requests at the stations, instead of gridded fields
+        self.polytope_points = config.get("extract_dt.polytope_points", False)
+        # Retrieve a group of dates, starting at basetime, in one request
+        self.backfill = config.get("extract_dt.backfill", False)
+        # More compact packing of the files in dt_grib_path
+        self.cache_packing = config.get("extract_dt.cache_packing", None)
+        self.cache_bits = config.get("extract_dt.cache_bits_per_value", None)
 
         self.dt_path = self.platform.substitute(
             config["extract_dt.dt_grib_path"],
             basetime=self.basetime,
         )
+        self.metrics = task_metrics(self, __class__.__name__)
         logger.info("DT PATH: {}", self.dt_path)
         logger.info("MIN/MAX STEP: {} {}", self.minstep, self.maxstep)
         logger.info("BASETIME: {}", self.basetime)
 
-    def create_request(self, tag = "sfc"):
-        allsteps = "/".join(self.steplist)
+    def create_request(self, tag = "sfc", steps = None):
+        if steps is None:
+            steps = self.steplist
+        allsteps = "/".join(steps)
         method = self.config["extract_dt.method"]
         request = {
                 "type":"FC",
@@ -79,8 +119,45 @@ class RetrieveDT(Task):
             request["levelist"] = self.config["extract_dt.levelist_ua"]
             request["grid"] = self.config["extract_dt.grid_ua"]
 
+        # Several areas (tiles) are split over separate MARS chunks
+        areas = self.areas(tag)
+        if len(areas) == 1:
+            request["area"] = areas[0]
+
         return request
 
+    def areas(self, tag):
+        """Areas to retrieve for a tag.
+
+        extract_dt.area is either a fixed MARS area (N/W/S/E), "auto" for one
+        padded box around the stations of the tag (extractsqlite.station_list_{tag}),
+        or "tiles" for several boxes around groups of stations. Without area,
+        the whole globe is retrieved.
+
+        Returns:
+            list: MARS area strings, empty for global data
+        """
+        if tag in self.tag_areas:
+            return self.tag_areas[tag]
+        area = self.config.get("extract_dt.area", None)
+        if not area:
+            areas = []
+        elif area in ("auto", "tiles"):
+            station_file = self.platform.substitute(self.config[f"extractsqlite.station_list_{tag}"])
+            areas = station_areas(
+                station_file,
+                area,
+                padding=float(self.config.get("extract_dt.area_padding", 1.0)),
+                tile_size=float(self.config.get("extract_dt.area_tile_size", 30.0)),
+                max_tiles=int(self.config.get("extract_dt.area_max_tiles", 8)),
+                grid=self.config[f"extract_dt.grid_{tag}"],
+            )
+            logger.info("{} areas around stations of {}: {}", tag, station_file, areas)
+        else:
+            areas = [area]
+        self.tag_areas[tag] = areas
+        return areas
+
     def execute(self):
         """Run task.
 
@@ -90,46 +167,275 @@ class RetrieveDT(Task):
             RuntimeError: If there is an issue with the work folder.
         """
 
+        if not os.path.exists(self.dt_path):
+            deodemakedirs(self.dt_path, unixgroup=self.unix_group)
+
+        paramtypes=self.config["extract_dt.paramtypes"]
         if self.tryno >= self.max_try and self.continue_on_fail:
             logger.error("ECF_TRYNO = {}, ECF_TRIES = {}", self.tryno, self.max_try)
             logger.error("Max number of re-try exceeded. Skipping this day!")
+            # A pipelined ExtractDT stops waiting and reports the missing steps
+            for tag in paramtypes:
+                reset_ready(self.dt_path, tag)
+                mark_complete(self.dt_path, tag)
+            if self.pipeline:
+                set_ready_event()
             return
 
-        if not os.path.exists(self.dt_path):
-            deodemakedirs(self.dt_path, unixgroup=self.unix_group)
+        if self.pipeline and not self.backfill:
+            # The ready files of an earlier run must not be read by ExtractDT
+            for tag in paramtypes:
+                reset_ready(self.dt_path, tag)
+            set_ready_event()
+        try:
+            self.retrieve(paramtypes)
+        except BaseException:
+            if self.pipeline and not self.backfill and self.tryno >= self.max_try:
+                # No retry will come, ExtractDT must not wait for it
+                for tag in paramtypes:
+                    mark_failed(self.dt_path, tag)
+            raise
 
-        tryno = int(os.environ.get("ECF_TRYNO"))
-        paramtypes=self.config["extract_dt.paramtypes"]
-        for tag in paramtypes:
-            # TODO: check whether files exist
-            request = self.create_request(tag)
+    def retrieve(self, paramtypes):
+        """Retrieve all tags, marking the steps as ready as they land.
 
+        Args:
+            paramtypes (list): tags to retrieve
+        """
+        if self.backfill:
             if self.method == "mars":
-                logger.info("Sending request to MARS client")                
-                self.doreq_mars(request, tag)
+                self.execute_backfill(paramtypes)
             else:
-                logger.info("Sending request to polytope client")                       
-                self.doreq_polytope(request, tag)
+                # Only MARS takes several dates in one request
+                for day in self.backfill_days():
+                    if not os.path.exists(day.dt_path):
+                        deodemakedirs(day.dt_path, unixgroup=self.unix_group)
+                    day.retrieve(paramtypes)
+            self.metrics.summary()
+            return
 
-            # move files to "semi-permanent"
-            flist = [ f"{tag}_{i}.grib1" for i in self.steplist ]
+        for tag in paramtypes:
+            if self.method == "polytope" and self.polytope_points:
+                with self.metrics.stage("points", tag):
+                    self.retrieve_points(tag)
+                mark_complete(self.dt_path, tag)
+                continue
+
+            if self.resume:
+                # Skip steps that are already complete in dt_path,
+                # or in the working directory after an earlier try
+                pending = self.check_file_exists(self.steplist, self.dt_path, tag)
+                missing = self.check_file_exists(pending, "", tag)
+                logger.info("{}: {} of {} steps already retrieved", tag,
+                            len(self.steplist) - len(missing), len(self.steplist))
+            else:
+                pending = missing = self.steplist
+
+            # Incomplete files from an earlier try must not be appended to
+            for step in missing:
+                if os.path.exists(f"{tag}_{step}.grib1"):
+                    os.remove(f"{tag}_{step}.grib1")
+
+            # Steps that are complete in dt_path can be extracted right away
+            self.landed = {step for step in self.steplist if step not in pending}
+            self.released = set()
+            self.accumulator = Accumulator(self.accumulations, self.accum_dtype)
+            reset_ready(self.dt_path, tag)
+            self.release_steps(tag)
+            for step in pending:
+                if step not in missing:
+                    self.land_step(tag, step)
+
+            if missing:
+                request = self.create_request(tag, missing)
+
+                with self.metrics.stage(self.method, tag, steps=len(missing)) as counters:
+                    if self.method == "mars":
+                        logger.info("Sending request to MARS client")
+                        self.doreq_mars(request, tag)
+                    else:
+                        logger.info("Sending request to polytope client")
+                        self.doreq_polytope(request, tag)
+                    counters["bytes_written"] = sum(
+                        os.path.getsize(os.path.join(self.dt_path, f"{tag}_{step}.grib1"))
+                        for step in missing
+                        if step in self.landed
+                    )
+            else:
+                logger.info("All {} files already retrieved", tag)
 
-            for gf in flist:
-                if not os.path.exists(gf):
-                    raise RuntimeError(f"Expected file not found: {gf}")
-                if os.path.getsize(gf) == 0:
-                    raise RuntimeError(f"Retrieved file is empty: {gf}")    
-                logger.info("MOVING {}", gf)
-                shutil.move(gf, os.path.join(self.dt_path, gf))
+            # move remaining files to "semi-permanent"
+            for step in pending:
+                if step not in self.landed:
+                    self.land_step(tag, step)
+            mark_complete(self.dt_path, tag)
+        self.metrics.summary()
 
-            # After moving, add cumulative lightning field for surface files
-            if tag == "sfc":
-                self.add_cumulative_litota1(self.dt_path, flist)
+    def backfill_days(self):
+        """Copies of the task for every date of the backfill group.
 
+        The group starts at basetime and has extract_dt.backfill_group_days
+        dates, but does not go past general.times.end.
+
+        Returns:
+            list: RetrieveDT objects, one per date
+        """
+        group_days = int(self.config.get("extract_dt.backfill_group_days", 7))
+        end = as_datetime(self.config["general.times.end"])
+        days = []
+        for iday in range(group_days):
+            basetime = self.basetime + timedelta(days=iday)
+            if basetime > end:
+                break
+            days.append(self.for_date(basetime))
+        return days
+
+    def for_date(self, basetime):
+        """Copy of the task for another date, retrieving only that date.
+
+        Args:
+            basetime (datetime): forecast start of the copy
+
+        Returns:
+            RetrieveDT
+        """
+        day = copy.copy(self)
+        day.backfill = False
+        day.basetime = basetime
+        day.dt_path = self.platform.substitute(
+            self.config["extract_dt.dt_grib_path"], basetime=basetime
+        )
+        return day
+
+    def execute_backfill(self, paramtypes):
+        """Retrieve all dates of a backfill group with one MARS request per tag.
+
+        The dates are requested in order, so MARS can read them with as few
+        tape mounts as possible. Each date still gets its own dt_path and
+        ready file, so ExtractDT runs per date as usual.
+
+        Args:
+            paramtypes (list): tags to retrieve
+        """
+        days = self.backfill_days()
+        logger.info("Backfill of {} dates from {}", len(days), self.basetime)
+        for day in days:
+            if not os.path.exists(day.dt_path):
+                deodemakedirs(day.dt_path, unixgroup=self.unix_group)
+        for tag in paramtypes:
+            for day in days:
+                if self.resume:
+                    day.pending = day.check_file_exists(day.steplist, day.dt_path, tag)
+                else:
+                    day.pending = list(day.steplist)
+                day.landed = {step for step in day.steplist if step not in day.pending}
+                day.released = set()
+                day.accumulator = Accumulator(day.accumulations, day.accum_dtype)
+                reset_ready(day.dt_path, tag)
+                day.release_steps(tag)
+            todo = [day for day in days if day.pending]
+            steps = [step for step in self.steplist if any(step in day.pending for day in todo)]
+            if todo:
+                # Files from an earlier try are not reused
+                for day in todo:
+                    for step in steps:
+                        for fname in (f"{tag}_{day.basetime:%Y%m%d}_{step}.grib1", f"{tag}_{step}.grib1"):
+                            if os.path.exists(fname):
+                                os.remove(fname)
+                request = self.create_request(tag, steps)
+                request["date"] = "/".join(day.basetime.strftime("%Y%m%d") for day in todo)
+                logger.info("Sending request for {} dates to MARS client", len(todo))
+                with self.metrics.stage("mars", tag, steps=len(steps), dates=len(todo)):
+                    self.doreq_mars(request, tag, days=todo)
+            else:
+                logger.info("All {} files already retrieved", tag)
+            for day in todo:
+                for step in day.pending:
+                    if step not in day.landed:
+                        self.land_dates(tag, step, [day])
+            for day in days:
+                mark_complete(day.dt_path, tag)
+
+    def land_dates(self, tag, step, days):
+        """Land one step of a multi-date request for every date of a backfill group.
+
+        Args:
+            tag (str): file type, "sfc" or "ua"
+            step (str): forecast step
+            days (list): RetrieveDT objects of the requested dates
+        """
+        for day in days:
+            fname = f"{tag}_{day.basetime:%Y%m%d}_{step}.grib1"
+            if step not in day.pending or step in day.landed:
+                # Already complete, only retrieved along with the other dates
+                if os.path.exists(fname):
+                    os.remove(fname)
+                continue
+            if os.path.exists(fname):
+                os.replace(fname, f"{tag}_{step}.grib1")
+            day.land_step(tag, step)
+
+    def land_step(self, tag, step):
+        """Move a retrieved file to dt_path and release the steps that are ready.
+
+        Args:
+            tag (str): file type, "sfc" or "ua"
+            step (str): forecast step
+
+        Raises:
+            RuntimeError: If the file is missing or empty.
+        """
+        gf = f"{tag}_{step}.grib1"
+        if not os.path.exists(gf):
+            raise RuntimeError(f"Expected file not found: {gf}")
+        if os.path.getsize(gf) == 0:
+            raise RuntimeError(f"Retrieved file is empty: {gf}")    
+        if self.cache_packing or self.cache_bits:
+            with self.metrics.stage("repack", tag, step, bytes_read=os.path.getsize(gf)) as counters:
+                _size, counters["bytes_written"] = repack_grib_file(
+                    gf, self.cache_packing, int(self.cache_bits) if self.cache_bits else None
+                )
+        logger.info("MOVING {}", gf)
+        with self.metrics.stage("land", tag, step, bytes_written=os.path.getsize(gf)):
+            shutil.move(gf, os.path.join(self.dt_path, gf))
+        self.landed.add(step)
+        self.release_steps(tag)
+
+    def release_steps(self, tag):
+        """Mark landed steps as ready for extraction.
+
+        The accumulated fields of an sfc file (litoti and the windows) need
+        all earlier steps, so sfc steps are released in order, after they
+        have been added.
+        A sidecar index is written for every released file.
+        """
+        for step in self.steplist:
+            if step in self.released:
+                continue
+            if step not in self.landed:
+                if tag == "sfc":
+                    break
+                continue
+            gf = os.path.join(self.dt_path, f"{tag}_{step}.grib1")
+            if tag == "sfc":
+                with self.metrics.stage("accumulate", tag, step):
+                    self.accumulator.update(gf, int(step))
+            with self.metrics.stage("index", tag, step, bytes_read=os.path.getsize(gf)) as counters:
+                counters["messages"] = len(write_index(gf))
+            mark_ready(self.dt_path, tag, step)
+            self.released.add(step)
+            self.metrics.meter("steps", len(self.released))
 
     def add_cumulative_litota1(self, path, file_list):
         """
-        Compute cumulative lightning density from sfc_*.grib1 files.
+        Compute cumulative lightning density, and the other accumulations, from sfc_*.grib1 files.
+
+        Only the message headers are scanned. The input message of each step
+        (e.g. litota1) is decoded and added to a running sum, and the
+        cumulative field (litoti) and window totals are appended to the file.
+        The other messages are neither decoded nor copied. Fields that are
+        already in a file are not appended again, so the method can safely
+        be called again after a retry.
 
         Parameters
         ----------
@@ -147,83 +453,241 @@ class RetrieveDT(Task):
         file_list_sorted = sorted(file_list, key=extract_step)
         logger.info("Processing {} GRIB files from path: {}", len(file_list_sorted), path)
 
-        cumulative = None
+        accumulator = Accumulator(self.accumulations, self.accum_dtype)
 
         for idx, fname in enumerate(file_list_sorted, start=1):
-            fpath = os.path.join(path, fname)
-            tmp_out = fpath + ".tmp"
-
             logger.info("Reading file {}/{}: {}", idx, len(file_list_sorted), fname)
+            accumulator.update(os.path.join(path, fname), extract_step(fname))
 
-            with open(fpath, "rb") as fin, open(tmp_out, "wb") as fout:
-                while True:
-                    gid = codes_grib_new_from_file(fin)
-                    if gid is None:
-                        break
+        logger.info("Finished processing all {} files.", len(file_list_sorted))
 
-                    shortName = codes_get(gid, "shortName")
-                    if shortName == "litota1":
-                        values = codes_get_values(gid)
-                        if cumulative is None:
-                            cumulative = np.copy(values)
-                            logger.info("Initialized cumulative field from {}", fname)
-                        else:
-                            cumulative += values
-                            logger.info("Updated cumulative field with {}", fname)
-
-                        # Make a new message with the cumulative values
-                        new_gid = codes_clone(gid)
-                        codes_set_values(new_gid, cumulative)
-
-                        # Update the stepRange to reflect accumulation
-                        step = extract_step(fname)
-                        stepRange = f"0-{step}"
-                        codes_set(new_gid, "step", step)        # step = forecast hour, e.g., 2, 3, 6
-                        codes_set(new_gid, "shortName", "litoti")
-                        codes_set(new_gid, "stepType", "accum")
-                        # Force shortName to remain litota1
-                        #codes_set(new_gid, "shortName", "litota1")
-                        # Optionally, define the stepType as accumulation
-                        #codes_set(new_gid, "stepType", "accum")
-
-                        logger.info("Writing cumulative litota1 with stepRange {}", stepRange)
-
-                        # Write the new field
-                        codes_write(new_gid, fout)
-                        codes_release(new_gid)
-
-                    # Also write the original field
-                    codes_write(gid, fout)
-                    codes_release(gid)
-
-            # Replace the original file with updated one
-            os.replace(tmp_out, fpath)
-            logger.info("Updated file {}", fname)
+    def doreq_mars(self, request, tag, days=None):
+        """Retrieve a request with MARS.
 
-        logger.info("Finished processing all {} files.", len(file_list_sorted))
+        The request is split in chunks of extract_dt.chunk_steps steps and
+        extract_dt.chunk_params parameters, which run with up to
+        extract_dt.mars_workers concurrent MARS clients. Every step is moved
+        to dt_path as soon as it is complete. The clients are started with
+        srun when there is a single worker. Concurrent clients run directly
+        by default, as concurrent srun steps would queue behind the one task
+        of the RetrieveDT job.
 
-    def doreq_mars(self, request, tag):
+        Args:
+            request (dict): MARS request
+            tag (str): file type, "sfc" or "ua"
+            days (list, optional): RetrieveDT objects of a backfill group,
+                whose dates are all retrieved by this request
+
+        Raises:
+            RuntimeError: If a chunk still fails after all retries.
+        """
         logger.info("MARS REQUEST: {}", request)
-        self.write_mars_req(request, f"{tag}.req", "retrieve")
+        dates = [day.basetime.strftime("%Y%m%d") for day in days] if days else None
         mars_bin = self.get_binary("mars")
-        import subprocess
-        try:
-         subprocess.run(["srun", f"{mars_bin}", f"{tag}.req"], check=True)
-        except subprocess.CalledProcessError as e:
-         print(f"Error: MARS request failed with exit code {e.returncode}")
-         print(f"Command Output: {e.output}")
-         # Handle the failure gracefully (e.g., retry, log error, etc.)
+        nworkers = int(self.config.get("extract_dt.mars_workers", 1))
+        default_launcher = "srun" if nworkers == 1 else ""
+        launcher = self.config.get("extract_dt.mars_launcher", default_launcher).split()
+        scheduler = MarsScheduler(
+            [*launcher, mars_bin],
+            lambda req, filename: self.write_mars_req(req, filename, "retrieve"),
+            nworkers=nworkers,
+            max_retries=int(self.config.get("extract_dt.mars_retries", 1)),
+            poll=float(self.config.get("extract_dt.mars_poll", 5)),
+            stall_timeout=self.timeout_seconds("extract_dt.mars_stall_timeout"),
+            queue_timeout=self.timeout_seconds("extract_dt.mars_queue_timeout"),
+            on_progress=lambda state: self.retrieval_progress(tag, state),
+        )
+        chunks = scheduler.split(
+            request,
+            tag,
+            request["step"].split("/"),
+            step_chunk=int(self.config.get("extract_dt.chunk_steps", 0)),
+            param_chunk=int(self.config.get("extract_dt.chunk_params", 0)),
+            areas=self.areas(tag) if len(self.areas(tag)) > 1 else None,
+            dates=dates,
+        )
+        logger.info("MARS request split in {} chunks", len(chunks))
+        if days:
+            on_step = lambda step: self.land_dates(tag, step, days)  # noqa: E731
+        else:
+            on_step = lambda step: self.land_step(tag, step)  # noqa: E731
+        failed = scheduler.run(chunks, tag, on_step=on_step, dates=dates)
+        if failed:
+            names = ", ".join(chunk.name for chunk in failed)
+            raise RuntimeError(f"MARS request failed for chunks: {names}")
+
+    def timeout_seconds(self, key):
+        """A timeout of the config (ISO 8601 duration), in seconds, 0 if not set."""
+        value = self.config.get(key, None)
+        return as_timedelta(value).total_seconds() if value else 0
+
+    def retrieval_progress(self, tag, state):
+        """Show the state of a running MARS request as ecFlow meter and label.
+
+        Args:
+            tag (str): file type, "sfc" or "ua"
+            state (dict): from MarsScheduler.progress
+        """
+        text = (
+            f"{tag}: {state['done']}/{state['chunks']} chunks done, {state['running']} running, "
+            f"{state['failed']} failed, {state['bytes'] / 1e6:.0f} MB"
+        )
+        if state["running"] and state["stalled"] >= 60:
+            text += f", no data for {state['stalled'] // 60:.0f} min"
+        if text == getattr(self, "last_progress", None):
+            return
+        self.last_progress = text
+        self.metrics.meter("retrieval", 100 * state["done"] // state["chunks"])
+        self.metrics.label("retrieval", text)
+
+    def polytope_client(self):
+        """Polytope client.
+
+        The client class is given by extract_dt.polytope_client as
+        "module:Class" (default "polytope.api:Client"), so a local stub
+        with the same retrieve method can be used for testing.
+        """
+        module_name, class_name = self.config.get(
+            "extract_dt.polytope_client", "polytope.api:Client"
+        ).split(":")
+        client_class = getattr(importlib.import_module(module_name), class_name)
+        address = self.config.get(
+            "extract_dt.polytope_address", "polytope.lumi.apps.dte.destination-earth.eu"
+        )
+        return client_class(address=address)
 
     def doreq_polytope(self, request, tag):
-        logger.info("POLYTOPE REQUEST: {}", request)
-        from polytope.api import Client
-        client = Client(address="polytope.lumi.apps.dte.destination-earth.eu")
-        # dt_collection = "destination-earth"  # DESP account
-        dt_collection = "ecmwf-destination-earth"  # ECMWF account
-        files = client.retrieve(dt_collection, request)
-        # NOTE: this will retrieve global data in "raw" form.
-        # And ALL IN ONE FILE ?!!!
-        # we need earthkit to interpolate to station locations.
+        """Retrieve a request with polytope and split the response per step.
+
+        Polytope returns all steps in one response. It is downloaded into a
+        named pipe and split into {tag}_{step}.grib1 files while it arrives,
+        so the full response never lands on disk. Every step is moved to
+        dt_path as soon as it has all its messages.
+
+        A response that stops arriving (extract_dt.polytope_stall_timeout) or
+        never starts (extract_dt.polytope_queue_timeout) is given up, and the
+        steps that did not land yet are requested again, up to
+        extract_dt.polytope_retries times. Failed requests are retried too.
+
+        Raises:
+            RuntimeError: If the polytope request still fails after all retries.
+        """
+        request = {key: value for key, value in request.items() if key != "target"}
+        steps = request["step"].split("/")
+        retries = int(self.config.get("extract_dt.polytope_retries", 1))
+        client = self.polytope_client()
+        for attempt in range(retries + 1):
+            if attempt:
+                request["step"] = "/".join(step for step in steps if step not in self.landed)
+            logger.info("POLYTOPE REQUEST (try {}): {}", attempt + 1, request)
+            error = self.polytope_stream(client, request, tag, f"{tag}_{attempt}.polytope")
+            if error is None:
+                return
+            logger.warning("Polytope request of {} failed (try {}): {}", tag, attempt + 1, error)
+        raise RuntimeError(f"Polytope request failed: {error}")
+
+    def polytope_stream(self, client, request, tag, fifo):
+        """Stream one polytope request through a named pipe into step files.
+
+        Args:
+            client: polytope client
+            request (dict): polytope request
+            tag (str): file type, "sfc" or "ua"
+            fifo (str): name of the pipe, new for every try so a client
+                that was given up cannot write into the next one
+
+        Returns:
+            str: why the request failed, or None if it succeeded
+        """
+        # "destination-earth" for a DESP account
+        collection = self.config.get("extract_dt.polytope_collection", "ecmwf-destination-earth")
+        if os.path.exists(fifo):
+            os.remove(fifo)
+        os.mkfifo(fifo)
+        errors = []
+        split_done = threading.Event()
+
+        def retrieve():
+            try:
+                client.retrieve(collection, request, output_file=fifo)
+            except Exception as err:  # noqa: BLE001  reported by the main thread
+                errors.append(err)
+                # If the client failed before opening the pipe, open and close
+                # it once so the reader sees the end of the stream.
+                while not split_done.is_set():
+                    try:
+                        os.close(os.open(fifo, os.O_WRONLY | os.O_NONBLOCK))
+                        break
+                    except OSError:
+                        time.sleep(0.1)
+
+        def expected(step):
+            # Step 0 has no statistical fields, its count is not known in advance.
+            # It is landed when the first message of the next step arrives.
+            if tag == "sfc" and int(step) == self.minstep:
+                return None
+            return self.expected_messages(tag, step)
+
+        thread = threading.Thread(target=retrieve, daemon=True)
+        thread.start()
+        stream = WatchedStream(
+            fifo,
+            stall_timeout=self.timeout_seconds("extract_dt.polytope_stall_timeout"),
+            queue_timeout=self.timeout_seconds("extract_dt.polytope_queue_timeout"),
+            poll=float(self.config.get("extract_dt.polytope_poll", 5)),
+        )
+        try:
+            counts = split_grib_stream(
+                stream, tag, expected, on_step=lambda step: self.land_step(tag, step)
+            )
+        except Exception:  # noqa: BLE001  a stream cut by a timeout ends mid-message
+            if stream.timed_out is None:
+                raise
+        finally:
+            split_done.set()
+            stream.close()
+            # A client that was given up may hang in the network; it is not waited for
+            if stream.timed_out is None:
+                thread.join()
+            os.remove(fifo)
+        if stream.timed_out is not None:
+            return stream.timed_out
+        if errors:
+            return str(errors[0])
+        logger.info("Received {} messages for {} steps", sum(counts.values()), len(counts))
+        return None
+
+    def retrieve_points(self, tag):
+        """Retrieve time series at the stations with a polytope feature request.
+
+        Only the values at the stations of the tag (extractsqlite.station_list_{tag})
+        cross the network. The CoverageJSON response is stored as
+        {tag}_points.covjson in dt_path, and extracted by ExtractDT.
+        """
+        fname = f"{tag}_points.covjson"
+        target = os.path.join(self.dt_path, fname)
+        reset_ready(self.dt_path, tag)
+        if self.resume and os.path.isfile(target) and os.path.getsize(target) > 0:
+            logger.info("{} already retrieved", target)
+        else:
+            request = self.create_request(tag)
+            for key in ("target", "grid", "area", "process"):
+                request.pop(key, None)
+            station_file = self.platform.substitute(self.config[f"extractsqlite.station_list_{tag}"])
+            lats, lons = read_station_coords(station_file)
+            request["feature"] = {
+                "type": "timeseries",
+                "points": [[lat, lon] for lat, lon in zip(lats, lons)],
+                "axes": "step",
+            }
+            logger.info("POLYTOPE POINT REQUEST: {} stations of {}", len(lats), station_file)
+            collection = self.config.get("extract_dt.polytope_collection", "ecmwf-destination-earth")
+            self.polytope_client().retrieve(collection, request, output_file=fname)
+            if not os.path.isfile(fname) or os.path.getsize(fname) == 0:
+                raise RuntimeError(f"Polytope returned no data for {fname}")
+            shutil.move(fname, target)
+        for step in self.steplist:
+            mark_ready(self.dt_path, tag, step)
 
     @staticmethod
     def write_mars_req(request, filename, method):
@@ -248,17 +712,41 @@ class RetrieveDT(Task):
 
             f.close()
  
-    def check_file_exists(self, steps, path, file_name):
-        """Check if which mars file already exist."""
+    def expected_messages(self, tag, step):
+        """Minimum number of GRIB messages in a complete {tag}_{step}.grib1 file.
+
+        Can be set with extract_dt.expected_messages_{tag}. By default this is
+        the number of requested parameters (times levels for upper air), times
+        the number of areas. Statistical fields do not exist at step 0, so then
+        any count is fine.
+        """
+        expected = self.config.get(f"extract_dt.expected_messages_{tag}", None)
+        if expected is not None:
+            return int(expected)
+        nparam = len([p for p in self.config[f"extract_dt.param_{tag}"].split("/") if p])
+        nparam *= max(1, len(self.areas(tag)))
+        if tag == "ua":
+            return nparam * len(self.config["extract_dt.levelist_ua"].split("/"))
+        if int(step) == self.minstep:
+            return 1
+        return nparam
+
+    def check_file_exists(self, steps, path, tag):
+        """Check which {tag}_{step}.grib1 files are missing or incomplete.
+
+        Args:
+            steps (list): steps to check
+            path (str): directory to look in ("" for the working directory)
+            tag (str): file type, "sfc" or "ua"
+
+        Returns:
+            list: the steps that still need to be retrieved
+        """
         base_list = []
         for step in steps:
-            step1 = int(step)
-            step_str = str(step1) if path == "" else f"{step1:02d}"
-            mars_file_check = os.path.join(path, f"{file_name}+{step_str}")
-            if not os.path.exists(mars_file_check):
+            mars_file_check = os.path.join(path, f"{tag}_{step}.grib1")
+            if not check_grib_file(mars_file_check, self.expected_messages(tag, step)):
                 base_list.append(step)
                 logger.info("Missing file:{}", mars_file_check)
 
-        base = "/".join(base_list)
-        return base
-
+        return base_list
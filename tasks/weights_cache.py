@@ -0,0 +1,116 @@
+"""On-disk cache for station interpolation weights."""
+
+import hashlib
+import json
+import os
+import pickle
+
+from deode.logs import logger
+from deode.os_utils import deodemakedirs
+
+# GRIB keys that fully define a regular lat/lon (or reduced) grid geometry
+GRID_KEYS = [
+    "gridType",
+    "Ni",
+    "Nj",
+    "numberOfDataPoints",
+    "latitudeOfFirstGridPointInDegrees",
+    "longitudeOfFirstGridPointInDegrees",
+    "latitudeOfLastGridPointInDegrees",
+    "longitudeOfLastGridPointInDegrees",
+    "iDirectionIncrementInDegrees",
+    "jDirectionIncrementInDegrees",
+]
+
+
+def grid_hash(infile):
+    """Return a hash of the grid geometry of the first message in a GRIB file.
+
+    Args:
+        infile (str): GRIB file name
+
+    Returns:
+        str: hex digest, or None if the file contains no messages
+    """
+    from eccodes import codes_get, codes_grib_new_from_file, codes_release
+
+    with open(infile, "rb") as fin:
+        gid = codes_grib_new_from_file(fin, headers_only=True)
+        if gid is None:
+            return None
+        geometry = {}
+        for key in GRID_KEYS:
+            try:
+                geometry[key] = codes_get(gid, key)
+            except Exception:  # noqa: BLE001  key not defined for this grid type
+                geometry[key] = None
+        codes_release(gid)
+    return hashlib.sha1(json.dumps(geometry, sort_keys=True).encode()).hexdigest()
+
+
+def file_checksum(filename):
+    """Return the sha1 checksum of a file's content."""
+    sha = hashlib.sha1()
+    with open(filename, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class WeightsCache:
+    """Interpolation weights, keyed by grid geometry and station list.
+
+    Weights are kept in memory for the lifetime of the object and, if a
+    cache directory is given, pickled to disk so later runs can reuse them.
+    """
+
+    def __init__(self, path=None, unix_group=None):
+        """Construct the cache.
+
+        Args:
+            path (str, optional): Cache directory. Memory only if None.
+            unix_group (str, optional): Group for a newly created directory.
+        """
+        self.path = path
+        self.unix_group = unix_group
+        self.memory = {}
+
+    def filename(self, grid, stations):
+        """Name of the cache file for a (grid, station list) pair."""
+        return os.path.join(self.path, f"weights_{grid[:16]}_{stations[:16]}.pkl")
+
+    def load(self, grid, stations):
+        """Return cached weights, or None if not available."""
+        key = (grid, stations)
+        if key in self.memory:
+            return self.memory[key]
+        if self.path is None or grid is None:
+            return None
+        cfile = self.filename(grid, stations)
+        if not os.path.isfile(cfile):
+            return None
+        try:
+            with open(cfile, "rb") as fin:
+                weights = pickle.load(fin)
+        except (OSError, pickle.UnpicklingError, EOFError) as err:
+            logger.warning("Ignoring unreadable weights cache {}: {}", cfile, err)
+            return None
+        logger.info("Loaded interpolation weights from {}", cfile)
+        self.memory[key] = weights
+        return weights
+
+    def store(self, grid, stations, weights):
+        """Keep weights in memory and write them to the cache directory."""
+        if weights is None:
+            return
+        self.memory[(grid, stations)] = weights
+        if self.path is None or grid is None:
+            return
+        if not os.path.exists(self.path):
+            deodemakedirs(self.path, unixgroup=self.unix_group)
+        cfile = self.filename(grid, stations)
+        tmp = f"{cfile}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as fout:
+            pickle.dump(weights, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cfile)
+        logger.info("Stored interpolation weights in {}", cfile)
@@ -0,0 +1,119 @@
+"""Fixtures of the plugin tests.
+
+The tests run the plugin modules with stub executables (mars, ecp) instead
+of the real clients. Without deode, the few deode helpers the tasks import
+(logger, time parsing, deodemakedirs, the Task base class) are replaced by
+minimal stand-ins, so the tests still run, e.g. in CI.
+"""
+
+import importlib
+import logging
+import os
+import re
+import stat
+import sys
+import types
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+PLUGIN = Path(__file__).resolve().parents[1]
+
+
+class StubLogger:
+    """loguru-style logger ("{}" placeholders) on top of logging."""
+
+    def __init__(self):
+        self.log = logging.getLogger("deode")
+
+    def __getattr__(self, level):
+        method = getattr(self.log, "warning" if level == "warning" else level)
+        return lambda message, *args: method(message.format(*args) if args else message)
+
+
+def as_datetime(value):
+    """ISO 8601 time, e.g. "2026-01-15T00:00:00Z", as an aware datetime."""
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).astimezone(timezone.utc)
+
+
+def as_timedelta(value):
+    """ISO 8601 duration, e.g. "P1DT6H" or "PT30M", as a timedelta."""
+    match = re.fullmatch(r"P(?:(\d+)D)?(?:T(?:(\d+)H)?(?:(\d+)M)?(?:(\d+)S)?)?", value)
+    days, hours, minutes, seconds = (int(part or 0) for part in match.groups())
+    return timedelta(days=days, hours=hours, minutes=minutes, seconds=seconds)
+
+
+def deodemakedirs(path, unixgroup=None):
+    """Create a directory tree, the group is ignored."""
+    os.makedirs(path, exist_ok=True)
+
+
+class Task:
+    """Task base class without a platform: tests set the attributes they need."""
+
+    def __init__(self, config, name):
+        self.config = config
+        self.name = name
+
+
+def install_deode_stub():
+    """Register the stand-in deode modules, if deode is not installed."""
+    try:
+        import deode  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        return
+    modules = {
+        "deode": {},
+        "deode.logs": {"logger": StubLogger(), "LogDefaults": type("LogDefaults", (), {"LEVEL": "info"})},
+        "deode.datetime_utils": {"as_datetime": as_datetime, "as_timedelta": as_timedelta},
+        "deode.os_utils": {"deodemakedirs": deodemakedirs},
+        "deode.tasks": {},
+        "deode.tasks.base": {"Task": Task},
+        "deode.tasks.batch": {"BatchJob": type("BatchJob", (), {})},
+    }
+    for name, attrs in modules.items():
+        module = types.ModuleType(name)
+        module.__dict__.update(attrs)
+        sys.modules[name] = module
+
+
+install_deode_stub()
+
+
+@pytest.fixture
+def plugin():
+    """Import a module of the plugin, from the repository the tests are in."""
+    if str(PLUGIN.parent) not in sys.path:
+        sys.path.insert(0, str(PLUGIN.parent))
+
+    def load(module):
+        return importlib.import_module(f"{PLUGIN.name}.{module}")
+
+    return load
+
+
+@pytest.fixture
+def stub(tmp_path):
+    """Write an executable stub script to tmp_path/bin, and return its path."""
+    bindir = tmp_path / "bin"
+    bindir.mkdir(exist_ok=True)
+
+    def write(name, script):
+        path = bindir / name
+        path.write_text(script)
+        path.chmod(path.stat().st_mode | stat.S_IXUSR)
+        return str(path)
+
+    return write
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run the test in an empty working directory, as the tasks do."""
+    path = tmp_path / "work"
+    path.mkdir()
+    monkeypatch.chdir(path)
+    return path
@@ -0,0 +1,125 @@
+"""Window totals of accumulated fields, in GRIB files and from point values."""
+
+import os
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+TEMPLATE = "FCTABLE_{PP}_{YYYY}{MM}_{HH}.sqlite"
+BASETIME = datetime(2026, 1, 15)
+
+
+def point_rows(pandas, values, model_name="GDT"):
+    """FC rows of Pcp, values is {SID: {lead_time: value}}."""
+    return pandas.DataFrame(
+        [
+            {"fcst_dttm": 1768435200, "lead_time": lead, "SID": sid, "parameter": "Pcp", model_name: value}
+            for sid, series in values.items()
+            for lead, value in series.items()
+        ]
+    )
+
+
+def window_totals(batch, name):
+    """{(SID, lead_time): value} of an accumulated parameter in the batch."""
+    frame = next(frame for relpath, _table, frame in batch.frames() if f"_{name}_" in relpath)
+    assert set(frame["parameter"]) == {name}
+    return {(sid, lead): value for sid, lead, value in zip(frame["SID"], frame["lead_time"], frame["GDT"])}
+
+
+def test_rate_windows_skip_missing_lead_times(plugin):
+    pandas = pytest.importorskip("pandas")
+    accumulation = plugin("tasks.accumulation")
+    batch = plugin("tasks.fctable").FctableBatch()
+    # Station 2 has no lead time 2
+    values = {1: {0: 0.0, 1: 1.0, 2: 2.0, 3: 3.0}, 2: {0: 0.0, 1: 1.0, 3: 3.0}}
+    batch.add("FCTABLE_Pcp_202601_00.sqlite", "FC", point_rows(pandas, values), "schema")
+    settings = accumulation.accumulation_settings(
+        {"extract_dt.accumulations": [{"harp_param": "Pcp", "output": "points", "windows": [1, 2]}]}
+    )
+
+    accumulation.accumulate_points(batch, settings, TEMPLATE, BASETIME, "GDT")
+
+    assert window_totals(batch, "Pcp1h") == {
+        (1, 1): 1.0, (1, 2): 2.0, (1, 3): 3.0, (2, 1): 1.0, (2, 3): 3.0,
+    }
+    assert window_totals(batch, "Pcp2h") == {(1, 2): 3.0, (1, 3): 5.0}
+
+
+def test_accumulated_windows_start_from_zero(plugin):
+    pandas = pytest.importorskip("pandas")
+    accumulation = plugin("tasks.accumulation")
+    batch = plugin("tasks.fctable").FctableBatch()
+    # Accumulated since the start, without lead time 0
+    values = {1: {1: 1.0, 2: 3.0, 3: 6.0}}
+    batch.add("FCTABLE_Pcp_202601_00.sqlite", "FC", point_rows(pandas, values), "schema")
+    settings = accumulation.accumulation_settings(
+        {"extract_dt.accumulations": [
+            {"harp_param": "Pcp", "mode": "accumulated", "output": "points", "windows": [1, 3],
+             "name": "AccPcp{window}h"},
+        ]}
+    )
+
+    accumulation.accumulate_points(batch, settings, TEMPLATE, BASETIME, "GDT")
+
+    assert window_totals(batch, "AccPcp1h") == {(1, 1): 1.0, (1, 2): 2.0, (1, 3): 3.0}
+    assert window_totals(batch, "AccPcp3h") == {(1, 3): 6.0}
+
+
+def write_step(eccodes, path, step, value):
+    """A GRIB1 file of one step with a constant litota1 field on a small grid."""
+    gid = eccodes.codes_grib_new_from_samples("GRIB1")
+    try:
+        eccodes.codes_set(gid, "Ni", 4)
+        eccodes.codes_set(gid, "Nj", 3)
+        eccodes.codes_set(gid, "shortName", "litota1")
+        eccodes.codes_set(gid, "stepRange", step)
+        eccodes.codes_set_values(gid, np.full(12, value))
+        with open(path, "wb") as fout:
+            eccodes.codes_write(gid, fout)
+    finally:
+        eccodes.codes_release(gid)
+
+
+def read_fields(eccodes, path):
+    """{(shortName, stepRange): first value} of the messages of a file."""
+    fields = {}
+    with open(path, "rb") as fin:
+        while (gid := eccodes.codes_grib_new_from_file(fin)) is not None:
+            key = (eccodes.codes_get(gid, "shortName"), eccodes.codes_get(gid, "stepRange"))
+            assert key not in fields
+            fields[key] = eccodes.codes_get_values(gid)[0]
+            eccodes.codes_release(gid)
+    return fields
+
+
+def test_running_sum_and_windows_are_appended(plugin, tmp_path):
+    eccodes = pytest.importorskip("eccodes")
+    accumulation = plugin("tasks.accumulation")
+    settings = accumulation.accumulation_settings(
+        {"extract_dt.accumulations": [{"shortName": "litota1", "total": "litoti", "windows": [1, 2]}]}
+    )
+    paths = [str(tmp_path / f"sfc_{step}.grib1") for step in range(4)]
+    for step, path in enumerate(paths):
+        # Flashes per step: 1, 2, 3, 4
+        write_step(eccodes, path, step, step + 1)
+
+    accumulator = accumulation.Accumulator(settings)
+    for step, path in enumerate(paths):
+        accumulator.update(path, step)
+
+    assert read_fields(eccodes, paths[0]) == {("litota1", "0"): 1.0, ("litoti", "0"): 1.0}
+    assert read_fields(eccodes, paths[3]) == {
+        ("litota1", "3"): 4.0,
+        ("litoti", "0-3"): 10.0,
+        ("litoti", "2-3"): 4.0,
+        ("litoti", "1-3"): 7.0,
+    }
+
+    # A retry of the same steps does not append the fields again
+    sizes = [os.path.getsize(path) for path in paths]
+    accumulator = accumulation.Accumulator(settings)
+    for step, path in enumerate(paths):
+        accumulator.update(path, step)
+    assert [os.path.getsize(path) for path in paths] == sizes
@@ -0,0 +1,109 @@
+"""ArchiveSync with stub els and ecp commands on a local "remote" directory."""
+
+import io
+import json
+import os
+import tarfile
+
+import pytest
+
+# Copies the archive into the target (the named pipe), logging every copy.
+# An archive named in FAKE_ECP_FAIL fails.
+STUB_ECP = r"""#!/bin/sh
+echo "$1" >> "$FAKE_ECP_LOG"
+case " $FAKE_ECP_FAIL " in
+    *" $(basename "$1") "*) echo "ecp: $1: no such file" >&2; exit 1 ;;
+esac
+cat "$1" > "$2"
+"""
+
+# "els -l": the listing with size and mtime that parse_listing reads
+STUB_ELS = r"""#!/bin/sh
+for path in "$1"/*; do
+    echo "-rw-r--r-- 1 user group $(wc -c < "$path" | tr -d ' ') Jan 15 $(cat "$path.mtime") $path"
+done
+"""
+
+
+def make_archive(remote, name, files, mtime="00:00"):
+    """Write a tar.gz with the given {name: text} files into the remote directory."""
+    path = remote / name
+    with tarfile.open(path, "w:gz") as tar:
+        for member, text in files.items():
+            data = text.encode()
+            info = tarfile.TarInfo(member)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    # The stub els gets the mtime from here, so it is not listed as an archive
+    (remote / f"{name}.mtime").write_text(mtime)
+
+
+@pytest.fixture
+def sync(plugin, stub, tmp_path, monkeypatch):
+    remote = tmp_path / "remote"
+    remote.mkdir()
+    local = tmp_path / "local"
+    log = tmp_path / "ecp.log"
+    monkeypatch.setenv("FAKE_ECP_LOG", str(log))
+    ArchiveSync = plugin("tasks.archivesync").ArchiveSync
+    archive_sync = ArchiveSync(
+        str(remote),
+        str(local),
+        list_command=[stub("els", STUB_ELS)],
+        copy_command=[stub("ecp", STUB_ECP)],
+        nworkers=2,
+    )
+
+    def copies():
+        if not log.exists():
+            return []
+        return sorted(os.path.basename(line) for line in log.read_text().split())
+
+    return archive_sync, remote, local, copies
+
+
+def test_archives_are_unpacked_once(sync):
+    archive_sync, remote, local, copies = sync
+    make_archive(remote, "a.tar.gz", {"FCTABLE_T2m_202601_00.sqlite": "a"})
+    make_archive(remote, "b.tar.gz", {"FCTABLE_Pcp_202601_00.sqlite": "b"})
+
+    assert archive_sync.run() == []
+    assert copies() == ["a.tar.gz", "b.tar.gz"]
+    assert (local / "FCTABLE_T2m_202601_00.sqlite").read_text() == "a"
+    assert (local / "FCTABLE_Pcp_202601_00.sqlite").read_text() == "b"
+    manifest = json.loads((local / ".archive_manifest.json").read_text())
+    assert sorted(manifest) == ["a.tar.gz", "b.tar.gz"]
+    # The tarballs are unpacked from the pipe, never stored
+    assert not list(local.glob("*.tar.gz"))
+
+    # Nothing changed: nothing is copied again
+    assert archive_sync.run() == []
+    assert copies() == ["a.tar.gz", "b.tar.gz"]
+
+
+def test_changed_archive_is_fetched_again(sync):
+    archive_sync, remote, local, copies = sync
+    make_archive(remote, "a.tar.gz", {"FCTABLE_T2m_202601_00.sqlite": "a"})
+    make_archive(remote, "b.tar.gz", {"FCTABLE_Pcp_202601_00.sqlite": "b"})
+    archive_sync.run()
+
+    make_archive(remote, "a.tar.gz", {"FCTABLE_T2m_202601_00.sqlite": "new"}, mtime="06:00")
+    assert archive_sync.run() == []
+    assert copies() == ["a.tar.gz", "a.tar.gz", "b.tar.gz"]
+    assert (local / "FCTABLE_T2m_202601_00.sqlite").read_text() == "new"
+
+
+def test_failed_copy_is_retried_next_run(sync, monkeypatch):
+    archive_sync, remote, local, copies = sync
+    make_archive(remote, "a.tar.gz", {"FCTABLE_T2m_202601_00.sqlite": "a"})
+    make_archive(remote, "b.tar.gz", {"FCTABLE_Pcp_202601_00.sqlite": "b"})
+    monkeypatch.setenv("FAKE_ECP_FAIL", "b.tar.gz")
+
+    assert archive_sync.run() == ["b.tar.gz"]
+    manifest = json.loads((local / ".archive_manifest.json").read_text())
+    assert sorted(manifest) == ["a.tar.gz"]
+
+    monkeypatch.delenv("FAKE_ECP_FAIL")
+    assert archive_sync.run() == []
+    assert copies() == ["a.tar.gz", "b.tar.gz", "b.tar.gz"]
+    assert (local / "FCTABLE_Pcp_202601_00.sqlite").read_text() == "b"
@@ -0,0 +1,62 @@
+"""Parameters derived from several base fields: wind speed and direction."""
+
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+pandas = pytest.importorskip("pandas")
+
+TEMPLATE = "FCTABLE_{PP}_{YYYY}{MM}_{HH}.sqlite"
+BASETIME = datetime(2026, 1, 15, tzinfo=timezone.utc)
+
+PARAM_LIST = [
+    {"harp_param": "U10m", "method": "bilin", "grib_id": {"shortName": "10u"}},
+    {"harp_param": "S10m", "method": "bilin", "function": "vector_norm",
+     "grib_id": [{"shortName": "10u"}, {"shortName": "10v"}]},
+    {"harp_param": "D10m", "method": "bilin", "function": "vector_angle",
+     "grib_id": [{"shortName": "10u"}, {"shortName": "10v"}]},
+]
+
+
+def test_wind_is_derived_from_its_components(plugin, tmp_path):
+    derived_module = plugin("tasks.derived")
+    points = plugin("tasks.points")
+    batch = plugin("tasks.fctable").FctableBatch()
+    schema, indices = points.fctable_schema("GDT")
+    stations = pandas.DataFrame({"SID": [1, 2], "lat": [60.0, 55.0], "lon": [10.0, 12.0]})
+
+    base_list, derived = derived_module.plan(PARAM_LIST)
+    # 10u is extracted once, for U10m and the wind; 10v only for the wind
+    assert [param["harp_param"] for param in base_list] == ["U10m", "_10v"]
+    assert derived == [("S10m", "vector_norm", ["U10m", "_10v"]), ("D10m", "vector_angle", ["U10m", "_10v"])]
+
+    # Westerly wind at station 1, northerly at station 2
+    for name, values in (("U10m", [5.0, 0.0]), ("_10v", [0.0, -3.0])):
+        for lead_time in (0, 1):
+            frame = points.point_frame("GDT", BASETIME, lead_time, stations, name, np.array(values), "m/s")
+            if name == "_10v" and lead_time == 1:
+                # A missing component: no wind at this time and station
+                frame = frame[frame["SID"] == 1]
+            batch.add(points.fctable_name(TEMPLATE, name, BASETIME), "FC", frame, schema, indices)
+
+    derived_module.derive(batch, derived, TEMPLATE, BASETIME, "GDT")
+    frames = {relpath: frame for relpath, _table, frame in batch.frames()}
+
+    assert sorted(frames) == [
+        "FCTABLE_D10m_202601_00.sqlite", "FCTABLE_S10m_202601_00.sqlite", "FCTABLE_U10m_202601_00.sqlite",
+    ]
+    speed = frames["FCTABLE_S10m_202601_00.sqlite"].sort_values(["lead_time", "SID"])
+    assert speed[["lead_time", "SID", "GDT"]].values.tolist() == [[0, 1, 5.0], [0, 2, 3.0], [1, 1, 5.0]]
+    assert set(speed["units"]) == {"m/s"}
+    assert set(speed["parameter"]) == {"S10m"}
+    direction = frames["FCTABLE_D10m_202601_00.sqlite"].sort_values(["lead_time", "SID"])
+    assert direction["GDT"].tolist() == [270.0, 0.0, 270.0]
+    assert set(direction["units"]) == {"degrees"}
+
+    # The hidden base fields never reach an FCTABLE file
+    batch.flush(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == [
+        "FCTABLE_D10m_202601_00.sqlite", "FCTABLE_S10m_202601_00.sqlite", "FCTABLE_U10m_202601_00.sqlite",
+    ]
@@ -0,0 +1,96 @@
+"""The gather engine writes the same FC tables as grib2sqlite, on a regular lat/lon grid."""
+
+import os
+import sqlite3
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+eccodes = pytest.importorskip("eccodes")
+pandas = pytest.importorskip("pandas")
+grib2sqlite = pytest.importorskip("grib2sqlite")
+
+TEMPLATE = "FCTABLE_{PP}_{YYYY}{MM}_{HH}.sqlite"
+BASETIME = datetime(2026, 1, 15, tzinfo=timezone.utc)
+PARAM_LIST = [
+    {"harp_param": "T2m", "method": "bilin", "grib_id": {"shortName": "2t"}},
+    {"harp_param": "T", "method": "bilin",
+     "grib_id": {"shortName": "t", "typeOfLevel": "isobaricInhPa", "level": [500, 850]}},
+]
+
+
+def write_file(path, step=3):
+    """2t and t on 500 and 850 hPa, on a 1 degree grid over Europe."""
+    lats, lons = np.meshgrid(np.arange(70.0, 39.0, -1.0), np.arange(-10.0, 31.0, 1.0), indexing="ij")
+    with open(path, "wb") as fout:
+        for short_name, type_of_level, level in (
+            ("2t", "heightAboveGround", 2), ("t", "isobaricInhPa", 500), ("t", "isobaricInhPa", 850),
+        ):
+            gid = eccodes.codes_grib_new_from_samples("GRIB1")
+            try:
+                for key, value in (
+                    ("Ni", 41), ("Nj", 31),
+                    ("latitudeOfFirstGridPointInDegrees", 70.0), ("latitudeOfLastGridPointInDegrees", 40.0),
+                    ("longitudeOfFirstGridPointInDegrees", -10.0), ("longitudeOfLastGridPointInDegrees", 30.0),
+                    ("iDirectionIncrementInDegrees", 1.0), ("jDirectionIncrementInDegrees", 1.0),
+                    ("dataDate", 20260115), ("stepRange", step),
+                    ("shortName", short_name), ("typeOfLevel", type_of_level), ("level", level),
+                ):
+                    eccodes.codes_set(gid, key, value)
+                # Smooth, so both interpolations agree closely
+                eccodes.codes_set_values(gid, (250.0 + level / 100.0 + lats + 0.5 * lons).ravel())
+                eccodes.codes_write(gid, fout)
+            finally:
+                eccodes.codes_release(gid)
+
+
+def read_tables(root):
+    """{harp parameter: FC rows} of the FCTABLE files below root."""
+    tables = {}
+    for dirpath, _dirs, files in os.walk(root):
+        for fname in files:
+            if fname.endswith(".sqlite"):
+                con = sqlite3.connect(os.path.join(dirpath, fname))
+                try:
+                    frame = pandas.read_sql_query("SELECT * FROM FC", con)
+                finally:
+                    con.close()
+                tables[frame["parameter"].iloc[0]] = frame
+    return tables
+
+
+def test_gather_matches_grib2sqlite(plugin, tmp_path):
+    gather_file = plugin("tasks.gather").gather_file
+    FctableBatch = plugin("tasks.fctable").FctableBatch
+    infile = str(tmp_path / "sfc_3.grib1")
+    write_file(infile)
+    stations = pandas.DataFrame(
+        {"SID": [1, 2], "lat": [60.3, 52.1], "lon": [5.2, 13.6], "elev": [10.0, 40.0]}
+    )
+
+    grib2sqlite.parse_grib_file(
+        infile=infile, param_list=PARAM_LIST, station_list=stations,
+        sqlite_template=str(tmp_path / "grib2sqlite" / TEMPLATE), model_name="GDT", weights=None,
+    )
+    expected = read_tables(tmp_path / "grib2sqlite")
+    batch = FctableBatch()
+    tables, _wall = gather_file(infile, PARAM_LIST, stations, TEMPLATE, "GDT", BASETIME)
+    for relpath, table, frame, schema, indices in tables:
+        batch.add(relpath, table, frame, schema, indices)
+    batch.flush(str(tmp_path / "gather"))
+    actual = read_tables(tmp_path / "gather")
+
+    assert sorted(actual) == sorted(expected) == ["T", "T2m"]
+    for harp_param, frame in actual.items():
+        reference = expected[harp_param]
+        # grib2sqlite may write more columns, but all of gather's have to be there
+        assert set(frame.columns) <= set(reference.columns)
+        # Only the upper air tables have a pressure column
+        assert ("p" in frame.columns) == ("p" in reference.columns) == (harp_param == "T")
+        keys = [col for col in ("SID", "p") if col in frame.columns]
+        frame = frame.sort_values(keys).reset_index(drop=True)
+        reference = reference.sort_values(keys).reset_index(drop=True)
+        for col in ("fcst_dttm", "lead_time", "SID", "units", *keys):
+            assert frame[col].tolist() == reference[col].tolist(), col
+        np.testing.assert_allclose(frame["GDT"], reference["GDT"], rtol=1e-5)
@@ -0,0 +1,90 @@
+"""ExtractDT helpers: grib2sqlite calls and worker sizing."""
+
+import json
+import sys
+import types
+
+import pytest
+
+
+@pytest.fixture
+def grib2sqlite(monkeypatch):
+    """Stub grib2sqlite module, parse_grib_file returns the weights it is given, or new ones."""
+    calls = []
+
+    def parse_grib_file(infile, param_list, station_list, sqlite_template, model_name, weights):
+        calls.append(weights)
+        return module.weights if weights is None else weights
+
+    module = types.SimpleNamespace(
+        parse_grib_file=parse_grib_file, logger=types.SimpleNamespace(setLevel=lambda level: None),
+        weights={"w": 1}, calls=calls,
+    )
+    monkeypatch.setitem(sys.modules, "grib2sqlite", module)
+    return module
+
+
+def test_extract_file_only_returns_new_weights(plugin, grib2sqlite):
+    extract_file = plugin("tasks.extractdt").extract_file
+
+    weights, _wall = extract_file("sfc_0.grib1", [], None, "x", "GDT", None, "INFO")
+    assert weights == {"w": 1}
+    # Weights that were passed in are not sent back from a worker
+    weights, _wall = extract_file("sfc_1.grib1", [], None, "x", "GDT", {"w": 1}, "INFO")
+    assert weights is None
+    assert grib2sqlite.calls == [None, {"w": 1}]
+
+
+def indexed_file(path, messages):
+    """A dummy GRIB file with a sidecar index listing the given messages."""
+    path.write_bytes(b"x" * 100)
+    (path.parent / f"{path.name}.idx").write_text(json.dumps({"size": 100, "messages": messages}))
+    return str(path)
+
+
+def grid_message(ni, nj, length):
+    return {
+        "offset": 0, "length": length, "shortName": "2t", "typeOfLevel": "heightAboveGround",
+        "level": 2, "stepType": "instant", "startStep": 0, "endStep": 0,
+        "grid": [90, 0, -90, 359, ni, nj],
+    }
+
+
+def stub_extractdt(plugin, **attrs):
+    """An ExtractDT object with only the given attributes, without running Task.__init__."""
+    ExtractDT = plugin("tasks.extractdt").ExtractDT
+    task = ExtractDT.__new__(ExtractDT)
+    task.__dict__.update(attrs)
+    return task
+
+
+def test_worker_memory(plugin):
+    worker_memory = plugin("tasks.extractdt").worker_memory
+    messages = [grid_message(100, 50, 4000), grid_message(10, 10, 9000)]
+
+    # Four doubles per point of the largest field
+    assert worker_memory(messages, "grib2sqlite") == 4 * 8 * 100 * 50
+    # Twice the largest packed message
+    assert worker_memory(messages, "gather") == 2 * 9000
+    # Without grid keys: about 2 bytes per point
+    assert worker_memory([{"length": 1000, "grid": [None] * 6}], "grib2sqlite") == 4 * 8 * 500
+    assert worker_memory([], "grib2sqlite") == 0
+
+
+def test_workers_are_sized_from_the_parts(plugin, tmp_path):
+    full = indexed_file(tmp_path / "sfc_0.grib1", [grid_message(1000, 1000, 10)])
+    tiles = [
+        indexed_file(tmp_path / f"tile_{itile}.grib1", [grid_message(100, 100 * (itile + 1), 10)])
+        for itile in range(2)
+    ]
+    task = stub_extractdt(
+        plugin, nworkers=8, memory_budget=4 * 8 * 100 * 200 * 5.5, engine="grib2sqlite"
+    )
+
+    # The largest tile needs 4 * 8 * 100 * 200 bytes
+    assert task.bounded_workers(tiles) == 5
+    assert task.bounded_workers([full]) == 1
+    task.memory_budget = 1e12
+    assert task.bounded_workers(tiles) == 8
+    task.memory_budget = None
+    assert task.bounded_workers([full]) == 8
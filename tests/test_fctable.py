@@ -0,0 +1,106 @@
+"""Writing a batch of extracted rows to FCTABLE files and Parquet."""
+
+import sqlite3
+from datetime import datetime, timezone
+
+import pytest
+
+pandas = pytest.importorskip("pandas")
+
+BASETIME = datetime(2026, 1, 15, tzinfo=timezone.utc)
+RELPATH = "2026/01/FCTABLE_T2m_202601_00.sqlite"
+
+
+@pytest.fixture
+def t2m(plugin):
+    """t2m(points, lead_time, offset): FC rows of T2m at the given points, {SID: (lat, lon)}.
+
+    Also gives the FC table schema of the model "GDT", as t2m.schema.
+    """
+    points_module = plugin("tasks.points")
+
+    def rows(points, lead_time, offset=0.0):
+        stations = pandas.DataFrame(
+            {"SID": list(points), "lat": [lat for lat, _lon in points.values()],
+             "lon": [lon for _lat, lon in points.values()]}
+        )
+        return points_module.point_frame(
+            "GDT", BASETIME, lead_time, stations, "T2m", [280.0 + offset + sid for sid in points], "K"
+        )
+
+    rows.schema = points_module.fctable_schema("GDT")
+    return rows
+
+
+def fc_rows(path):
+    con = sqlite3.connect(path)
+    try:
+        return con.execute("SELECT lead_time, SID, GDT FROM FC ORDER BY lead_time, SID").fetchall()
+    finally:
+        con.close()
+
+
+def test_flushed_rows_are_replaced_not_duplicated(plugin, tmp_path, t2m):
+    FctableBatch = plugin("tasks.fctable").FctableBatch
+    schema, indices = t2m.schema
+    points = {1: (60.0, 10.0), 2: (55.0, 12.0)}
+    batch = FctableBatch()
+    for lead_time in (0, 1):
+        batch.add(RELPATH, "FC", t2m(points, lead_time), schema, indices)
+
+    assert batch.flush(str(tmp_path)) == 4
+    assert batch.tables == {}
+    # The same rows again, e.g. a rerun, with new values for lead time 1
+    batch.add(RELPATH, "FC", t2m(points, 1, offset=10.0), schema, indices)
+    assert batch.flush(str(tmp_path)) == 2
+
+    assert fc_rows(tmp_path / RELPATH) == [
+        (0.0, 1, 281.0), (0.0, 2, 282.0), (1.0, 1, 291.0), (1.0, 2, 292.0),
+    ]
+    con = sqlite3.connect(tmp_path / RELPATH)
+    try:
+        assert con.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    finally:
+        con.close()
+
+
+def test_file_is_written_in_one_transaction(plugin, tmp_path, t2m):
+    FctableBatch = plugin("tasks.fctable").FctableBatch
+    schema, indices = t2m.schema
+    batch = FctableBatch()
+    batch.add(RELPATH, "FC", t2m({1: (60.0, 10.0)}, 0), schema, indices)
+    # A second table of the same file that cannot be created
+    batch.add(RELPATH, "OTHER", t2m({1: (60.0, 10.0)}, 0))
+
+    with pytest.raises(RuntimeError, match="No schema for new table OTHER"):
+        batch.flush(str(tmp_path))
+    con = sqlite3.connect(tmp_path / RELPATH)
+    try:
+        assert con.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall() == []
+    finally:
+        con.close()
+
+
+def test_parquet_is_partitioned_and_replaced(plugin, tmp_path, t2m):
+    pytest.importorskip("pyarrow")
+    FctableBatch = plugin("tasks.fctable").FctableBatch
+    schema, indices = t2m.schema
+    points = {1: (60.0, 10.0), 2: (55.0, 12.0)}
+    batch = FctableBatch()
+    for lead_time in (0, 1):
+        batch.add(RELPATH, "FC", t2m(points, lead_time), schema, indices)
+    target = tmp_path / "parquet"
+
+    assert batch.write_parquet(str(target), "GDT") == 4
+    batch.clear()
+    batch.add(RELPATH, "FC", t2m(points, 1, offset=10.0), schema, indices)
+    # The file of the run is rewritten with all its rows
+    assert batch.write_parquet(str(target), "GDT") == 4
+
+    files = [path.relative_to(target).as_posix() for path in target.rglob("*.parquet")]
+    assert files == ["model=GDT/param=T2m/year=2026/month=01/FC_2026011500.parquet"]
+    frame = pandas.read_parquet(target, filters=[("param", "==", "T2m")])
+    assert sorted(zip(frame["lead_time"], frame["SID"], frame["GDT"])) == [
+        (0.0, 1, 281.0), (0.0, 2, 282.0), (1.0, 1, 291.0), (1.0, 2, 292.0),
+    ]
+    assert set(frame["model"]) == {"GDT"}
@@ -0,0 +1,39 @@
+"""Eviction of basetime directories from the GRIB cache."""
+
+import os
+import time
+from datetime import timedelta
+
+
+def basetime_dir(root, name, age, steps=("0",), complete=True, extracted=True):
+    """A basetime directory with one sfc file and its ready file, last used age seconds ago."""
+    path = root / name
+    path.mkdir(parents=True)
+    (path / "sfc_0.grib1").write_bytes(b"x" * 1000)
+    ready = list(steps) + (["complete"] if complete else [])
+    (path / "sfc.ready").write_text("".join(f"{line}\n" for line in ready))
+    if extracted:
+        (path / "extracted").write_text("")
+    used = time.time() - age
+    for fname in os.listdir(path):
+        os.utime(path / fname, (used, used))
+    return str(path)
+
+
+def test_abandoned_directories_are_evicted(plugin, tmp_path):
+    GribCache = plugin("tasks.gribcache").GribCache
+    root = tmp_path / "GRIBS"
+    day = 86400
+    old = basetime_dir(root, "2026/01/01", 10 * day)
+    running = basetime_dir(root, "2026/01/14", 2 * 3600, complete=False, extracted=False)
+    abandoned = basetime_dir(root, "2026/01/02", 9 * day, complete=False, extracted=False)
+    unextracted = basetime_dir(root, "2026/01/03", 8 * day, extracted=False)
+
+    cache = GribCache(str(root), max_age=timedelta(days=5), stale_after=day)
+    assert sorted(cache.evict()) == sorted([old, abandoned, unextracted])
+    assert os.path.isdir(running)
+
+    # Without stale_after, directories in progress are always kept
+    kept = basetime_dir(root, "2026/01/04", 9 * day, complete=False, extracted=False)
+    assert GribCache(str(root), max_age=timedelta(days=5)).evict() == []
+    assert os.path.isdir(kept)
@@ -0,0 +1,113 @@
+"""Splitting a GRIB stream per step, as it arrives through a named pipe."""
+
+import os
+import threading
+
+import pytest
+
+eccodes = pytest.importorskip("eccodes")
+
+
+def message(step, short_name):
+    """A small GRIB1 message of one step."""
+    gid = eccodes.codes_grib_new_from_samples("GRIB1")
+    try:
+        eccodes.codes_set(gid, "shortName", short_name)
+        eccodes.codes_set(gid, "stepRange", step)
+        return eccodes.codes_get_message(gid)
+    finally:
+        eccodes.codes_release(gid)
+
+
+def stream_through_fifo(messages, read):
+    """Write messages into a named pipe from a thread, like a polytope client, and read it."""
+    fifo = "response.fifo"
+    os.mkfifo(fifo)
+
+    def write():
+        with open(fifo, "wb") as fout:
+            for data in messages:
+                fout.write(data)
+                fout.flush()
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    try:
+        with open(fifo, "rb") as stream:
+            return read(stream)
+    finally:
+        thread.join()
+        os.remove(fifo)
+
+
+def test_steps_land_while_the_stream_arrives(plugin, workdir):
+    split_grib_stream = plugin("tasks.gributils").split_grib_stream
+    # Step 0 has no statistical fields, so its message count is not known
+    messages = [message(0, "2t"), message(0, "msl")]
+    for step in (1, 2):
+        messages += [message(step, "2t"), message(step, "msl"), message(step, "tp")]
+    landed = []
+
+    def on_step(step):
+        # Only the steps before this one are complete
+        landed.append((step, sorted(os.listdir(workdir))))
+
+    counts = stream_through_fifo(
+        messages,
+        lambda stream: split_grib_stream(
+            stream, "sfc", lambda step: None if step == "0" else 3, on_step=on_step
+        ),
+    )
+
+    assert counts == {"0": 2, "1": 3, "2": 3}
+    assert [step for step, _files in landed] == ["0", "1", "2"]
+    # Every step landed before the next one was written, not at the end of the stream
+    assert landed[0][1] == ["response.fifo", "sfc_0.grib1"]
+    assert landed[1][1] == ["response.fifo", "sfc_0.grib1", "sfc_1.grib1"]
+    for step, count in counts.items():
+        with open(f"sfc_{step}.grib1", "rb") as fin:
+            assert eccodes.codes_count_in_file(fin) == count
+
+
+def test_unordered_stream_is_an_error(plugin, workdir):
+    split_grib_stream = plugin("tasks.gributils").split_grib_stream
+    messages = [message(0, "2t"), message(1, "2t"), message(0, "msl")]
+
+    with pytest.raises(RuntimeError, match="More messages than expected for sfc_0.grib1"):
+        stream_through_fifo(
+            messages,
+            lambda stream: split_grib_stream(stream, "sfc", lambda step: None if step == "0" else 2),
+        )
+
+
+def test_stalled_stream_is_given_up(plugin, workdir):
+    WatchedStream = plugin("tasks.gributils").WatchedStream
+    os.mkfifo("response.fifo")
+    release = threading.Event()
+    data = message(0, "2t")
+
+    def write():
+        with open("response.fifo", "wb") as fout:
+            fout.write(data)
+            fout.flush()
+            # The stream hangs after the first message
+            release.wait()
+
+    thread = threading.Thread(target=write, daemon=True)
+    thread.start()
+    with WatchedStream("response.fifo", stall_timeout=0.3, poll=0.05) as stream:
+        assert len(stream.read(10)) == 10
+        stream.read(1 << 20)
+    release.set()
+    thread.join()
+    assert stream.timed_out.startswith("stalled for")
+
+
+def test_stream_without_writer_is_given_up(plugin, workdir):
+    WatchedStream = plugin("tasks.gributils").WatchedStream
+    os.mkfifo("response.fifo")
+
+    # Nobody ever opens the pipe for writing, e.g. the request waits in a queue
+    with WatchedStream("response.fifo", queue_timeout=0.2, poll=0.05) as stream:
+        assert stream.read(10) == b""
+    assert stream.timed_out.startswith("received no data")
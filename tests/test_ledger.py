@@ -0,0 +1,107 @@
+"""Selection of the parameters to extract with the extraction ledger."""
+
+import os
+from datetime import datetime
+
+import pytest
+
+PARAM_LIST = [
+    {"harp_param": "T2m", "method": "bilin", "grib_id": {"shortName": "2t"}},
+    {"harp_param": "Pcp", "method": "bilin", "grib_id": {"shortName": "tp"}},
+    {
+        "harp_param": "S10m", "method": "bilin", "function": "vector_norm",
+        "grib_id": [{"shortName": "10u"}, {"shortName": "10v"}],
+    },
+]
+
+
+@pytest.fixture
+def selection(plugin, tmp_path):
+    """select(param_list, stations=..., accumulations=...): the base fields of every step."""
+    extractdt = plugin("tasks.extractdt")
+    ledger_module = plugin("tasks.ledger")
+    plan = plugin("tasks.derived").plan
+    infiles = []
+    for step in (0, 1):
+        infile = tmp_path / f"sfc_{step}.grib1"
+        infile.write_bytes(b"x" * 100)
+        infiles.append(str(infile))
+
+    def select(param_list, stations="s1", accumulations=(), commit=True):
+        task = extractdt.ExtractDT.__new__(extractdt.ExtractDT)
+        task.__dict__.update(
+            sqlite_template="FCTABLE_{PP}_{YYYY}{MM}_{HH}.sqlite", output_formats=["sqlite"],
+            point_accumulations=list(accumulations),
+        )
+        ledger = ledger_module.ExtractionLedger(
+            str(tmp_path / "ledger.sqlite"), "GDT", datetime(2026, 1, 15)
+        )
+        base_list, derived = plan(param_list)
+        requested = set()
+        params_for = task.ledger_selection(ledger, "sfc", base_list, derived, stations, requested)
+        selected = [sorted(param["harp_param"] for param in params_for(infile)) for infile in infiles]
+        # The units are added when they are selected, but only recorded after the writes
+        if commit:
+            ledger.commit()
+        return selected, requested
+
+    select.infiles = infiles
+    return select
+
+
+def test_first_run_and_unchanged_rerun(selection):
+    selected, requested = selection(PARAM_LIST)
+    assert selected == [["Pcp", "T2m", "_10u", "_10v"]] * 2
+    assert requested == {"T2m", "Pcp", "S10m"}
+
+    # Nothing changed: nothing is extracted again
+    selected, requested = selection(PARAM_LIST)
+    assert selected == [[], []]
+    assert requested == set()
+
+
+def test_changed_parameter_is_extracted_again(selection):
+    selection(PARAM_LIST)
+    changed = [{**PARAM_LIST[0], "method": "nearest"}, *PARAM_LIST[1:]]
+
+    selected, requested = selection(changed)
+    assert selected == [["T2m"], ["T2m"]]
+    assert requested == {"T2m"}
+
+
+def test_derived_parameter_brings_its_inputs(selection):
+    selection(PARAM_LIST[:2])
+
+    # Only the new derived parameter is extracted, with its hidden inputs
+    selected, requested = selection(PARAM_LIST)
+    assert selected == [["_10u", "_10v"]] * 2
+    assert requested == {"S10m"}
+
+
+def test_changed_station_list_or_file_extracts_everything(selection):
+    selection(PARAM_LIST)
+
+    selected, _requested = selection(PARAM_LIST, stations="s2")
+    assert selected == [["Pcp", "T2m", "_10u", "_10v"]] * 2
+
+    # A step that has been retrieved again
+    stat = os.stat(selection.infiles[1])
+    os.utime(selection.infiles[1], ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    selected, _requested = selection(PARAM_LIST, stations="s2")
+    assert selected == [[], ["Pcp", "T2m", "_10u", "_10v"]]
+
+
+def test_failed_run_is_not_recorded(selection):
+    selection(PARAM_LIST, commit=False)
+
+    selected, _requested = selection(PARAM_LIST)
+    assert selected == [["Pcp", "T2m", "_10u", "_10v"]] * 2
+
+
+def test_points_accumulation_inputs_are_always_extracted(selection):
+    accumulations = [{"harp_param": "Pcp", "windows": [1]}]
+    selection(PARAM_LIST, accumulations=accumulations)
+
+    selected, requested = selection(PARAM_LIST, accumulations=accumulations)
+    assert selected == [["Pcp"], ["Pcp"]]
+    assert requested == {"Pcp"}
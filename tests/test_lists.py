@@ -0,0 +1,46 @@
+"""Cached loading of the parameter and station lists."""
+
+import os
+
+import pytest
+
+
+@pytest.fixture
+def lists(plugin, monkeypatch):
+    module = plugin("tasks.lists")
+    monkeypatch.setattr(module, "_LOADED", {})
+    return module
+
+
+def test_replaced_list_with_the_same_size_and_mtime_is_read_again(lists, tmp_path):
+    pytest.importorskip("pandas")
+    path = tmp_path / "stations.csv"
+    cache_dir = tmp_path / "cache" / "lists"
+    path.write_text("SID,lat,lon\n1,60.0,10.0\n")
+    stations, checksum = lists.load_list(str(path), "stations", str(cache_dir))
+    assert stations["SID"].tolist() == [1]
+    assert len(os.listdir(cache_dir)) == 1
+
+    # Same size, and the mtime is restored, as after a copy that keeps the timestamps
+    stat = path.stat()
+    path.write_text("SID,lat,lon\n2,60.0,10.0\n")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    lists._LOADED.clear()
+
+    stations, new_checksum = lists.load_list(str(path), "stations", str(cache_dir))
+    assert stations["SID"].tolist() == [2]
+    assert new_checksum != checksum
+    assert len(os.listdir(cache_dir)) == 2
+
+
+def test_unchanged_list_comes_from_the_cache(lists, tmp_path, monkeypatch):
+    path = tmp_path / "params.json"
+    path.write_text('[{"harp_param": "T2m", "grib_id": {"shortName": "2t"}}]')
+    first = lists.load_list(str(path), "params", str(tmp_path / "cache"))
+    lists._LOADED.clear()
+
+    def fail(path):
+        raise AssertionError("parsed again")
+
+    monkeypatch.setitem(lists.PARSERS, "params", fail)
+    assert lists.load_list(str(path), "params", str(tmp_path / "cache")) == first
@@ -0,0 +1,128 @@
+"""MarsScheduler with a stub mars client: chunk joins, retries and stall cancellation."""
+
+import os
+
+import pytest
+
+# Writes "{param}:{step};" to the target file of every step of the request.
+# FAKE_MARS_FAIL and FAKE_MARS_STALL name chunks that fail, or hang without
+# any output, on their first try.
+STUB_MARS = r"""#!/bin/sh
+chunk=$(basename "$PWD")
+steps=$(sed -n 's/^step=//p' "$1" | tr / ' ')
+param=$(sed -n 's/^param=//p' "$1")
+target=$(sed -n 's/^target=//p' "$1" | tr -d '"')
+tries="$FAKE_MARS_STATE/$chunk.tries"
+echo x >> "$tries"
+first=$([ "$(wc -l < "$tries")" -eq 1 ] && echo yes)
+echo "mars: retrieving $param steps $steps"
+if [ -n "$first" ] && [ "$chunk" = "$FAKE_MARS_FAIL" ]; then
+    echo "mars: failed"
+    exit 1
+fi
+if [ -n "$first" ] && [ "$chunk" = "$FAKE_MARS_STALL" ]; then
+    exec sleep 60
+fi
+for step in $steps; do
+    printf '%s:%s;' "$param" "$step" > "$(echo "$target" | sed "s/\[STEP\]/$step/")"
+done
+"""
+
+
+def write_request(request, filename):
+    with open(filename, "w") as fout:
+        for key, value in request.items():
+            fout.write(f"{key}={value}\n")
+
+
+@pytest.fixture
+def mars(stub, tmp_path, monkeypatch):
+    state = tmp_path / "state"
+    state.mkdir()
+    monkeypatch.setenv("FAKE_MARS_STATE", str(state))
+    return [stub("mars", STUB_MARS)]
+
+
+def request(steps, params):
+    return {"class": "d1", "step": "/".join(steps), "param": "/".join(params), "target": "x"}
+
+
+def scheduler(plugin, mars, **kwargs):
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    return MarsScheduler(mars, write_request, poll=0.05, **kwargs)
+
+
+def test_chunks_are_joined_per_step(plugin, mars, workdir):
+    steps = ["0", "1", "2"]
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    chunks = MarsScheduler.split(
+        request(steps, ["167", "151"]), "sfc", steps, step_chunk=2, param_chunk=1
+    )
+    assert [chunk.name for chunk in chunks] == [
+        "sfc_chunk_0_0", "sfc_chunk_0_1", "sfc_chunk_1_0", "sfc_chunk_1_1",
+    ]
+    landed = []
+    failed = scheduler(plugin, mars, nworkers=3).run(chunks, "sfc", on_step=landed.append)
+
+    assert failed == []
+    assert sorted(landed) == steps
+    for step in steps:
+        # The parts are joined in chunk order, and removed
+        assert (workdir / f"sfc_{step}.grib1").read_text() == f"167:{step};151:{step};"
+    assert sorted(os.listdir(workdir)) == sorted(
+        [f"sfc_{step}.grib1" for step in steps] + [f"{chunk.name}.log" for chunk in chunks]
+    )
+
+
+def test_failed_chunk_is_retried(plugin, mars, workdir, monkeypatch):
+    monkeypatch.setenv("FAKE_MARS_FAIL", "sfc_chunk_1_0")
+    steps = ["0", "1"]
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    chunks = MarsScheduler.split(request(steps, ["167"]), "sfc", steps, step_chunk=1)
+    failed = scheduler(plugin, mars, nworkers=2, max_retries=1).run(chunks, "sfc")
+
+    assert failed == []
+    assert [chunk.attempts for chunk in chunks] == [1, 2]
+    assert (workdir / "sfc_1.grib1").read_text() == "167:1;"
+    assert "mars: failed" in (workdir / "sfc_chunk_1_0.log").read_text()
+
+
+def test_failed_chunk_without_retries(plugin, mars, workdir, monkeypatch):
+    monkeypatch.setenv("FAKE_MARS_FAIL", "sfc_chunk_1_0")
+    steps = ["0", "1"]
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    chunks = MarsScheduler.split(request(steps, ["167"]), "sfc", steps, step_chunk=1)
+    landed = []
+    failed = scheduler(plugin, mars).run(chunks, "sfc", on_step=landed.append)
+
+    assert [chunk.name for chunk in failed] == ["sfc_chunk_1_0"]
+    assert landed == ["0"]
+    assert not (workdir / "sfc_1.grib1").exists()
+
+
+def test_stalled_chunk_is_cancelled_and_resubmitted(plugin, mars, workdir, monkeypatch):
+    monkeypatch.setenv("FAKE_MARS_STALL", "sfc_chunk_0_0")
+    steps = ["0", "1"]
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    chunks = MarsScheduler.split(request(steps, ["167"]), "sfc", steps)
+    progress = []
+    failed = scheduler(
+        plugin, mars, max_retries=1, stall_timeout=0.5, on_progress=progress.append
+    ).run(chunks, "sfc")
+
+    assert failed == []
+    assert chunks[0].attempts == 2
+    assert (workdir / "sfc_1.grib1").read_text() == "167:1;"
+    assert progress[-1]["done"] == 1
+
+
+def test_queued_chunk_is_cancelled(plugin, mars, workdir, monkeypatch):
+    # The client writes its log, but no data arrives
+    monkeypatch.setenv("FAKE_MARS_STALL", "sfc_chunk_0_0")
+    steps = ["0"]
+    MarsScheduler = plugin("tasks.marsscheduler").MarsScheduler
+    chunks = MarsScheduler.split(request(steps, ["167"]), "sfc", steps)
+    failed = scheduler(plugin, mars, queue_timeout=0.5).run(chunks, "sfc")
+
+    assert failed == chunks
+    assert chunks[0].process.returncode != 0
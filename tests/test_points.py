@@ -0,0 +1,46 @@
+"""Matching polytope point coverages to the stations."""
+
+import pytest
+
+pandas = pytest.importorskip("pandas")
+
+STATIONS = pandas.DataFrame({"SID": [1, 2], "lat": [60.0, 52.0], "lon": [10.0, 5.0]})
+
+
+def coverages(points):
+    """Coverage frame with one row per coverage at the given (lat, lon)."""
+    return pandas.DataFrame(
+        [{"coverage": icov, "lat": lat, "lon": lon} for icov, (lat, lon) in enumerate(points)]
+    )
+
+
+def test_coverages_of_a_station_one_after_the_other(plugin):
+    match_coverages = plugin("tasks.points").match_coverages
+    # Two coverages (e.g. sfc and ua parameters) per station, at the nearest grid points
+    points = [(60.05, 10.0), (60.05, 10.0), (52.0, 4.95), (52.0, 4.95)]
+
+    assert match_coverages(coverages(points), STATIONS).tolist() == [0, 0, 1, 1]
+
+
+def test_coverages_of_all_stations_at_a_time(plugin):
+    match_coverages = plugin("tasks.points").match_coverages
+    points = [(60.05, 10.0), (52.0, 4.95), (60.05, 10.0), (52.0, 4.95)]
+
+    assert match_coverages(coverages(points), STATIONS).tolist() == [0, 1, 0, 1]
+
+
+def test_stations_sharing_a_grid_point_are_matched_by_order(plugin):
+    match_coverages = plugin("tasks.points").match_coverages
+    stations = pandas.DataFrame({"SID": [1, 2], "lat": [60.0, 60.02], "lon": [10.0, 10.02]})
+
+    assert match_coverages(coverages([(60.0, 10.0), (60.0, 10.0)]), stations).tolist() == [0, 1]
+
+
+def test_unordered_coverages_go_to_the_nearest_station(plugin):
+    match_coverages = plugin("tasks.points").match_coverages
+    # Neither order fits: station 2, station 1, station 1, station 2
+    points = [(52.0, 4.95), (60.05, 10.0), (60.05, 10.0), (52.0, 4.95)]
+
+    assert match_coverages(coverages(points), STATIONS).tolist() == [1, 0, 0, 1]
+    # Not every station has a coverage
+    assert match_coverages(coverages(points[:3]), STATIONS).tolist() == [1, 0, 0]
@@ -0,0 +1,99 @@
+"""RetrieveDT polytope retrieval with a stub client."""
+
+import os
+import threading
+
+import pytest
+
+eccodes = pytest.importorskip("eccodes")
+
+
+def message(step):
+    """A small GRIB1 2t message of one step."""
+    gid = eccodes.codes_grib_new_from_samples("GRIB1")
+    try:
+        eccodes.codes_set(gid, "shortName", "2t")
+        eccodes.codes_set(gid, "stepRange", step)
+        return eccodes.codes_get_message(gid)
+    finally:
+        eccodes.codes_release(gid)
+
+
+class HangingClient:
+    """Polytope client whose first response hangs after its first step.
+
+    The messages are made in advance: eccodes calls wait for the reader,
+    which is inside eccodes while it waits for data.
+    """
+
+    def __init__(self, steps):
+        self.messages = {str(step): message(step) for step in steps}
+        self.requests = []
+        self.release = threading.Event()
+
+    def retrieve(self, collection, request, output_file):
+        self.requests.append(request["step"])
+        with open(output_file, "wb") as fout:
+            for step in request["step"].split("/"):
+                fout.write(self.messages[step])
+                fout.flush()
+                if len(self.requests) == 1:
+                    self.release.wait()
+                    return
+
+
+def stub_retrievedt(plugin, **attrs):
+    """A RetrieveDT object with only the given attributes, without running Task.__init__."""
+    RetrieveDT = plugin("tasks.retrievedt").RetrieveDT
+    task = RetrieveDT.__new__(RetrieveDT)
+    task.__dict__.update(attrs)
+    return task
+
+
+def test_stalled_polytope_response_is_requested_again(plugin, workdir):
+    client = HangingClient([1, 2, 3])
+    task = stub_retrievedt(
+        plugin,
+        config={
+            "extract_dt.polytope_stall_timeout": "PT1S",
+            "extract_dt.polytope_poll": 0.05,
+            "extract_dt.polytope_retries": 1,
+        },
+        minstep=0,
+        landed=set(),
+        polytope_client=lambda: client,
+        expected_messages=lambda tag, step: 1,
+        land_step=lambda tag, step: task.landed.add(step),
+    )
+
+    try:
+        task.doreq_polytope({"step": "1/2/3", "target": "x"}, "ua")
+    finally:
+        client.release.set()
+
+    # Step 1 landed before the stall, only the other steps are requested again
+    assert client.requests == ["1/2/3", "2/3"]
+    assert task.landed == {"1", "2", "3"}
+    assert not [name for name in os.listdir(workdir) if name.endswith(".polytope")]
+
+
+def test_polytope_gives_up_after_the_retries(plugin, workdir):
+    client = HangingClient([])
+    client.retrieve = lambda collection, request, output_file: client.release.wait()
+    task = stub_retrievedt(
+        plugin,
+        config={
+            "extract_dt.polytope_queue_timeout": "PT1S",
+            "extract_dt.polytope_poll": 0.05,
+            "extract_dt.polytope_retries": 1,
+        },
+        minstep=0,
+        landed=set(),
+        polytope_client=lambda: client,
+    )
+
+    try:
+        with pytest.raises(RuntimeError, match="received no data"):
+            task.doreq_polytope({"step": "1/2"}, "ua")
+    finally:
+        client.release.set()